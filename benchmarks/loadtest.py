@@ -0,0 +1,292 @@
+"""
+現場報告DXシステム - 負荷試験
+多数の現場端末（スマホ・PC）からの同時アクセスを模擬し、1台のサーバーで捌ける台数を確認する
+
+各仮想端末は次の動作を行う:
+    1. User-Agent付きでページを取得（detect_device_typeでスマホ/PCに振り分けられる）
+    2. NiceGUIのWebSocket(socket.io)に接続し、イベントの往復時間を定期的に計測
+    3. 指定した頻度で /api/upload に写真をアップロード
+
+実行方法（リポジトリのルートで実行）:
+    # サーバーとSlackスタブを起動して30台で60秒間
+    python -m benchmarks.loadtest --start-server --clients 30 --duration 60
+
+    # 起動済みのサーバーに対して実行
+    python -m benchmarks.loadtest --url http://127.0.0.1:8080 --clients 50 --rate 6
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from pathlib import Path
+
+import aiohttp
+
+from benchmarks.run_benchmarks import RESOLUTIONS, make_photo, make_jpeg_bytes, summarize
+from benchmarks.slack_stub import SlackStub
+
+ROOT_DIR = Path(__file__).parent.parent
+
+# detect_device_typeでmobileと判定されるUser-Agent
+MOBILE_USER_AGENTS = [
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_4 like Mac OS X) AppleWebKit/605.1.15 "
+    "(KHTML, like Gecko) Version/17.4 Mobile/15E148 Safari/604.1",
+    "Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0.0.0 Mobile Safari/537.36",
+]
+
+# detect_device_typeでdesktopと判定されるUser-Agent
+DESKTOP_USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_4) AppleWebKit/605.1.15 "
+    "(KHTML, like Gecko) Version/17.4 Safari/605.1.15",
+]
+
+class LoadStats:
+    """負荷試験の計測値の集計"""
+
+    def __init__(self):
+        self.page_latencies = []
+        self.upload_latencies = []
+        self.ws_latencies = []
+        self.uploads = 0
+        self.uploaded_bytes = 0
+        self.errors = {"page": 0, "upload": 0, "websocket": 0}
+        self.requests = {"page": 0, "upload": 0, "websocket": 0}
+
+    def error(self, kind):
+        self.errors[kind] += 1
+
+    def report(self, elapsed):
+        """計測結果を辞書で取得"""
+        result = {"elapsed_sec": round(elapsed, 2)}
+        for name, samples in (
+            ("page", self.page_latencies),
+            ("upload", self.upload_latencies),
+            ("websocket_event", self.ws_latencies)
+        ):
+            if samples:
+                summary = summarize(samples)
+                # 端末は並行して動作するため、逐次実行を前提とした件/秒は表示しない
+                summary.pop("items_per_sec")
+                result[name] = summary
+
+        result["uploads"] = self.uploads
+        result["uploads_per_sec"] = round(self.uploads / elapsed, 2) if elapsed else 0.0
+        result["upload_mb_per_sec"] = round(self.uploaded_bytes / elapsed / 1024 / 1024, 2) if elapsed else 0.0
+        result["error_rate"] = {
+            kind: round(self.errors[kind] / self.requests[kind], 4) if self.requests[kind] else 0.0
+            for kind in self.errors
+        }
+        return result
+
+def _record_ack(message, pending, stats):
+    """socket.ioのACKパケットから往復時間を記録"""
+    if not message.startswith("43"):
+        return
+    received_id = int(message[2:].split("[", 1)[0])
+    sent_at = pending.pop(received_id, None)
+    if sent_at is not None:
+        stats.ws_latencies.append(time.perf_counter() - sent_at)
+
+async def websocket_probe(session, base_url, stats, stop_at, interval):
+    """NiceGUIのsocket.ioに接続し、イベントの往復時間を計測
+
+    'event'イベントを確認応答(ACK)付きで送信し、サーバーのイベントループで
+    処理されてACKが返るまでの時間を計測する（存在しないクライアント宛てなので副作用はない）。
+    """
+    ws_url = base_url.replace("http", "ws", 1) + "/_nicegui_ws/socket.io/?EIO=4&transport=websocket"
+
+    # ブラウザと同様に、切断された場合は終了時刻まで再接続する
+    while time.monotonic() < stop_at:
+        stats.requests["websocket"] += 1
+        try:
+            await _probe_connection(session, ws_url, stats, stop_at, interval)
+        except Exception:
+            stats.error("websocket")
+            await asyncio.sleep(min(1.0, max(stop_at - time.monotonic(), 0)))
+
+async def _probe_connection(session, ws_url, stats, stop_at, interval):
+    """1回の接続でイベントの往復時間を計測（切断時は例外）"""
+    async with session.ws_connect(ws_url, timeout=10) as ws:
+        # engine.ioのopenパケット → socket.ioの名前空間に接続
+        await ws.receive_str(timeout=10)
+        await ws.send_str("40")
+
+        ack_id = 0
+        pending = {}
+        next_send = time.monotonic()
+
+        while time.monotonic() < stop_at:
+            now = time.monotonic()
+            if now >= next_send:
+                ack_id += 1
+                pending[ack_id] = time.perf_counter()
+                stats.requests["websocket"] += 1
+                await ws.send_str(f'42{ack_id}["event",{{"client_id":"loadtest"}}]')
+                next_send = now + interval
+
+            try:
+                message = await ws.receive_str(timeout=max(next_send - time.monotonic(), 0.01))
+            except asyncio.TimeoutError:
+                continue
+
+            if message == "2":
+                # engine.ioのping → pongを返す
+                await ws.send_str("3")
+            else:
+                _record_ack(message, pending, stats)
+
+        # 終了直前に送ったイベントの応答を待ち、応答のなかったものはエラーとして数える
+        drain_until = time.monotonic() + 2.0
+        while pending and time.monotonic() < drain_until:
+            try:
+                message = await ws.receive_str(timeout=max(drain_until - time.monotonic(), 0.01))
+            except asyncio.TimeoutError:
+                break
+            _record_ack(message, pending, stats)
+        stats.errors["websocket"] += len(pending)
+
+async def simulate_device(index, args, payloads, stats, stop_at):
+    """1台の現場端末を模擬"""
+    rng = random.Random(index)
+    is_mobile = rng.random() < args.mobile_ratio
+    user_agent = rng.choice(MOBILE_USER_AGENTS if is_mobile else DESKTOP_USER_AGENTS)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+
+    async with aiohttp.ClientSession(headers={"User-Agent": user_agent}, timeout=timeout) as session:
+        # ページの取得
+        stats.requests["page"] += 1
+        start = time.perf_counter()
+        try:
+            async with session.get(args.url + "/") as response:
+                await response.read()
+                if response.status == 200:
+                    stats.page_latencies.append(time.perf_counter() - start)
+                else:
+                    stats.error("page")
+        except Exception:
+            stats.error("page")
+
+        ws_task = asyncio.create_task(
+            websocket_probe(session, args.url, stats, stop_at, args.ws_interval)
+        )
+
+        # 写真のアップロード（平均args.rate枚/分のポアソン到着）
+        await asyncio.sleep(rng.uniform(0, 60 / args.rate))
+        while time.monotonic() < stop_at:
+            content = rng.choice(payloads)
+            form = aiohttp.FormData()
+            form.add_field("file", content, filename=f"device{index}_{stats.uploads}.jpg", content_type="image/jpeg")
+            form.add_field("user_name", f"負荷試験{index}")
+            form.add_field("location", "A棟1F")
+            form.add_field("tags", "施工中")
+            form.add_field("comment", "mobile" if is_mobile else "desktop")
+
+            stats.requests["upload"] += 1
+            start = time.perf_counter()
+            try:
+                async with session.post(args.url + "/api/upload", data=form) as response:
+                    await response.read()
+                    if response.status == 200:
+                        stats.upload_latencies.append(time.perf_counter() - start)
+                        stats.uploads += 1
+                        stats.uploaded_bytes += len(content)
+                    else:
+                        stats.error("upload")
+            except Exception:
+                stats.error("upload")
+
+            remaining = stop_at - time.monotonic()
+            await asyncio.sleep(min(rng.expovariate(args.rate / 60), max(remaining, 0)))
+
+        await ws_task
+
+async def wait_for_server(url, timeout=60):
+    """サーバーが応答するまで待機"""
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url + "/") as response:
+                    if response.status < 500:
+                        return True
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    return False
+
+async def run(args):
+    stub = None
+    server = None
+    env = dict(os.environ)
+
+    try:
+        # 実際のSlackに送信しないよう、常にローカルのスタブを使う
+        stub = SlackStub(latency=args.slack_latency)
+        slack_base = await stub.start()
+        env.update(SLACK_API_BASE=slack_base, SLACK_TOKEN="xoxb-loadtest", SLACK_CHANNEL="C0LOADTEST")
+        print(f"Slackスタブ起動: {slack_base}")
+
+        if args.start_server:
+            server = subprocess.Popen([sys.executable, "main.py"], cwd=ROOT_DIR, env=env)
+            if not await wait_for_server(args.url):
+                print("サーバーが起動しませんでした")
+                return 1
+        else:
+            print(f"起動済みのサーバーを使用します（Slack送信を伴う場合は SLACK_API_BASE={slack_base} で起動してください）")
+
+        # アップロードする写真（端末ごとに内容を変えて重複排除を避ける）
+        photo = make_photo(*RESOLUTIONS[args.image_size])
+        payloads = [make_jpeg_bytes(photo, i) for i in range(max(args.clients, 8))]
+
+        print(f"負荷試験開始: {args.clients}台 × {args.duration}秒（{args.rate}枚/分/台）")
+        stats = LoadStats()
+        started = time.monotonic()
+        stop_at = started + args.duration
+
+        await asyncio.gather(*(
+            simulate_device(i, args, payloads, stats, stop_at) for i in range(args.clients)
+        ))
+
+        report = stats.report(time.monotonic() - started)
+        report["clients"] = args.clients
+        report["slack_api_calls"] = len(stub.calls)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+        if args.output:
+            args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+        return 0
+
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+        if stub is not None:
+            await stub.stop()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="現場報告DXシステム 負荷試験")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="サーバーのURL")
+    parser.add_argument("--clients", type=int, default=20, help="同時接続する端末数")
+    parser.add_argument("--duration", type=float, default=30, help="試験時間（秒）")
+    parser.add_argument("--rate", type=float, default=4, help="端末あたりのアップロード枚数/分")
+    parser.add_argument("--mobile-ratio", type=float, default=0.8, help="スマホ端末の割合（0-1）")
+    parser.add_argument("--image-size", choices=sorted(RESOLUTIONS), default="fhd", help="アップロードする写真の解像度")
+    parser.add_argument("--ws-interval", type=float, default=2.0, help="WebSocketイベントの計測間隔（秒）")
+    parser.add_argument("--timeout", type=float, default=60, help="HTTPリクエストのタイムアウト（秒）")
+    parser.add_argument("--slack-latency", type=float, default=0.05, help="Slackスタブの応答遅延（秒）")
+    parser.add_argument("--start-server", action="store_true", help="main.pyをSlackスタブ宛ての設定で起動する")
+    parser.add_argument("--output", type=Path, help="結果をJSONで保存するパス")
+    args = parser.parse_args(argv)
+
+    return asyncio.run(run(args))
+
+if __name__ == "__main__":
+    sys.exit(main())
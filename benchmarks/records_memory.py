@@ -0,0 +1,107 @@
+"""
+現場報告DXシステム - 画像レコードのメモリ使用量の計測
+アップロード済み画像リストを従来の辞書形式とImageRecordで保持した場合のメモリ使用量を比較する
+
+実行方法（リポジトリのルートで実行）:
+    python -m benchmarks.records_memory                 # 10万件
+    python -m benchmarks.records_memory --count 20000
+"""
+import gc
+import sys
+import json
+import random
+import hashlib
+import argparse
+import tracemalloc
+
+from config import TAGS, DEFAULT_LOCATION_PRESETS, DEFAULT_METADATA
+from logics.records import ImageRecord
+
+USER_NAMES = [f"作業者{i:02d}" for i in range(20)]
+
+def _fresh(text):
+    """リクエストごとに別のオブジェクトとして届く文字列を再現（フォームやJSONから作られる文字列）"""
+    return text.encode("utf-8").decode("utf-8")
+
+def make_inputs(index, rng):
+    """1件分のアップロード内容（名前・場所・タグ・コメントなど）を作成"""
+    original_hash = hashlib.sha256(str(index).encode()).hexdigest()
+    return {
+        "user_name": _fresh(rng.choice(USER_NAMES)),
+        "location": _fresh(rng.choice(DEFAULT_LOCATION_PRESETS)),
+        "tags": [_fresh(tag) for tag in rng.sample(TAGS, rng.randint(0, 3))],
+        "comment": _fresh(f"コメント{index}") if rng.random() < 0.3 else "",
+        "timestamp": f"2025-05-20 {index // 3600 % 24:02d}:{index // 60 % 60:02d}:{index % 60:02d}",
+        "original_hash": original_hash,
+        "original_path": f"/srv/app/data/uploaded/originals/{original_hash}.jpg",
+        "preview_url": f"/images/{index:08d}-0000-0000-0000-000000000000/preview?v={original_hash[:32]}_0123456789ab",
+        "filename": f"IMG_{index:05d}.jpg"
+    }
+
+def build_dict_record(inputs):
+    """従来の形式（create_metadataでDEFAULT_METADATAをコピーした辞書を含む辞書）"""
+    metadata = DEFAULT_METADATA.copy()
+    metadata["user_name"] = inputs["user_name"]
+    metadata["location"] = inputs["location"]
+    metadata["tags"] = inputs["tags"]
+    metadata["comment"] = inputs["comment"]
+    metadata["timestamp"] = inputs["timestamp"]
+    return {
+        "original_path": inputs["original_path"],
+        "original_hash": inputs["original_hash"],
+        "metadata": metadata,
+        "preview_url": inputs["preview_url"],
+        "filename": inputs["filename"]
+    }
+
+def build_slotted_record(inputs):
+    """ImageRecord（__slots__・名前と場所をintern・タグは組み合わせごとに共有のタプル）"""
+    return ImageRecord(
+        inputs["original_path"],
+        inputs["original_hash"],
+        {key: inputs[key] for key in ("user_name", "location", "tags", "comment", "timestamp")},
+        inputs["filename"],
+        inputs["preview_url"]
+    )
+
+def measure(build, count, seed=0):
+    """count件のレコードを保持した状態のメモリ使用量を計測
+
+    入力の文字列も保持したまま計測するため、ハッシュ・パスなど両形式で共通の文字列を含む。
+
+    Returns:
+        tuple: (保持しているバイト数, レコードの辞書)
+    """
+    rng = random.Random(seed)
+    gc.collect()
+    tracemalloc.start()
+    records = {}
+    for index in range(count):
+        records[f"{index:08d}"] = build(make_inputs(index, rng))
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, records
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="画像レコードのメモリ使用量の計測")
+    parser.add_argument("--count", type=int, default=100_000, help="レコード数")
+    args = parser.parse_args(argv)
+
+    dict_bytes, dict_records = measure(build_dict_record, args.count)
+    slotted_bytes, slotted_records = measure(build_slotted_record, args.count)
+
+    # 従来のJSON形式と相互変換できることを確認
+    for key in list(dict_records)[:1000]:
+        restored = ImageRecord.from_dict(json.loads(json.dumps(slotted_records[key].to_dict())))
+        assert restored.to_dict()["metadata"]["tags"] == dict_records[key]["metadata"]["tags"]
+        assert restored.metadata == dict_records[key]["metadata"]
+
+    print(f"レコード数: {args.count:,}件 (Python {sys.version.split()[0]})")
+    print(f"  辞書形式     {dict_bytes / 1024 / 1024:8.1f} MB  ({dict_bytes / args.count:6.0f} バイト/件)")
+    print(f"  ImageRecord  {slotted_bytes / 1024 / 1024:8.1f} MB  ({slotted_bytes / args.count:6.0f} バイト/件)")
+    print(f"  削減率       {(1 - slotted_bytes / dict_bytes) * 100:8.1f} %")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,562 @@
+"""
+現場報告DXシステム - ベンチマーク
+バナー合成・アップロード処理（JPEG・HEIC）・ZIP作成・古いファイル削除・画像の一括削除・Slack一括送信の性能を計測
+
+実行方法（リポジトリのルートで実行）:
+    python -m benchmarks.run_benchmarks                  # 計測してベースラインと比較
+    python -m benchmarks.run_benchmarks --save-baseline  # 計測結果をベースラインとして保存
+    python -m benchmarks.run_benchmarks --only overlay zip
+
+ベースラインより中央値(p50)が許容範囲を超えて遅くなった項目があれば終了コード1を返す。
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import ctypes
+import asyncio
+import argparse
+import platform
+import tempfile
+import datetime
+import statistics
+import tracemalloc
+from pathlib import Path
+from contextlib import ExitStack
+from unittest.mock import patch
+
+from PIL import Image, ImageFilter
+from loguru import logger
+
+from config import get_settings
+from logics.metadata import create_metadata
+from logics.overlay import add_text_to_image, get_banner_template
+from logics.image_formats import enable_heif
+from logics.ingest import ingest_upload
+from logics.quality import analyze_quality
+from logics.renderer import render_annotated, render_web_variant, delete_rendered, compute_content_hash
+from logics.file_manager import create_zip_archive, cleanup_old_files
+from logics.records import ImageRecord
+from logics.shared_store import SqliteStore
+from logics import storage
+from logics.workers import run_io
+from logics import notifier
+from benchmarks.slack_stub import SlackStub
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+# 合成写真の解像度（名前: (幅, 高さ)）
+RESOLUTIONS = {
+    "vga": (640, 480),
+    "fhd": (1920, 1080),
+    "12mp": (4032, 3024)
+}
+
+# ------------------------------------------------------------
+# 計測用ユーティリティ
+# ------------------------------------------------------------
+
+def make_photo(width, height, seed=0):
+    """写真に近い圧縮特性を持つ合成画像を作成（グラデーション + ノイズ）"""
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    channels = [
+        Image.blend(gradient, Image.effect_noise((width, height), 40 + rng.randint(0, 20)), 0.5)
+        for _ in range(3)
+    ]
+    return Image.merge("RGB", channels)
+
+def make_jpeg_bytes(img, marker=0):
+    """画像をJPEGバイト列に変換（markerをコメントに入れてハッシュを別にする）"""
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=90, comment=f"bench-{marker}".encode("ascii"))
+    return buffer.getvalue()
+
+def make_heif_bytes(img):
+    """画像をHEICバイト列に変換（iPhoneの写真の代わり。エンコードに時間がかかるため最速の設定で変換）"""
+    buffer = io.BytesIO()
+    img.save(buffer, "HEIF", quality=60, enc_params={"preset": "ultrafast"})
+    return buffer.getvalue()
+
+def summarize(samples, items_per_op=1, bytes_per_op=0):
+    """計測値（秒）から統計値を計算"""
+    samples_ms = sorted(s * 1000 for s in samples)
+    if len(samples_ms) >= 2:
+        percentiles = statistics.quantiles(samples_ms, n=100, method="inclusive")
+        p50, p95, p99 = percentiles[49], percentiles[94], percentiles[98]
+    else:
+        p50 = p95 = p99 = samples_ms[0]
+
+    mean_s = statistics.mean(samples)
+    result = {
+        "iterations": len(samples),
+        "p50_ms": round(p50, 3),
+        "p95_ms": round(p95, 3),
+        "p99_ms": round(p99, 3),
+        "mean_ms": round(mean_s * 1000, 3),
+        "items_per_sec": round(items_per_op / mean_s, 2) if mean_s > 0 else 0.0
+    }
+    if bytes_per_op:
+        result["mb_per_sec"] = round(bytes_per_op / mean_s / 1024 / 1024, 2)
+    return result
+
+def _read_peak_rss():
+    """プロセスの最大常駐メモリ(VmHWM)をバイトで取得（Linux以外はNone）"""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def _reset_peak_rss():
+    """最大常駐メモリの記録をリセット（Linuxのみ。成功時はTrue）"""
+    # 解放済みのヒープをOSに返し、再利用分がピークに現れない状態にする
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+class PeakMemory:
+    """処理中のピークメモリを計測するコンテキストマネージャ
+
+    Pillowの画素データはPythonのメモリ管理外で確保されるため、
+    Linuxでは常駐メモリの最大値(VmHWM)の増分を使い、それ以外はtracemallocで計測する。
+    """
+
+    def __enter__(self):
+        self.use_rss = _reset_peak_rss() and _read_peak_rss() is not None
+        if self.use_rss:
+            self.start = _read_peak_rss()
+        else:
+            tracemalloc.start()
+        self.peak = 0
+        return self
+
+    def __exit__(self, *exc):
+        if self.use_rss:
+            self.peak = max(_read_peak_rss() - self.start, 0)
+        else:
+            _, self.peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return False
+
+def measure(func, iterations, setup=None, warmup=1):
+    """同期関数の実行時間を計測
+
+    Args:
+        func (callable): 計測する関数（setupの戻り値を引数に取る）
+        iterations (int): 計測回数
+        setup (callable, optional): 毎回の計測前に実行する準備処理（計測対象外）
+        warmup (int): 計測前の空実行回数
+
+    Returns:
+        tuple: (計測値のリスト（秒）, ピークメモリ（バイト）)
+    """
+    def run_once():
+        args = setup() if setup else ()
+        start = time.perf_counter()
+        func(*args)
+        return time.perf_counter() - start
+
+    for _ in range(warmup):
+        run_once()
+
+    samples = [run_once() for _ in range(iterations)]
+
+    # ピークメモリは計測の揺らぎを避けるため別に1回実行して取得
+    args = setup() if setup else ()
+    with PeakMemory() as memory:
+        func(*args)
+
+    return samples, memory.peak
+
+def measure_async(coro_func, iterations, setup=None, warmup=1):
+    """非同期関数の実行時間を計測（measureの非同期版）"""
+    async def run_all():
+        async def run_once():
+            args = setup() if setup else ()
+            start = time.perf_counter()
+            await coro_func(*args)
+            return time.perf_counter() - start
+
+        for _ in range(warmup):
+            await run_once()
+
+        samples = [await run_once() for _ in range(iterations)]
+
+        args = setup() if setup else ()
+        with PeakMemory() as memory:
+            await coro_func(*args)
+
+        return samples, memory.peak
+
+    return asyncio.run(run_all())
+
+def redirect_storage(stack, workdir):
+    """保存先フォルダを一時ディレクトリに差し替え"""
+    upload = Path(workdir) / "uploaded"
+    targets = {
+        "logics.renderer.ORIGINAL_FOLDER": upload / "originals",
+        "logics.renderer.RENDER_CACHE_FOLDER": upload / "rendered",
+        "logics.renderer.PREVIEW_FOLDER": upload / "web",
+        "logics.file_manager.UPLOAD_FOLDER": upload,
+        "logics.file_manager.ORIGINAL_FOLDER": upload / "originals",
+    }
+    for target, value in targets.items():
+        stack.enter_context(patch(target, value))
+    upload.mkdir(parents=True, exist_ok=True)
+    return upload
+
+def sample_metadata():
+    return create_metadata(
+        user_name="ベンチ太郎",
+        location="A棟1F",
+        tags=["施工中", "確認依頼"],
+        comment="ベンチマーク用の写真"
+    )
+
+# ------------------------------------------------------------
+# ベンチマーク本体
+# ------------------------------------------------------------
+
+def bench_overlay(quick):
+    """add_text_to_imageの計測（バナーのキャッシュあり/なし）
+
+    レンダラーと同じく画像に直接合成する（inplace=True、画像は計測ごとにsetupで複製し、複製は計測しない）。
+    """
+    results = {}
+    metadata = sample_metadata()
+    iterations = 5 if quick else 30
+
+    for name, (width, height) in RESOLUTIONS.items():
+        photo = make_photo(width, height)
+
+        samples, peak = measure(
+            add_text_to_image, iterations,
+            setup=lambda: (photo.copy(), metadata, True)
+        )
+        results[f"overlay_{name}"] = dict(summarize(samples), peak_memory_mb=round(peak / 1024 / 1024, 2))
+
+        def cold_setup():
+            get_banner_template.cache_clear()
+            return photo.copy(), metadata, True
+
+        samples, peak = measure(add_text_to_image, iterations, setup=cold_setup)
+        results[f"overlay_cold_{name}"] = dict(summarize(samples), peak_memory_mb=round(peak / 1024 / 1024, 2))
+
+    return results
+
+def bench_upload(quick):
+    """アップロード1枚あたりの処理（取り込み + 合成済み画像とプレビューの作成）の計測"""
+    results = {}
+    metadata = sample_metadata()
+    iterations = 3 if quick else 10
+
+    for name, (width, height) in RESOLUTIONS.items():
+        photo = make_photo(width, height)
+        # 重複排除・キャッシュが効かないよう毎回内容の異なる画像を用意
+        payloads = iter([make_jpeg_bytes(photo, i) for i in range(iterations + 2)])
+
+        def process(content):
+            record = ingest_upload(content, "bench.jpg", metadata)
+            render_annotated(record.original_path, record.original_hash, record.metadata)
+            render_web_variant(record.original_path, record.original_hash, record.metadata, "preview", "webp")
+
+        with tempfile.TemporaryDirectory() as workdir, ExitStack() as stack:
+            redirect_storage(stack, workdir)
+            samples, peak = measure(process, iterations, setup=lambda: (next(payloads),))
+
+        results[f"upload_{name}"] = dict(summarize(samples), peak_memory_mb=round(peak / 1024 / 1024, 2))
+
+    return results
+
+def bench_quality(quick):
+    """ピンぼけ・露出の判定（取り込み時にJPEGを縮小デコードして計算）の計測"""
+    results = {}
+    iterations = 5 if quick else 30
+
+    for name, (width, height) in RESOLUTIONS.items():
+        content = make_jpeg_bytes(make_photo(width, height))
+        samples, peak = measure(
+            lambda: analyze_quality(Image.open(io.BytesIO(content))), iterations
+        )
+        results[f"quality_{name}"] = dict(summarize(samples), peak_memory_mb=round(peak / 1024 / 1024, 2))
+
+    return results
+
+def bench_heif(quick):
+    """HEIC（iPhoneの写真）のアップロード処理（JPEGへの変換 + 合成済み画像とプレビューの作成）をJPEGと比較して計測"""
+    if not enable_heif():
+        print("pillow-heifがインストールされていないためHEICの計測をスキップします", file=sys.stderr)
+        return {}
+
+    results = {}
+    metadata = sample_metadata()
+    iterations = 3 if quick else 10
+
+    def process(content, filename, comment):
+        record = ingest_upload(content, filename, dict(metadata, comment=comment))
+        render_annotated(record.original_path, record.original_hash, record.metadata)
+        render_web_variant(record.original_path, record.original_hash, record.metadata, "preview", "webp")
+
+    for name, (width, height) in RESOLUTIONS.items():
+        # スマートフォンの写真に近い圧縮率になるようノイズを少しぼかす
+        photo = make_photo(width, height).filter(ImageFilter.GaussianBlur(1))
+        payloads = {"heic": (make_heif_bytes(photo), "bench.heic"), "jpeg": (make_jpeg_bytes(photo), "bench.jpg")}
+
+        for fmt, (content, filename) in payloads.items():
+            # HEICのエンコードは時間がかかるため同じ画像を使い、コメントを毎回変えて合成済み画像のキャッシュを無効にする
+            comments = iter([f"ベンチマーク {i}" for i in range(iterations + 2)])
+            with tempfile.TemporaryDirectory() as workdir, ExitStack() as stack:
+                redirect_storage(stack, workdir)
+                samples, peak = measure(process, iterations, setup=lambda: (content, filename, next(comments)))
+
+            results[f"heif_{fmt}_{name}"] = dict(
+                summarize(samples, bytes_per_op=len(content)), peak_memory_mb=round(peak / 1024 / 1024, 2)
+            )
+
+    return results
+
+def bench_zip(quick):
+    """create_zip_archiveの計測（30枚のレポート）"""
+    file_count = 30
+    iterations = 3 if quick else 10
+
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        photo = make_photo(*RESOLUTIONS["fhd"])
+        paths = []
+        for i in range(file_count):
+            path = workdir / f"photo_{i}.jpg"
+            path.write_bytes(make_jpeg_bytes(photo, i))
+            paths.append(str(path))
+
+        total_bytes = sum(os.path.getsize(p) for p in paths)
+        zip_path = workdir / "report.zip"
+
+        samples, peak = measure(create_zip_archive, iterations, setup=lambda: (paths, zip_path))
+        zip_bytes = zip_path.stat().st_size
+
+    result = summarize(samples, items_per_op=file_count, bytes_per_op=total_bytes)
+    result.update(peak_memory_mb=round(peak / 1024 / 1024, 2), zip_bytes=zip_bytes)
+    return {"zip_30_photos": result}
+
+def bench_cleanup(quick):
+    """cleanup_old_filesの計測（大量のファイルがあるフォルダ）"""
+    file_count = 1000 if quick else 5000
+    iterations = 2 if quick else 5
+    old_time = time.time() - 60 * 60 * 24 * 60
+
+    with tempfile.TemporaryDirectory() as workdir, ExitStack() as stack:
+        upload = redirect_storage(stack, workdir)
+
+        def setup():
+            # 半分を60日前のファイルにする（毎回削除されるため作り直す）
+            for i in range(file_count):
+                path = upload / f"file_{i}.jpg"
+                if not path.exists():
+                    path.write_bytes(b"x")
+                if i % 2 == 0:
+                    os.utime(path, (old_time, old_time))
+            return (30,)
+
+        samples, peak = measure(cleanup_old_files, iterations, setup=setup)
+
+    result = summarize(samples, items_per_op=file_count)
+    result.update(peak_memory_mb=round(peak / 1024 / 1024, 2), files=file_count)
+    return {f"cleanup_{file_count}_files": result}
+
+def bench_delete(quick):
+    """画像の一括削除の計測（共有ストアの画像リスト + 元画像・作成済み画像のファイル）
+
+    1枚ずつ削除する場合（画像リストの更新・ファイルの削除を画像ごとに行う）と比較する。
+    """
+    image_count = 100 if quick else 300
+    iterations = 2 if quick else 5
+    results = {}
+
+    with tempfile.TemporaryDirectory() as workdir, ExitStack() as stack:
+        upload = redirect_storage(stack, workdir)
+        store = SqliteStore(Path(workdir) / "shared.db", "bench")
+
+        def setup():
+            # 削除されるため毎回作り直す
+            store.images.clear()
+            for folder in ("originals", "rendered", "web"):
+                (upload / folder).mkdir(exist_ok=True)
+            for i in range(image_count):
+                original_hash = compute_content_hash(str(i).encode())
+                original_path = upload / "originals" / f"{original_hash}.jpg"
+                original_path.write_bytes(b"x")
+                (upload / "rendered" / f"{original_hash[:32]}_v.jpg").write_bytes(b"x")
+                (upload / "web" / f"{original_hash[:32]}_v_preview.webp").write_bytes(b"x")
+                store.images[f"uuid-{i}"] = ImageRecord(original_path, original_hash, sample_metadata(), "bench.jpg")
+            return (list(store.images.keys()),)
+
+        async def delete_bulk(img_uuids):
+            removed = store.delete_images(img_uuids)
+            await storage.delete_originals({record.original_hash: record.original_path for _, record in removed})
+
+        async def delete_one_by_one(img_uuids):
+            for img_uuid in img_uuids:
+                record = store.images.pop(img_uuid)
+                await storage.delete_image(record.original_path)
+                await run_io(delete_rendered, record.original_hash)
+
+        for name, func in (("bulk", delete_bulk), ("one_by_one", delete_one_by_one)):
+            samples, peak = measure_async(func, iterations, setup=setup)
+            result = summarize(samples, items_per_op=image_count)
+            result.update(peak_memory_mb=round(peak / 1024 / 1024, 2))
+            results[f"delete_{image_count}_photos_{name}"] = result
+
+    return results
+
+def bench_slack(quick):
+    """send_bulk_to_slackの計測（ローカルのスタブサーバーに送信）"""
+    image_count = 5 if quick else 10
+    iterations = 2 if quick else 5
+
+    with tempfile.TemporaryDirectory() as workdir:
+        workdir = Path(workdir)
+        photo = make_photo(*RESOLUTIONS["fhd"])
+        paths = []
+        for i in range(image_count):
+            path = workdir / f"photo_{i}.jpg"
+            path.write_bytes(make_jpeg_bytes(photo, i))
+            paths.append(str(path))
+        metadata_list = [sample_metadata() for _ in paths]
+
+        stub = SlackStub()
+
+        async def send(image_paths, metadata):
+            if not stub.base_url:
+                await stub.start()
+            settings = get_settings().replace(
+                slack_enabled=True, slack_token="xoxb-bench", slack_channel="C0BENCH",
+                slack_api_base=stub.base_url, slack_send_interval=0
+            )
+            with patch.object(notifier, "get_settings", return_value=settings):
+                success, failure = await notifier.send_bulk_to_slack(image_paths, metadata)
+            if failure:
+                raise RuntimeError(f"Slack送信失敗: {failure}件")
+
+        try:
+            samples, peak = measure_async(send, iterations, setup=lambda: (paths, metadata_list))
+        finally:
+            asyncio.run(stub.stop()) if stub.runner else None
+
+    result = summarize(samples, items_per_op=image_count)
+    result.update(peak_memory_mb=round(peak / 1024 / 1024, 2), api_calls=len(stub.calls))
+    return {f"slack_bulk_{image_count}_images": result}
+
+BENCHMARKS = {
+    "overlay": bench_overlay,
+    "upload": bench_upload,
+    "quality": bench_quality,
+    "heif": bench_heif,
+    "zip": bench_zip,
+    "cleanup": bench_cleanup,
+    "delete": bench_delete,
+    "slack": bench_slack
+}
+
+# ------------------------------------------------------------
+# 結果の表示・ベースライン比較
+# ------------------------------------------------------------
+
+def print_results(results):
+    """計測結果を表形式で表示"""
+    header = f"{'ベンチマーク':<28}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'件/秒':>10}{'メモリ(MB)':>12}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print(
+            f"{name:<28}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['p99_ms']:>10.2f}"
+            f"{r['items_per_sec']:>10.2f}{r.get('peak_memory_mb', 0):>12.2f}"
+        )
+
+def compare_with_baseline(results, baseline, tolerance):
+    """ベースラインと比較し、遅くなった項目を返す"""
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        ratio = r["p50_ms"] / base["p50_ms"] if base["p50_ms"] else 1.0
+        status = "NG" if ratio > 1 + tolerance else "OK"
+        print(f"{status} {name:<28} p50 {base['p50_ms']:.2f}ms -> {r['p50_ms']:.2f}ms ({ratio:.2f}倍)")
+        if status == "NG":
+            regressions.append(name)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="現場報告DXシステム ベンチマーク")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="実行するベンチマーク")
+    parser.add_argument("--quick", action="store_true", help="計測回数を減らして短時間で実行")
+    parser.add_argument("--save-baseline", action="store_true", help="結果をベースラインとして保存")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="ベースラインファイル")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="許容する悪化率（0.25 = 25%%）")
+    parser.add_argument("--output", type=Path, help="結果をJSONで保存するパス")
+    args = parser.parse_args(argv)
+
+    # ログ出力の負荷を計測に含めない
+    logger.remove()
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        print(f"計測中: {name} ...", flush=True)
+        results.update(BENCHMARKS[name](args.quick))
+
+    print()
+    print_results(results)
+
+    report = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "quick": args.quick
+        },
+        "results": results
+    }
+
+    if args.output:
+        args.output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if args.save_baseline:
+        # 既存のベースラインに今回の項目を上書きマージ
+        if args.baseline.exists():
+            baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+            baseline["results"].update(results)
+            baseline["meta"] = report["meta"]
+        else:
+            baseline = report
+        args.baseline.write_text(json.dumps(baseline, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"\nベースラインを保存しました: {args.baseline}")
+        return 0
+
+    if args.baseline.exists():
+        print("\nベースラインとの比較:")
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n性能が悪化した項目があります: {', '.join(regressions)}")
+            return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
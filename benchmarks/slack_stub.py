@@ -0,0 +1,145 @@
+"""
+現場報告DXシステム - Slack APIスタブサーバー
+ベンチマーク・負荷試験で実際のSlackに送信しないためのローカルサーバー
+
+単体での起動:
+    python -m benchmarks.slack_stub --port 8099
+アプリ側は SLACK_API_BASE=http://127.0.0.1:8099/api を設定して起動する。
+"""
+import json
+import argparse
+import asyncio
+from aiohttp import web
+
+class SlackStub:
+    """Slack Web APIの最低限のエンドポイントを模擬するサーバー
+
+    files.getUploadURLExternal → アップロード先への送信 → files.completeUploadExternal の流れを模擬し、
+    それ以外のメソッドは本文を読み捨てて成功を返す。
+
+    Attributes:
+        calls (list): 受信したAPIメソッド名の履歴（アップロード先への送信は"upload"）
+        received_bytes (int): 受信したリクエスト本文の合計バイト数
+        uploads (dict): ファイルID: {"filename", "length", "received"}
+        messages (list): files.completeUploadExternalで共有されたメッセージ（channel_id, initial_comment, files）
+    """
+
+    def __init__(self, latency=0.0, fail_methods=()):
+        """
+        Args:
+            latency (float): 各リクエストに加える応答遅延（秒）
+            fail_methods (tuple): エラーを返すAPIメソッド名
+        """
+        self.latency = latency
+        self.fail_methods = set(fail_methods)
+        self.calls = []
+        self.received_bytes = 0
+        self.uploads = {}
+        self.messages = []
+        self.runner = None
+        self.base_url = ""
+
+    def create_app(self):
+        """aiohttpのアプリケーションを作成"""
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/api/{method}", self.handle_api)
+        app.router.add_post("/upload/{file_id}", self.handle_upload)
+        return app
+
+    async def handle_api(self, request):
+        """APIメソッドの共通ハンドラ"""
+        method = request.match_info["method"]
+        body = await request.read()
+        self.received_bytes += len(body)
+        self.calls.append(method)
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method in self.fail_methods:
+            return web.json_response({"ok": False, "error": "stub_error"})
+
+        if method == "files.getUploadURLExternal":
+            form = await request.post()
+            file_id = f"F{len(self.uploads) + 1:08d}"
+            self.uploads[file_id] = {"filename": form["filename"], "length": int(form["length"]), "received": None}
+            upload_url = str(request.url.with_path(f"/upload/{file_id}").with_query(None))
+            return web.json_response({"ok": True, "upload_url": upload_url, "file_id": file_id})
+
+        if method == "files.completeUploadExternal":
+            form = await request.post()
+            files = json.loads(form["files"])
+            # 本文の送信が終わっていないファイルは共有できない
+            if any(self.uploads.get(item["id"], {}).get("received") is None for item in files):
+                return web.json_response({"ok": False, "error": "file_not_found"})
+            self.messages.append({
+                "channel_id": form.get("channel_id"),
+                "initial_comment": form.get("initial_comment", ""),
+                "files": files
+            })
+            return web.json_response({"ok": True, "files": [{"id": item["id"]} for item in files]})
+
+        return web.json_response({"ok": True})
+
+    async def handle_upload(self, request):
+        """files.getUploadURLExternalで返したアップロード先"""
+        file_id = request.match_info["file_id"]
+        body = await request.read()
+        self.received_bytes += len(body)
+        self.calls.append("upload")
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        upload = self.uploads.get(file_id)
+        if upload is None or "upload" in self.fail_methods:
+            return web.Response(status=404 if upload is None else 500)
+        upload["received"] = len(body)
+        return web.Response(text=f"OK - {len(body)}")
+
+    async def start(self, host="127.0.0.1", port=0):
+        """サーバーを起動
+
+        Args:
+            host (str): 待ち受けアドレス
+            port (int): 待ち受けポート（0の場合は空きポートを自動選択）
+
+        Returns:
+            str: SLACK_API_BASEに設定するURL
+        """
+        self.runner = web.AppRunner(self.create_app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://{host}:{port}/api"
+        return self.base_url
+
+    async def stop(self):
+        """サーバーを停止"""
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+async def _serve(host, port, latency):
+    stub = SlackStub(latency=latency)
+    base_url = await stub.start(host, port)
+    print(f"Slackスタブ起動: SLACK_API_BASE={base_url}")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await stub.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Slack APIスタブサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.05, help="応答遅延（秒）")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(_serve(args.host, args.port, args.latency))
+    except KeyboardInterrupt:
+        pass
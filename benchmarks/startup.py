@@ -0,0 +1,130 @@
+"""
+現場報告DXシステム - 起動時間の計測
+main.pyの読み込みで時間のかかっているモジュールと、起動から最初のHTTP 200までの時間を計測する
+
+実行方法（リポジトリのルートで実行）:
+    python -m benchmarks.startup                # 読み込みの内訳とHTTP 200までの時間を3回計測
+    python -m benchmarks.startup --runs 5 --top 30
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import urllib.request
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+
+def measure_imports(module="main", top=20):
+    """python -X importtime でモジュールの読み込み時間を計測
+
+    Args:
+        module (str): 読み込むモジュール
+        top (int): 表示する件数
+
+    Returns:
+        dict: total_ms（全体）, by_cumulative / by_self（(モジュール名, ミリ秒)のリスト）
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, capture_output=True, text=True, env=_child_env()
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    # 形式: "import time:      self [us] |  cumulative | imported package"
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.rstrip(), int(self_us), int(cumulative_us)))
+
+    # 字下げのない行が直接読み込まれたモジュール
+    total_us = sum(cumulative for name, _, cumulative in modules if not name.startswith("  "))
+    by_cumulative = sorted(modules, key=lambda item: item[2], reverse=True)[:top]
+    by_self = sorted(modules, key=lambda item: item[1], reverse=True)[:top]
+    return {
+        "total_ms": total_us / 1000,
+        "by_cumulative": [(name.strip(), cumulative / 1000) for name, _, cumulative in by_cumulative],
+        "by_self": [(name.strip(), self_us / 1000) for name, self_us, _ in by_self]
+    }
+
+def measure_first_response(port, timeout=60):
+    """サーバーを起動し、最初にHTTP 200が返るまでの時間を計測
+
+    Args:
+        port (int): サーバーのポート（既存のサーバーと重ならないポート）
+        timeout (float): 待機する最大時間（秒）
+
+    Returns:
+        float: 起動から最初のHTTP 200までの時間（秒）
+    """
+    # main.pyのポートは固定のため、ui.runの引数を差し替えて起動する
+    script = (
+        "import runpy; from nicegui import ui; "
+        f"ui.run = (lambda run: lambda *a, **k: run(*a, **{{**k, 'port': {port}, 'show': False}}))(ui.run); "
+        "runpy.run_path('main.py', run_name='__main__')"
+    )
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-c", script], cwd=ROOT_DIR, env=_child_env(),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"サーバーが終了しました（終了コード {server.returncode}）")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError(f"{timeout}秒以内に応答がありません")
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+def _child_env():
+    env = dict(os.environ)
+    env.setdefault("SLACK_ENABLED", "false")
+    env["PYTHONPATH"] = str(ROOT_DIR)
+    return env
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="起動時間の計測")
+    parser.add_argument("--runs", type=int, default=3, help="HTTP 200までの時間の計測回数")
+    parser.add_argument("--top", type=int, default=15, help="表示するモジュールの件数")
+    parser.add_argument("--module", default="main", help="読み込み時間を計測するモジュール")
+    args = parser.parse_args(argv)
+
+    imports = measure_imports(args.module, args.top)
+    print(f"import {args.module}: {imports['total_ms']:.1f} ms")
+    print("\n読み込み時間（依存モジュールを含む）:")
+    for name, ms in imports["by_cumulative"]:
+        print(f"  {ms:8.1f} ms  {name}")
+    print("\n読み込み時間（モジュール単体）:")
+    for name, ms in imports["by_self"]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    durations = [measure_first_response(_free_port()) for _ in range(args.runs)]
+    print(
+        f"\n起動から最初のHTTP 200まで: 中央値 {statistics.median(durations):.3f} 秒 "
+        f"(最小 {min(durations):.3f} / 最大 {max(durations):.3f}, {args.runs}回)"
+    )
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
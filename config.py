@@ -3,26 +3,79 @@
 システムの設定値を一元管理
 """
 import os
+import threading
+import dataclasses
 from pathlib import Path
-from dotenv import load_dotenv
-
-# 環境変数のロード
-load_dotenv()
+from dotenv import dotenv_values
 
 # ベースディレクトリ（このファイルが存在するディレクトリ）
 BASE_DIR = Path(__file__).parent.absolute()
 
+# 環境変数を記述するファイル（環境変数に同じ名前があれば環境変数を優先）
+ENV_FILE = BASE_DIR / ".env"
+
 # 保存先の設定
 UPLOAD_FOLDER = BASE_DIR / "data" / "uploaded"
 LOG_FOLDER = BASE_DIR / "log"
+ORIGINAL_FOLDER = UPLOAD_FOLDER / "originals"  # アップロードされた元画像（バナーなし）
+RENDER_CACHE_FOLDER = UPLOAD_FOLDER / "rendered"  # メタデータ合成済み画像（ZIP・Slack用）
+PREVIEW_FOLDER = UPLOAD_FOLDER / "web"  # Web配信用の派生画像
+
+# Web配信用の派生画像（プレビュー・サムネイル）の設定
+# ZIP/Slackには上記のJPEGを使い、画面表示にはより軽量な形式を配信する
+PREVIEW_FORMATS = ["avif", "webp", "jpeg"]  # 配信の優先順（Pillowが対応している形式のみ生成）
+PREVIEW_SIZES = {
+    "thumb": 320,     # サムネイルの長辺（px）
+    "preview": 1280   # プレビューの長辺（px）
+}
+
+# Slackの1メッセージにまとめる画像の最大数（files.completeUploadExternalの上限）
+SLACK_FILES_PER_MESSAGE = 10
+
+# 複数プロセスで動かす場合の設定（SHARED_STOREを指定した場合）
+SHARED_REFRESH_INTERVAL = 2.0  # 他のプロセスで追加・削除された画像を画面に反映する間隔（秒）
+SHARED_STORE_TIMEOUT = 10.0  # 共有ストアのロック待ちの上限（秒）
+NOTIFICATION_STALE_SECONDS = 600  # Slack送信中のまま終了しないプロセスの受付を無効とみなす時間（秒）
+
+# オフライン対応版（スマホ用PWA、/pwa/index.html）の設定
+PWA_FOLDER = BASE_DIR / "static" / "pwa"
+PWA_SYNC_CONCURRENCY = 2  # 同時に送信する写真の数（現場の弱い回線を使い切らないように）
+PWA_RETRY_BASE_SECONDS = 5  # 送信に失敗した写真を再送するまでの待ち時間（失敗するたびに2倍）
+PWA_RETRY_MAX_SECONDS = 300  # 再送までの待ち時間の上限
+
+# 画像の一括削除で1つのファイル入出力ワーカーにまとめて渡す元画像の数
+DELETE_BATCH_SIZE = 50
 
-# 画像圧縮の設定
-COMPRESSION_QUALITY = 70  # JPEG圧縮率（0-100）
+# フォルダ・SDカードからの一括取り込み（python -m logics.importer）の設定
+IMPORT_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp", ".heic", ".heif"}  # 取り込む画像の拡張子（大文字・小文字を区別しない）
+IMPORT_COMMIT_SIZE = 50  # 画像リストにまとめて追加する件数
+IMPORT_PROGRESS_INTERVAL = 1.0  # 進捗を表示する間隔（秒）
 
-# Slack設定
-SLACK_ENABLED = os.getenv("SLACK_ENABLED", "false").lower() == "true"
-SLACK_TOKEN = os.getenv("SLACK_TOKEN", "")
-SLACK_CHANNEL = os.getenv("SLACK_CHANNEL", "")
+# 作成済み画像の再作成（python -m logics.backfill）の設定
+BACKFILL_CHECKPOINT = BASE_DIR / "data" / "backfill.json"  # 処理済みの画像を記録するファイル（中断後の再開用）
+BACKFILL_CHECKPOINT_INTERVAL = 20  # 処理済みの画像を記録する間隔（件数）
+BACKFILL_NICE = 10  # 再作成プロセスの優先度を下げる値（アップロード・配信の処理を優先）
+
+# 取り込み前の画像の確認で判別できる画像形式（ALLOWED_IMAGE_FORMATSに指定できる値）
+KNOWN_IMAGE_FORMATS = ("JPEG", "PNG", "WEBP", "GIF", "BMP", "HEIF")
+
+# HEIC/HEIF（iPhoneの写真）は取り込み時に1度だけデコードしてJPEGに変換し、元画像として保存する
+# （HEVCは縮小デコードできないため、以降のプレビュー・合成はJPEGの縮小デコードを使う）
+HEIF_CONVERT_QUALITY = 92  # 変換したJPEGの品質（元画像として保存するため高めに設定）
+
+# 取り込み前の画像の確認（ヘッダーのみ読み込み、デコードしない）で受け付ける色の形式（PillowのImage.mode）
+# 1画素4バイトの整数・浮動小数点（I・F）などは合成・エンコードできないため受け付けない
+ALLOWED_IMAGE_MODES = {"1", "L", "LA", "La", "P", "PA", "RGB", "RGBA", "RGBa", "RGBX", "CMYK", "YCbCr", "I;16"}
+
+# 画像の品質判定（ピンぼけ・露出）の設定（しきい値は.envのQUALITY_*で変更）
+QUALITY_ANALYSIS_SIZE = 480  # 判定用に縮小する大きさ（長辺の画素数、シャープネスの値はこの大きさでの値。12MPのJPEGを1/8で縮小デコードできる大きさ）
+QUALITY_CLIP_LEVELS = (8, 247)  # 黒つぶれ・白飛びとみなす明るさ（以下, 以上）
+
+# ファイルを分割して読み込む際の1回の大きさ（バイト、画像の配信・Slackへのアップロード・アップロードの受信）
+FILE_CHUNK_SIZE = 256 * 1024
+
+# 配信する画像のETagを保持する件数（超えた分は古い順に破棄し、次の配信時に再計算）
+ETAG_CACHE_SIZE = 4096
 
 # タグリスト（職人が選択できるタグ）
 TAGS = [
@@ -68,30 +121,338 @@ DEFAULT_METADATA = {
     "timestamp": ""
 }
 
-# デバッグモード（開発時のみTrue）
-DEBUG = os.getenv("DEBUG", "false").lower() == "true"
+# メトリクス（/metrics）の設定
+METRICS_DURATION_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]  # 所要時間のバケット（秒）
+METRICS_SIZE_BUCKETS = [2 ** n * 1024 * 1024 for n in range(0, 11, 2)]  # ZIPサイズのバケット（1MB〜1GB）
+METRICS_DISK_USAGE_TTL = 30  # 保存フォルダの使用量を再計算する間隔（秒）
+
+# トレースの設定（画像ごとのアップロード・合成・保存・Slack送信の所要時間）
+TRACE_MAX_SPANS = 100  # 1つのトレースでメモリに保持するスパン数の上限（プレビューの再取得などで増え続けないように）
+TRACE_SERVICE_NAME = "photo-drop-terminal"
+
+# ログの設定
+LOG_RETENTION_DAYS = 30  # 日付別のログフォルダを残す日数（前日以前のログはgzip圧縮）
+LOG_MAX_TOTAL_SIZE = 1024 * 1024 * 1024  # ログフォルダ全体の上限（バイト、超えた場合は古い日から削除）
+LOG_MAX_FILE_SIZE = 100 * 1024 * 1024  # 1ファイルの上限（バイト、超えた場合は圧縮して新しいファイルに切り替え）
+LOG_SAMPLE_RATES = {  # ファイルごとに大量に出力されるログの間引き（N件に1件出力、警告以上は常に出力）
+    "zip_entry": 20,     # ZIP追加
+    "cleanup_file": 20,  # 古いファイルの削除
+    "render": 10         # 派生画像の作成
+}
+
+# プロファイラーの設定（/admin/profile）
+PROFILE_INTERVAL = 0.005  # スタックを採取する間隔（秒）
+PROFILE_MAX_DURATION = 300  # 1回に採取できる最大時間（秒）
 
 # 画像に追加するフォント設定
 FONT_SIZE = 24
 SMALL_FONT_SIZE = 18
 
-# フォントパス（OSによって異なる）
+# メタデータバナーのレイアウト（px）
+# FONT_SIZE・SMALL_FONT_SIZEを含め、短辺がBANNER_BASE_SIZEの画像での値
+BANNER_PADDING = 10
+BANNER_LINE_HEIGHT = 30
+
+# バナーは画像の解像度に合わせて拡大縮小する
+# 短辺をバケットに量子化し、バケットごとに1度だけレイアウトを計算する
+BANNER_BASE_SIZE = 1080
+BANNER_SIZE_BUCKETS = [480, 720, 1080, 1440, 2160, 2880, 3840]
+BANNER_MIN_FONT_SIZE = 10
+
+# バナーのレイアウトのバージョン
+# レイアウトを変更したら値を上げると、合成済み画像が次回要求時に作り直される
+BANNER_LAYOUT_VERSION = 1
+
+# 日本語フォントの候補（platform.system()ごと、先頭から順に存在するものを使う）
+# .envのFONT_PATHで指定した場合はそちらを使う
 FONT_PATHS = {
-    "windows": "C:/Windows/Fonts/meiryo.ttc",
-    "mac": "/System/Library/Fonts/ヒラギノ角ゴシック W4.ttc",
-    "linux": "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+    "Windows": [
+        "C:/Windows/Fonts/meiryo.ttc",
+        "C:/Windows/Fonts/msgothic.ttc",
+        "C:/Windows/Fonts/YuGothM.ttc"
+    ],
+    "Darwin": [
+        "/System/Library/Fonts/ヒラギノ角ゴシック W4.ttc",
+        "/Library/Fonts/Osaka.ttf",
+        "/System/Library/Fonts/AppleGothic.ttf"
+    ],
+    "Linux": [
+        "/usr/share/fonts/truetype/fonts-japanese-gothic.ttf",
+        "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc",
+        "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"  # 代替
+    ]
+}
+
+# 環境変数・.envで変更できる設定
+# 設定はSettingsオブジェクトにまとめ、各モジュールは使う時点でget_settings()から取得する
+@dataclasses.dataclass(frozen=True)
+class Settings:
+    """環境変数・.envから読み込んだ設定（変更不可、再読み込み時はオブジェクトごと差し替える）
+
+    各項目は同じ名前の大文字の環境変数（例: image_workers → IMAGE_WORKERS）で変更できる。
+    """
+    # Slack設定
+    slack_enabled: bool = False
+    slack_token: str = dataclasses.field(default="", repr=False)  # ログ等に出力しない
+    slack_channel: str = ""
+    slack_api_base: str = "https://slack.com/api"  # 検証用のスタブサーバーに向ける場合に変更
+    slack_send_interval: float = 1.0  # 一括送信時のメッセージごとの送信間隔（秒、APIレート制限対策）
+    slack_upload_concurrency: int = 4  # 並列にアップロードする画像数
+
+    # 画像処理の設定
+    image_workers: int = min(4, os.cpu_count() or 1)  # デコード・合成・エンコードを実行するスレッド数
+    io_workers: int = 4  # ファイルの読み書きを実行するスレッド数
+    upload_concurrency: int = 8  # 同時に取り込むアップロードの上限（超えた分は順番待ち）
+    max_image_pixels: int = 50_000_000  # 受け付ける画像の最大画素数（幅×高さ）
+    max_image_side: int = 30_000  # 受け付ける画像の幅・高さの上限（画素）
+    allowed_image_formats: str = "JPEG,PNG,WEBP,GIF,BMP,HEIF"  # 受け付ける画像形式（カンマ区切り、PillowのImage.format。HEIFはpillow-heifが必要）
+    max_upload_bytes: int = 50 * 1024 * 1024  # 受け付ける画像ファイルの最大サイズ（バイト）
+    compression_quality: int = 70  # JPEG圧縮率（0-100、ZIP・Slack用とWeb配信用のJPEG）
+    webp_quality: int = 75  # Web配信用のWebPの品質
+    avif_quality: int = 60  # Web配信用のAVIFの品質
+    banner_cache_size: int = 16  # 事前描画したバナーのキャッシュ数（名前・場所・タグ・コメント・画像幅の組み合わせごと）
+    font_path: str = ""  # 日本語フォント（空の場合はFONT_PATHSから検出）
+
+    # 画像の品質判定の設定（取り込み時に計算した値で判定し、画面に表示）
+    quality_min_sharpness: float = 25.0  # これより小さい写真をピンぼけとみなす（ラプラシアンの分散）
+    quality_min_brightness: float = 30.0  # 平均の明るさ（0〜255）がこれより小さい写真を暗いとみなす
+    quality_max_brightness: float = 230.0  # 平均の明るさがこれより大きい写真を明るすぎとみなす
+    quality_max_clipped: float = 0.5  # 黒つぶれ・白飛びした画素の割合の上限
+    quality_exclude_flagged: bool = False  # 品質に問題がある写真をSlack送信・ZIP保存から除外する
+
+    # ログ・トレースの設定
+    log_format: str = "json"  # json: 1行1レコードのJSON / text: 従来のテキスト形式
+    log_queue_size: int = 10000  # 書き込み待ちのログの上限件数（超えた分は処理を止めないよう破棄）
+    log_prune: bool = True  # 保持期間・合計サイズの上限を超えた古いログを削除する（複数プロセスでは1つ目のプロセスのみ）
+    tracing_enabled: bool = True
+    trace_buffer_size: int = 200  # デバッグページ用にメモリに保持する直近のトレース数
+    trace_export_file: str = ""  # OTLP/JSON形式で追記するファイル（空の場合は出力しない）
+    trace_export_url: str = ""  # OTLP/HTTPの送信先（例: http://localhost:4318/v1/traces）
+
+    # サーバーの設定
+    port: int = 8080  # 待ち受けるポート
+    worker_name: str = ""  # 複数プロセスで動かす場合のプロセス名（ログのファイル名に使用）
+    shared_store: str = ""  # 複数プロセスで共有するSQLiteのファイル（空の場合はプロセスのメモリに保持）
+
+    # 管理者用API（/admin/...）のトークン（空の場合は管理者用APIを無効にする）
+    admin_token: str = dataclasses.field(default="", repr=False)
+
+    # デバッグモード（開発時のみTrue）
+    debug: bool = False
+
+    def replace(self, **changes):
+        """一部の項目を変更した新しい設定を作成（検証も行う）"""
+        return validate_settings(dataclasses.replace(self, **changes))
+
+    @property
+    def image_formats(self):
+        """受け付ける画像形式のリスト（ALLOWED_IMAGE_FORMATSを大文字に変換）"""
+        return [name.strip().upper() for name in self.allowed_image_formats.split(",") if name.strip()]
+
+    def preview_quality(self, format_name):
+        """Web配信用の派生画像の品質を取得
+
+        Args:
+            format_name (str): フォーマット名（jpeg/webp/avif）
+
+        Returns:
+            int: 品質
+        """
+        return {"webp": self.webp_quality, "avif": self.avif_quality}.get(format_name, self.compression_quality)
+
+# 再起動せずに再読み込みできる項目（処理のたびにget_settings()から読む画像処理・送信の調整値）
+# それ以外の項目を.envで変更した場合は再起動するまで反映しない
+RELOADABLE_SETTINGS = (
+    "slack_send_interval",
+    "slack_upload_concurrency",
+    "image_workers",
+    "upload_concurrency",
+    "max_image_pixels",
+    "max_image_side",
+    "allowed_image_formats",
+    "max_upload_bytes",
+    "compression_quality",
+    "webp_quality",
+    "avif_quality",
+    "quality_min_sharpness",
+    "quality_min_brightness",
+    "quality_max_brightness",
+    "quality_max_clipped",
+    "quality_exclude_flagged"
+)
+
+# 設定値の範囲（最小値, 最大値）
+SETTING_RANGES = {
+    "slack_send_interval": (0, 60),
+    "slack_upload_concurrency": (1, 20),
+    "image_workers": (1, 64),
+    "upload_concurrency": (1, 1000),
+    "max_image_pixels": (1, 1_000_000_000),
+    "max_image_side": (1, 1_000_000),
+    "max_upload_bytes": (1024, 1024 * 1024 * 1024),
+    "io_workers": (1, 64),
+    "port": (1, 65535),
+    "compression_quality": (1, 100),
+    "webp_quality": (1, 100),
+    "avif_quality": (1, 100),
+    "quality_min_sharpness": (0, 100_000),
+    "quality_min_brightness": (0, 255),
+    "quality_max_brightness": (0, 255),
+    "quality_max_clipped": (0, 1),
+    "banner_cache_size": (1, 10000),
+    "log_queue_size": (1, 10_000_000),
+    "trace_buffer_size": (1, 100_000)
 }
 
-# 初期化時の設定
-def init_config():
-    """アプリケーション起動時の設定初期化"""
-    # 必要なフォルダが存在しない場合は作成
-    UPLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
-    LOG_FOLDER.mkdir(parents=True, exist_ok=True)
-
-    # Slack設定のバリデーション
-    if SLACK_ENABLED and (not SLACK_TOKEN or not SLACK_CHANNEL):
-        print("警告: Slack機能が有効ですが、トークンまたはチャンネルが設定されていません")
-        print("Slack機能を使用するには.envファイルに以下を設定してください:")
-        print("SLACK_TOKEN=xoxb-...")
-        print("SLACK_CHANNEL=チャンネルID")
\ No newline at end of file
+_TRUE_VALUES = {"true", "1", "yes", "on"}
+_FALSE_VALUES = {"false", "0", "no", "off", ""}
+
+def _parse_value(name, text, value_type):
+    """環境変数の文字列を設定項目の型に変換"""
+    text = text.strip()
+    if value_type is bool:
+        if text.lower() in _TRUE_VALUES:
+            return True
+        if text.lower() in _FALSE_VALUES:
+            return False
+        raise ValueError(f"{name.upper()}はtrue/falseで指定してください: {text}")
+    try:
+        return value_type(text)
+    except ValueError:
+        raise ValueError(f"{name.upper()}は数値で指定してください: {text}") from None
+
+def validate_settings(settings):
+    """設定値を検証
+
+    Args:
+        settings (Settings): 検証する設定
+
+    Returns:
+        Settings: 検証した設定（そのまま返す）
+
+    Raises:
+        ValueError: 不正な値がある場合（すべての問題をまとめたメッセージ）
+    """
+    errors = []
+    for name, (minimum, maximum) in SETTING_RANGES.items():
+        value = getattr(settings, name)
+        if not minimum <= value <= maximum:
+            errors.append(f"{name.upper()}は{minimum}〜{maximum}の範囲で指定してください: {value}")
+
+    unknown_formats = set(settings.image_formats) - set(KNOWN_IMAGE_FORMATS)
+    if not settings.image_formats or unknown_formats:
+        errors.append(
+            f"ALLOWED_IMAGE_FORMATSは{','.join(KNOWN_IMAGE_FORMATS)}から指定してください: {settings.allowed_image_formats}"
+        )
+    if settings.log_format not in ("json", "text"):
+        errors.append(f"LOG_FORMATはjsonまたはtextを指定してください: {settings.log_format}")
+    if settings.font_path and not os.path.exists(settings.font_path):
+        errors.append(f"FONT_PATHのフォントが存在しません: {settings.font_path}")
+    if settings.worker_name and not settings.worker_name.replace("-", "").replace("_", "").isalnum():
+        errors.append(f"WORKER_NAMEは英数字・-・_で指定してください: {settings.worker_name}")
+    if settings.slack_enabled and (not settings.slack_token or not settings.slack_channel):
+        errors.append(
+            "Slack機能が有効ですが、トークンまたはチャンネルが設定されていません"
+            "（.envにSLACK_TOKEN=xoxb-...とSLACK_CHANNEL=チャンネルIDを設定してください）"
+        )
+
+    if errors:
+        raise ValueError("設定値が不正です:\n  " + "\n  ".join(errors))
+    return settings
+
+def load_settings(environ=None, env_file=ENV_FILE):
+    """環境変数と.envから設定を読み込んで検証
+
+    Args:
+        environ (dict, optional): 環境変数（省略時はos.environ）
+        env_file (Path, optional): .envファイル（環境変数に同じ名前があれば環境変数を優先）
+
+    Returns:
+        Settings: 読み込んだ設定
+
+    Raises:
+        ValueError: 不正な値がある場合
+    """
+    values = {}
+    if env_file and Path(env_file).exists():
+        values.update({key: value for key, value in dotenv_values(env_file).items() if value is not None})
+    values.update(os.environ if environ is None else environ)
+
+    changes = {}
+    errors = []
+    for field in dataclasses.fields(Settings):
+        text = values.get(field.name.upper())
+        if text is None:
+            continue
+        try:
+            changes[field.name] = _parse_value(field.name, text, type(field.default))
+        except ValueError as e:
+            errors.append(str(e))
+    if errors:
+        raise ValueError("設定値が不正です:\n  " + "\n  ".join(errors))
+
+    if "log_format" in changes:
+        changes["log_format"] = changes["log_format"].lower()
+    return validate_settings(Settings(**changes))
+
+# 現在の設定（起動時に読み込んで検証し、不正な値があれば起動しない）
+_settings = load_settings()
+_settings_lock = threading.Lock()
+
+def get_settings():
+    """現在の設定を取得
+
+    再読み込みで差し替わるため、1つの処理の中では最初に取得した設定を使い続けること。
+
+    Returns:
+        Settings: 現在の設定
+    """
+    return _settings
+
+def apply_settings(settings):
+    """設定を差し替え
+
+    Args:
+        settings (Settings): 新しい設定（検証済みのもの）
+
+    Returns:
+        Settings: 差し替える前の設定
+    """
+    global _settings
+    with _settings_lock:
+        previous, _settings = _settings, settings
+    return previous
+
+def reload_settings(environ=None, env_file=ENV_FILE):
+    """.envと環境変数を読み直し、再起動せずに反映できる項目（RELOADABLE_SETTINGS）を差し替え
+
+    不正な値がある場合は現在の設定のまま変更しない。
+
+    Args:
+        environ (dict, optional): 環境変数（省略時はos.environ）
+        env_file (Path, optional): .envファイル
+
+    Returns:
+        dict: changed（反映した項目: [変更前, 変更後]）, restart_required（再起動が必要な項目のリスト）
+
+    Raises:
+        ValueError: 不正な値がある場合
+    """
+    loaded = load_settings(environ, env_file)
+    current = get_settings()
+
+    changed = {}
+    restart_required = []
+    for field in dataclasses.fields(Settings):
+        old, new = getattr(current, field.name), getattr(loaded, field.name)
+        if old == new:
+            continue
+        if field.name in RELOADABLE_SETTINGS:
+            changed[field.name] = [old, new]
+        else:
+            restart_required.append(field.name)
+
+    if changed:
+        apply_settings(current.replace(**{name: values[1] for name, values in changed.items()}))
+    return {"changed": changed, "restart_required": restart_required}
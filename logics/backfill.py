@@ -0,0 +1,312 @@
+"""
+現場報告DXシステム - 作成済み画像の再作成
+圧縮率・プレビューのサイズ・バナーのレイアウトを変更した後に、保存済みの画像のメタデータ合成済み画像・
+プレビュー画像を作成し直し、画像リストのプレビューURLを更新する
+（これらの設定はキャッシュキーに含まれるため、変更後は新しいキャッシュキーの画像を作成する）
+
+画像リストは共有ストア（SHARED_STORE）から読み込むため、プロセスのメモリに画像リストを保持するサーバーには使用できない。
+
+稼働中のサーバーと同時に実行できるよう、プロセスの優先度を下げ、CPU・ファイル読み込みの使用量を制限できる。
+処理済みの画像はチェックポイント（BACKFILL_CHECKPOINT）に記録するため、中断しても再実行すると続きから処理する。
+
+実行方法（リポジトリのルートで実行）:
+    python -m logics.backfill                                # 未作成の画像のみ作成
+    python -m logics.backfill --force --cpu-share 0.5        # 作成済みの画像も作り直す（Pillowの更新後など）
+    python -m logics.backfill --workers 2 --max-read-mb 20   # 元画像の読み込みを毎秒20MBまでに制限
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from loguru import logger
+
+from config import (
+    BASE_DIR, PREVIEW_SIZES, BANNER_LAYOUT_VERSION, BACKFILL_CHECKPOINT, BACKFILL_CHECKPOINT_INTERVAL, BACKFILL_NICE,
+    IMPORT_PROGRESS_INTERVAL, get_settings
+)
+from logics.cluster import DEFAULT_SHARED_STORE
+from logics.image_formats import get_enabled_formats
+from logics.records import ImageRecord
+from logics.renderer import (
+    compute_content_hash, get_render_key, render_annotated, render_web_variant, delete_stale_rendered
+)
+from logics.shared_store import open_store
+
+# 各プロセスのCPU使用率の上限（0〜1、プロセスの起動時に設定）
+_cpu_share = 1.0
+
+def job_signature(formats, overwrite):
+    """再作成の条件（条件が変わった場合はチェックポイントを使わずに最初から処理する）
+
+    Args:
+        formats (list): 作成する配信フォーマット
+        overwrite (bool): 作成済みの画像も作成し直す場合はTrue
+
+    Returns:
+        dict: 圧縮率・プレビューのサイズ・バナーのレイアウトのバージョンなど
+    """
+    settings = get_settings()
+    return {
+        "layout_version": BANNER_LAYOUT_VERSION,
+        "compression_quality": settings.compression_quality,
+        "webp_quality": settings.webp_quality,
+        "avif_quality": settings.avif_quality,
+        "preview_sizes": PREVIEW_SIZES,
+        "formats": list(formats),
+        "overwrite": overwrite
+    }
+
+def load_checkpoint(path, signature):
+    """前回中断した処理の処理済みの画像を読み込み
+
+    Args:
+        path (Path): チェックポイントのファイル
+        signature (dict): 今回の再作成の条件
+
+    Returns:
+        set: 処理済みの画像のUUID（条件が異なる・前回が完了している場合は空）
+    """
+    try:
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return set()
+    if data.get("signature") != signature or data.get("finished"):
+        return set()
+    return set(data.get("done", []))
+
+def save_checkpoint(path, signature, done, finished=False):
+    """処理済みの画像を記録（一時ファイルに書き込んでから置き換え）"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps({
+        "signature": signature,
+        "done": sorted(done),
+        "finished": finished,
+        "updated_at": time.strftime("%Y-%m-%d %H:%M:%S")
+    }, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+def _init_worker(cpu_share):
+    """再作成プロセスの初期化（優先度を下げ、稼働中のサーバーの処理を優先させる）"""
+    global _cpu_share
+    _cpu_share = cpu_share
+    try:
+        os.nice(BACKFILL_NICE)
+    except (AttributeError, OSError):
+        pass  # Windowsなど優先度を変更できない環境
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+def backfill_image(data, formats, overwrite=False, verify=False):
+    """1枚の画像の作成済み画像を作成（再作成プロセスで実行）
+
+    処理にかかった時間に応じて待機し、CPU使用率を_cpu_share以下に抑える。
+
+    Args:
+        data (dict): 画像レコードの辞書
+        formats (list): 作成する配信フォーマット
+        overwrite (bool): 作成済みの画像も作成し直す場合はTrue
+        verify (bool): 元画像のハッシュを再計算して破損していないか確認する場合はTrue
+
+    Returns:
+        tuple: (結果（done/missing/corrupt/failed）, エラー内容)
+    """
+    started = time.perf_counter()
+    record = ImageRecord.from_dict(data)
+    try:
+        original_path = Path(record.original_path)
+        if not original_path.exists():
+            return "missing", f"元画像がありません: {original_path}"
+        if verify and compute_content_hash(original_path.read_bytes()) != record.original_hash:
+            return "corrupt", f"元画像のハッシュが一致しません: {original_path}"
+
+        render_annotated(original_path, record.original_hash, record.metadata, overwrite=overwrite)
+        for variant in PREVIEW_SIZES:
+            for fmt in formats:
+                render_web_variant(original_path, record.original_hash, record.metadata, variant, fmt,
+                                   overwrite=overwrite)
+        return "done", ""
+
+    except Exception as e:
+        return "failed", f"{record.original_path} - {str(e)}"
+
+    finally:
+        # 処理した時間に対して(1 - 上限) / 上限の割合だけ待機
+        if _cpu_share < 1.0:
+            busy = time.perf_counter() - started
+            time.sleep(busy * (1.0 - _cpu_share) / _cpu_share)
+
+def run_backfill(store, workers=1, cpu_share=1.0, max_read_mb=None, overwrite=False, verify=False,
+                 checkpoint=BACKFILL_CHECKPOINT, restart=False, progress=None):
+    """保存済みのすべての画像の作成済み画像を作成し、プレビューURLを更新
+
+    すべての画像を処理できた場合は、古いメタデータ・レイアウトで作成した画像を削除する。
+
+    Args:
+        store (MemoryStore or SqliteStore): 画像リストのストア
+        workers (int): 再作成プロセス数
+        cpu_share (float): 1プロセスあたりのCPU使用率の上限（0〜1）
+        max_read_mb (float, optional): 元画像の読み込み量の上限（MB/秒、省略時は制限しない）
+        overwrite (bool): 作成済みの画像も作成し直す場合はTrue（圧縮率を変更した場合）
+        verify (bool): 元画像のハッシュを再計算して確認する場合はTrue
+        checkpoint (Path): チェックポイントのファイル
+        restart (bool): チェックポイントを使わずに最初から処理する場合はTrue
+        progress (callable, optional): 進捗を受け取る関数（集計結果の辞書を渡す）
+
+    Returns:
+        dict: total, skipped, done, failed, updated, removed, seconds
+    """
+    formats = get_enabled_formats()
+    signature = job_signature(formats, overwrite)
+    done = set() if restart else load_checkpoint(checkpoint, signature)
+
+    records = dict(store.images.items())
+    todo = [(img_uuid, record) for img_uuid, record in records.items() if img_uuid not in done]
+    stats = {"total": len(records), "skipped": len(records) - len(todo), "done": 0, "failed": 0,
+             "updated": 0, "removed": 0, "seconds": 0.0}
+
+    # プレビューURL（キャッシュキー）がレイアウト・画質の設定の変更で変わった画像
+    changed = {}
+    for img_uuid, record in records.items():
+        preview_url = f"/images/{img_uuid}/preview?v={get_render_key(record.original_hash, record.metadata)}"
+        if record.preview_url != preview_url:
+            record.preview_url = preview_url
+            changed[img_uuid] = record
+
+    def flush():
+        save_checkpoint(checkpoint, signature, done)
+        for img_uuid in [img_uuid for img_uuid in changed if img_uuid in done]:
+            record = changed.pop(img_uuid)
+            # 再作成中にサーバーで削除された画像は追加し直さない
+            if img_uuid in store.images:
+                store.images[img_uuid] = record
+                stats["updated"] += 1
+
+    read_limit = max_read_mb * 1024 * 1024 if max_read_mb else None
+    read_bytes = 0
+    started = time.perf_counter()
+    last_progress = started
+    since_checkpoint = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(cpu_share,)) as executor:
+            pending = {}
+            queue = iter(todo)
+            while True:
+                # 投入済みの処理はプロセス数の2倍まで（読み込み量の制限を投入時に行うため）
+                for img_uuid, record in queue:
+                    if read_limit:
+                        try:
+                            read_bytes += os.path.getsize(record.original_path)
+                        except OSError:
+                            pass
+                        wait_seconds = read_bytes / read_limit - (time.perf_counter() - started)
+                        if wait_seconds > 0:
+                            time.sleep(wait_seconds)
+                    future = executor.submit(backfill_image, record.to_dict(), formats, overwrite, verify)
+                    pending[future] = img_uuid
+                    if len(pending) >= workers * 2:
+                        break
+                if not pending:
+                    break
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    img_uuid = pending.pop(future)
+                    status, error = future.result()
+                    if status == "done":
+                        done.add(img_uuid)
+                        stats["done"] += 1
+                    else:
+                        logger.error(f"作成済み画像の再作成エラー: {img_uuid} - {error}")
+                        stats["failed"] += 1
+                    since_checkpoint += 1
+
+                if since_checkpoint >= BACKFILL_CHECKPOINT_INTERVAL:
+                    since_checkpoint = 0
+                    flush()
+
+                now = time.perf_counter()
+                stats["seconds"] = now - started
+                if progress and now - last_progress >= IMPORT_PROGRESS_INTERVAL:
+                    last_progress = now
+                    progress(stats)
+    finally:
+        flush()
+
+    stats["seconds"] = time.perf_counter() - started
+    if stats["failed"] == 0:
+        current_keys = {get_render_key(record.original_hash, record.metadata) for record in records.values()}
+        stats["removed"] = delete_stale_rendered(current_keys)
+        save_checkpoint(checkpoint, signature, done, finished=True)
+
+    logger.info(
+        f"作成済み画像の再作成完了: {stats['done']}枚 / 失敗{stats['failed']}枚 / "
+        f"プレビューURL更新{stats['updated']}件 / 古い画像の削除{stats['removed']}件 ({stats['seconds']:.1f}秒)"
+    )
+    return stats
+
+def format_progress(stats):
+    """進捗の表示文字列を作成"""
+    processed = stats["done"] + stats["failed"]
+    remaining = stats["total"] - stats["skipped"]
+    rate = processed / stats["seconds"] if stats["seconds"] else 0.0
+    return f"{processed}/{remaining}枚 (失敗 {stats['failed']}、前回までに処理済み {stats['skipped']}) {rate:.1f}枚/秒"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="現場報告DXシステム 作成済み画像の再作成")
+    parser.add_argument("--workers", type=int, default=1, help="再作成プロセス数")
+    parser.add_argument("--cpu-share", type=float, default=1.0,
+                        help="1プロセスあたりのCPU使用率の上限（0〜1、例: 0.5で処理と同じ時間だけ休む）")
+    parser.add_argument("--max-read-mb", type=float, default=None, help="元画像の読み込み量の上限（MB/秒）")
+    parser.add_argument("--force", action="store_true",
+                        help="作成済みの画像も作成し直す（Pillowの更新後など。圧縮率の変更後は不要）")
+    parser.add_argument("--verify", action="store_true", help="元画像のハッシュを再計算して破損を確認")
+    parser.add_argument("--restart", action="store_true", help="前回の続きからではなく最初から処理")
+    parser.add_argument("--checkpoint", default=str(BACKFILL_CHECKPOINT), help="チェックポイントのファイル")
+    parser.add_argument("--shared-store", default=get_settings().shared_store or DEFAULT_SHARED_STORE,
+                        help="画像リストの共有ストア（SQLite）のファイル（サーバーのSHARED_STOREと同じファイル）")
+    args = parser.parse_args(argv)
+
+    if not 0 < args.cpu_share <= 1:
+        print("--cpu-shareは0より大きく1以下で指定してください", file=sys.stderr)
+        return 1
+
+    # 存在しないファイルを開くと空の共有ストアを作成して何も処理しないため、実行しない
+    shared_store = Path(args.shared_store)
+    if not shared_store.is_absolute():
+        shared_store = BASE_DIR / shared_store
+    if not shared_store.exists():
+        print(f"共有ストアがありません: {shared_store}", file=sys.stderr)
+        print("SHARED_STOREを指定したサーバーの画像のみ再作成できます"
+              "（--shared-storeにサーバーのSHARED_STOREと同じファイルを指定）", file=sys.stderr)
+        return 1
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    store = open_store(get_settings().replace(shared_store=str(shared_store)))
+
+    interactive = sys.stdout.isatty()
+
+    def show(stats):
+        print(format_progress(stats), end="\r" if interactive else "\n", flush=True)
+
+    try:
+        stats = run_backfill(
+            store, workers=args.workers, cpu_share=args.cpu_share, max_read_mb=args.max_read_mb,
+            overwrite=args.force, verify=args.verify, checkpoint=Path(args.checkpoint), restart=args.restart,
+            progress=show
+        )
+    except KeyboardInterrupt:
+        print("\n中断しました。再実行すると続きから処理します", file=sys.stderr)
+        return 130
+
+    print(format_progress(stats) + f" 所要時間 {stats['seconds']:.1f}秒")
+    print(f"プレビューURLを更新: {stats['updated']}件 / 古い作成済み画像を削除: {stats['removed']}件")
+    return 0 if stats["failed"] == 0 else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
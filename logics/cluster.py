@@ -0,0 +1,100 @@
+"""
+現場報告DXシステム - 複数プロセスでの起動
+main.pyを複数のポートで起動し、アップロード済み画像リストなどを共有ストア（SQLite）で共有する
+
+1つのPythonプロセスでは画像のデコード・合成がCPU 1コア分しか使えないため、
+コア数に合わせてプロセスを起動し、前段のロードバランサー（deploy/nginx.confを参照）で振り分ける。
+
+実行方法（リポジトリのルートで実行）:
+    python -m logics.cluster                          # CPU数のプロセスをポート8081〜で起動
+    python -m logics.cluster --workers 4 --base-port 8081
+"""
+import os
+import sys
+import time
+import signal
+import argparse
+import subprocess
+
+from config import BASE_DIR
+
+# 共有ストアの既定のファイル（SHARED_STOREが未指定の場合）
+DEFAULT_SHARED_STORE = "data/shared.db"
+
+# 異常終了したプロセスを再起動するまでの待ち時間（秒）
+RESTART_DELAY = 2.0
+
+def build_worker_env(index, port, shared_store, environ=None):
+    """各プロセスの環境変数を作成
+
+    Args:
+        index (int): プロセスの番号（1から）
+        port (int): 待ち受けるポート
+        shared_store (str): 共有ストアのファイル
+        environ (dict, optional): 元の環境変数（省略時はos.environ）
+
+    Returns:
+        dict: 環境変数
+    """
+    env = dict(os.environ if environ is None else environ)
+    env["PORT"] = str(port)
+    env["WORKER_NAME"] = f"w{index}"
+    # 古いログの削除は1つ目のプロセスのみが行う（各プロセスが圧縮するのは自分のログのみ）
+    env["LOG_PRUNE"] = "true" if index == 1 else "false"
+    env["SHARED_STORE"] = shared_store
+    # 自動リロードは1プロセスでの開発時のみ
+    env["DEBUG"] = "false"
+    return env
+
+def start_worker(index, port, shared_store):
+    """main.pyを1プロセス起動"""
+    return subprocess.Popen(
+        [sys.executable, str(BASE_DIR / "main.py")],
+        cwd=BASE_DIR,
+        env=build_worker_env(index, port, shared_store)
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="現場報告DXシステム 複数プロセスでの起動")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="起動するプロセス数")
+    parser.add_argument("--base-port", type=int, default=8081, help="1つ目のプロセスのポート（以降は連番）")
+    parser.add_argument("--shared-store", default=os.environ.get("SHARED_STORE") or DEFAULT_SHARED_STORE,
+                        help="共有ストア（SQLite）のファイル")
+    args = parser.parse_args(argv)
+
+    # systemdなどからの停止（SIGTERM）でも子プロセスを止める
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    ports = [args.base_port + i for i in range(args.workers)]
+    workers = {port: start_worker(i + 1, port, args.shared_store) for i, port in enumerate(ports)}
+
+    print(f"{args.workers}プロセスを起動しました (共有ストア: {args.shared_store})")
+    print("ロードバランサーの振り分け先:")
+    for port in ports:
+        print(f"    server 127.0.0.1:{port};")
+
+    try:
+        while True:
+            time.sleep(1)
+            # 異常終了したプロセスは再起動（他のプロセスは止めない）
+            for i, port in enumerate(ports):
+                code = workers[port].poll()
+                if code is not None:
+                    print(f"プロセス w{i + 1} (ポート{port}) が終了しました (終了コード {code})、再起動します",
+                          file=sys.stderr)
+                    time.sleep(RESTART_DELAY)
+                    workers[port] = start_worker(i + 1, port, args.shared_store)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in workers.values():
+            process.terminate()
+        for process in workers.values():
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
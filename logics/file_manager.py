@@ -9,7 +9,8 @@ import datetime
 from pathlib import Path
 from loguru import logger
 
-from config import UPLOAD_FOLDER, LOG_FOLDER
+from config import UPLOAD_FOLDER, LOG_FOLDER, ORIGINAL_FOLDER
+from logics.metrics import ZIP_BUILD_DURATION, ZIP_SIZE_BYTES
 
 def ensure_folders_exist():
     """必要なフォルダ構造を確保"""
@@ -17,15 +18,10 @@ def ensure_folders_exist():
     upload_folder = Path(UPLOAD_FOLDER)
     upload_folder.mkdir(parents=True, exist_ok=True)
 
-    # ログフォルダ
+    # ログフォルダ（日付別のフォルダはログの書き込み時に作成）
     log_folder = Path(LOG_FOLDER)
     log_folder.mkdir(parents=True, exist_ok=True)
 
-    # 日付ベースのログフォルダ
-    today = datetime.datetime.now().strftime("%Y%m%d")
-    daily_log_folder = log_folder / today
-    daily_log_folder.mkdir(parents=True, exist_ok=True)
-
     return True
 
 def save_image(image_content, file_path, metadata=None):
@@ -78,27 +74,30 @@ def delete_image(file_path):
         logger.error(f"画像削除エラー: {file_path} - {str(e)}")
         return False
 
-def create_zip_archive(file_paths, output_path):
+def create_zip_archive(file_paths, output_path, arcnames=None):
     """複数の画像ファイルをZIP化
 
     Args:
         file_paths (list): ZIP化する画像パスのリスト
         output_path (Path): 出力先ZIPファイルのパス
+        arcnames (list, optional): ZIP内のファイル名のリスト（省略時は元のファイル名）
 
     Returns:
         bool: ZIP作成成功時はTrue
     """
     try:
-        with zipfile.ZipFile(output_path, 'w') as zipf:
-            for file_path in file_paths:
+        with ZIP_BUILD_DURATION.time(), zipfile.ZipFile(output_path, 'w') as zipf:
+            for i, file_path in enumerate(file_paths):
                 path = Path(file_path)
                 if path.exists():
-                    # ZIPファイル内には元のファイル名のみを使用
-                    zipf.write(file_path, arcname=path.name)
-                    logger.info(f"ZIP追加: {path.name}")
+                    # ZIPファイル内にはフォルダを含まないファイル名のみを使用
+                    arcname = arcnames[i] if arcnames else path.name
+                    zipf.write(file_path, arcname=arcname)
+                    logger.bind(sample="zip_entry").info(f"ZIP追加: {arcname}")
                 else:
                     logger.warning(f"ZIP追加対象のファイルが存在しません: {file_path}")
 
+        ZIP_SIZE_BYTES.observe(Path(output_path).stat().st_size)
         logger.info(f"ZIP作成成功: {output_path}")
         return True
 
@@ -113,12 +112,16 @@ def get_uploaded_files():
         list: 画像ファイルパスのリスト
     """
     try:
-        upload_folder = Path(UPLOAD_FOLDER)
+        original_folder = Path(ORIGINAL_FOLDER)
         files = []
 
-        # アップロードフォルダ内のすべてのJPEGファイルを検索
-        for file_path in upload_folder.glob("*.jpg"):
-            files.append(str(file_path))
+        if not original_folder.exists():
+            return files
+
+        # 元画像フォルダ内のすべての画像ファイルを検索
+        for file_path in original_folder.iterdir():
+            if file_path.is_file() and not file_path.name.startswith("."):
+                files.append(str(file_path))
 
         return files
 
@@ -141,8 +144,8 @@ def cleanup_old_files(days=30):
         upload_folder = Path(UPLOAD_FOLDER)
         count = 0
 
-        # フォルダ内のすべてのファイルをチェック
-        for file_path in upload_folder.iterdir():
+        # フォルダ内のすべてのファイルをチェック（派生画像のサブフォルダも含む）
+        for file_path in upload_folder.rglob("*"):
             if file_path.is_file():
                 # ファイル更新日時を取得
                 mtime = datetime.datetime.fromtimestamp(file_path.stat().st_mtime)
@@ -151,7 +154,7 @@ def cleanup_old_files(days=30):
                 if mtime < threshold:
                     file_path.unlink()
                     count += 1
-                    logger.info(f"古いファイルを削除: {file_path}")
+                    logger.bind(sample="cleanup_file").info(f"古いファイルを削除: {file_path}")
 
         return count
 
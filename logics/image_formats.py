@@ -0,0 +1,157 @@
+"""
+現場報告DXシステム - 画像フォーマットモジュール
+保存・配信用の出力フォーマット（JPEG/WebP/AVIF）の管理、入力フォーマット（HEIC/HEIF）のプラグインの登録
+"""
+import io
+from functools import lru_cache
+
+from config import PREVIEW_FORMATS, get_settings
+
+# 出力フォーマット定義（PILの保存形式・MIMEタイプ・拡張子・保存オプション）
+OUTPUT_FORMATS = {
+    "jpeg": {
+        "pil_format": "JPEG",
+        "mime": "image/jpeg",
+        "ext": ".jpg",
+        "options": {"optimize": True, "progressive": True}
+    },
+    "webp": {
+        "pil_format": "WEBP",
+        "mime": "image/webp",
+        "ext": ".webp",
+        "options": {"method": 4}
+    },
+    "avif": {
+        "pil_format": "AVIF",
+        "mime": "image/avif",
+        "ext": ".avif",
+        "options": {"speed": 8}
+    }
+}
+
+@lru_cache(maxsize=None)
+def is_format_supported(name):
+    """出力フォーマットが現在のPillowで保存可能かをチェック
+
+    Args:
+        name (str): フォーマット名（jpeg/webp/avif）
+
+    Returns:
+        bool: 保存可能な場合はTrue
+    """
+    fmt = OUTPUT_FORMATS.get(name)
+    if fmt is None:
+        return False
+
+    # プラグインを読み込んでから保存ハンドラの有無を確認
+    # Pillowは起動時間短縮のため初回使用時に読み込む
+    from PIL import Image
+
+    Image.init()
+    return fmt["pil_format"] in Image.SAVE
+
+@lru_cache(maxsize=None)
+def enable_heif():
+    """HEIC/HEIF（iPhoneの写真）を読み込めるようPillowにプラグインを登録
+
+    プラグイン（pillow-heif）はインストールされている場合のみ使用する。
+    登録は初回の呼び出し時のみ行う（プロセスごと）。
+
+    Returns:
+        bool: HEIC/HEIFを読み込める場合はTrue
+    """
+    try:
+        import pillow_heif
+    except ImportError:
+        return False
+
+    # 縮小デコード（draft）ではHEIFに埋め込まれたサムネイルを使用する
+    pillow_heif.register_heif_opener(thumbnails=True)
+    return True
+
+def get_enabled_formats():
+    """設定された配信フォーマットのうち利用可能なものを優先順で取得
+
+    Returns:
+        list: フォーマット名のリスト（JPEGは常に末尾に含む）
+    """
+    formats = [name for name in PREVIEW_FORMATS if name != "jpeg" and is_format_supported(name)]
+    # どのブラウザでも表示できるようにJPEGを必ずフォールバックとして用意
+    formats.append("jpeg")
+    return formats
+
+def encode_image(img, name, quality=None):
+    """画像を指定フォーマットでエンコード
+
+    Args:
+        img (PIL.Image.Image): エンコードする画像
+        name (str): フォーマット名（jpeg/webp/avif）
+        quality (int, optional): 圧縮品質（省略時は設定のフォーマットごとの品質）
+
+    Returns:
+        bytes: エンコード済みの画像データ
+    """
+    fmt = OUTPUT_FORMATS[name]
+    if quality is None:
+        quality = get_settings().preview_quality(name)
+
+    # JPEGはアルファチャンネルを扱えないためRGBに変換
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    buffer = io.BytesIO()
+    img.save(buffer, fmt["pil_format"], quality=quality, **fmt["options"])
+    return buffer.getvalue()
+
+def parse_accept_header(accept_header):
+    """AcceptヘッダーをMIMEタイプと優先度(q値)の辞書に変換
+
+    Args:
+        accept_header (str): HTTPのAcceptヘッダー
+
+    Returns:
+        dict: {MIMEタイプ: q値}
+    """
+    accepted = {}
+    for part in (accept_header or "").split(","):
+        pieces = [p.strip() for p in part.split(";")]
+        mime = pieces[0].lower()
+        if not mime:
+            continue
+
+        q = 1.0
+        for param in pieces[1:]:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        accepted[mime] = q
+
+    return accepted
+
+def negotiate_format(accept_header, available):
+    """Acceptヘッダーに応じて配信するフォーマットを決定
+
+    WebP/AVIFはブラウザが明示的に受け入れを宣言した場合のみ選択し、
+    それ以外はJPEGにフォールバックする。
+
+    Args:
+        accept_header (str): HTTPのAcceptヘッダー
+        available (list): 配信可能なフォーマット名のリスト（優先順）
+
+    Returns:
+        str: 選択したフォーマット名（候補がない場合はNone）
+    """
+    accepted = parse_accept_header(accept_header)
+
+    for name in available:
+        if name == "jpeg":
+            continue
+        if accepted.get(OUTPUT_FORMATS[name]["mime"], 0) > 0:
+            return name
+
+    if "jpeg" in available:
+        return "jpeg"
+
+    return available[0] if available else None
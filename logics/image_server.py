@@ -0,0 +1,226 @@
+"""
+現場報告DXシステム - 画像配信モジュール
+ETag・キャッシュ制御・Range要求に対応した画像レスポンスの生成
+"""
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from loguru import logger
+from starlette.responses import Response
+
+from config import FILE_CHUNK_SIZE, ETAG_CACHE_SIZE
+
+# 画像URLはUUIDとバージョンで一意に決まるため、ブラウザに長期キャッシュさせる
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# ETagのキャッシュ（パス: (更新日時, サイズ, ETag)、使われた順。ETAG_CACHE_SIZE件まで保持）
+# 配信はファイル入出力ワーカーの複数スレッドから呼ばれるためロックで保護
+_etag_cache = OrderedDict()
+_etag_cache_lock = threading.Lock()
+
+def compute_file_hash(file_path):
+    """ファイル内容のSHA-256ハッシュを計算
+
+    Args:
+        file_path (Path): 対象ファイルのパス
+
+    Returns:
+        str: 16進数のハッシュ文字列
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_etag(file_path):
+    """ファイル内容に基づく強いETagを取得（更新日時・サイズが同じ間はキャッシュ）
+
+    Args:
+        file_path (Path): 対象ファイルのパス
+
+    Returns:
+        str: ダブルクォート付きのETag
+    """
+    file_path = str(file_path)
+    stat = Path(file_path).stat()
+
+    with _etag_cache_lock:
+        cached = _etag_cache.get(file_path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            _etag_cache.move_to_end(file_path)
+            return cached[2]
+
+    etag = f'"{compute_file_hash(file_path)[:32]}"'
+    with _etag_cache_lock:
+        _etag_cache[file_path] = (stat.st_mtime_ns, stat.st_size, etag)
+        _etag_cache.move_to_end(file_path)
+        while len(_etag_cache) > ETAG_CACHE_SIZE:
+            _etag_cache.popitem(last=False)
+    return etag
+
+def forget_etag(file_path):
+    """削除したファイルのETagキャッシュを破棄
+
+    Args:
+        file_path (Path): 対象ファイルのパス
+    """
+    with _etag_cache_lock:
+        _etag_cache.pop(str(file_path), None)
+
+def etag_matches(header_value, etag):
+    """If-None-Match / If-Rangeヘッダーが指定のETagに一致するかを判定
+
+    Args:
+        header_value (str): リクエストヘッダーの値
+        etag (str): 比較するETag
+
+    Returns:
+        bool: 一致する場合はTrue
+    """
+    if not header_value:
+        return False
+
+    if header_value.strip() == "*":
+        return True
+
+    # If-None-Matchは弱い比較のためW/接頭辞を無視する
+    candidates = [tag.strip() for tag in header_value.split(",")]
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates)
+
+def parse_range_header(header_value, file_size):
+    """Rangeヘッダーを解析して配信するバイト範囲を取得
+
+    単一範囲のみ対応。複数範囲や解釈できない指定は無視して全体を返す。
+
+    Args:
+        header_value (str): Rangeヘッダーの値（例: "bytes=0-1023"）
+        file_size (int): ファイルサイズ
+
+    Returns:
+        tuple: (開始位置, 終了位置) ※終了位置を含む。範囲指定なしの場合はNone
+
+    Raises:
+        ValueError: 範囲がファイルサイズを超えていて満たせない場合
+    """
+    if not header_value or not header_value.startswith("bytes="):
+        return None
+
+    spec = header_value[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        return None
+
+    start_str, end_str = (part.strip() for part in spec.split("-", 1))
+    try:
+        start = int(start_str) if start_str else None
+        end = int(end_str) if end_str else None
+    except ValueError:
+        return None
+
+    if start is None:
+        # 末尾からのバイト数指定（例: bytes=-500）
+        if end is None or end <= 0:
+            raise ValueError(f"範囲が空です: {header_value}")
+        start = max(file_size - end, 0)
+        end = file_size - 1
+    elif end is None or end >= file_size:
+        end = file_size - 1
+
+    if start > end or start >= file_size:
+        raise ValueError(f"範囲外の指定です: {header_value}")
+
+    return start, end
+
+class FileRangeResponse(Response):
+    """ファイルの指定範囲を分割して送信するレスポンス
+
+    ファイル全体をメモリに読み込まず、ファイル入出力ワーカーでFILE_CHUNK_SIZEずつ読み込んで送信する。
+    ASGIサーバーがhttp.response.pathsend拡張に対応している場合、ファイル全体の送信は
+    サーバーに任せる（sendfileによるカーネル内でのコピー）。
+    """
+
+    def __init__(self, path, start, end, file_size, status_code=200, headers=None, media_type=None):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.file_size = file_size
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.raw_headers.append((b"content-length", str(end - start + 1).encode("latin-1")))
+
+    def render(self, content):
+        # 本文は送信時にファイルから読み込む
+        return None
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+
+        if scope["method"].upper() == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        whole_file = self.start == 0 and self.end == self.file_size - 1
+        if whole_file and "http.response.pathsend" in scope.get("extensions", {}):
+            await send({"type": "http.response.pathsend", "path": str(self.path)})
+            return
+
+        # storageはrendererを経由してこのモジュールを読み込むため、循環を避けて送信時に読み込む
+        from logics.storage import iter_file
+
+        async for chunk in iter_file(self.path, self.start, self.end, FILE_CHUNK_SIZE):
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+def build_image_response(file_path, media_type, request_headers, extra_headers=None):
+    """キャッシュ制御・条件付き要求・Range要求に対応した画像レスポンスを作成
+
+    ファイルの確認とETagの計算でブロックするため、イベントループからはファイル入出力ワーカーで呼び出す。
+    本文はレスポンスの送信時に分割して読み込む。
+
+    Args:
+        file_path (Path): 配信するファイルのパス
+        media_type (str): Content-Type
+        request_headers (Mapping): リクエストヘッダー
+        extra_headers (dict, optional): 追加のレスポンスヘッダー（Varyなど）
+
+    Returns:
+        Response: Starletteのレスポンス
+    """
+    file_path = Path(file_path)
+    if not file_path.exists():
+        logger.warning(f"配信対象の画像が存在しません: {file_path}")
+        return Response(status_code=404)
+
+    etag = get_etag(file_path)
+    file_size = file_path.stat().st_size
+
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Accept-Ranges": "bytes"
+    }
+    if extra_headers:
+        headers.update(extra_headers)
+
+    # ブラウザのキャッシュが最新なら本文なしで返す
+    if etag_matches(request_headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    # If-Rangeが一致しない場合はRangeを無視して全体を返す
+    range_header = request_headers.get("range")
+    if_range = request_headers.get("if-range")
+    if range_header and if_range and if_range.strip() != etag:
+        range_header = None
+
+    try:
+        byte_range = parse_range_header(range_header, file_size)
+    except ValueError:
+        headers["Content-Range"] = f"bytes */{file_size}"
+        return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        return FileRangeResponse(file_path, 0, file_size - 1, file_size, 200, headers, media_type)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+    return FileRangeResponse(file_path, start, end, file_size, 206, headers, media_type)
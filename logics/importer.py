@@ -0,0 +1,233 @@
+"""
+現場報告DXシステム - フォルダ・SDカードからの一括取り込み
+カメラのSDカードなどのフォルダ内の画像を、ブラウザからのアップロードと同じ処理（元画像の保存・バナーの合成）で取り込む
+
+画像の読み込み・ハッシュ計算・バナーの合成はCPUを使うため、CPU数のプロセスで並列に処理する。
+取り込み済みの画像（内容のハッシュが同じ画像）はスキップするため、同じSDカードを何度取り込んでもよい
+（HEIC/HEIFは変換前のデータのハッシュ（source_hash）でも判定し、取り込み済みの写真は変換しない）。
+サーバーの画面に表示するには、サーバーと同じ共有ストア（SHARED_STORE）を指定する。
+
+実行方法（リポジトリのルートで実行）:
+    python -m logics.importer /media/sdcard/DCIM --user-name 山田 --location "A棟 1F" --tags 施工前
+    python -m logics.importer ./photos --workers 4 --no-render
+"""
+import os
+import sys
+import time
+import datetime
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from loguru import logger
+
+from config import IMPORT_EXTENSIONS, IMPORT_COMMIT_SIZE, IMPORT_PROGRESS_INTERVAL, get_settings
+from logics.cluster import DEFAULT_SHARED_STORE
+from logics.file_manager import ensure_folders_exist
+from logics.ingest import ingest_upload
+from logics.metadata import create_metadata
+from logics.preflight import check_image
+from logics.records import ImageRecord
+from logics.renderer import compute_content_hash, get_render_key, render_annotated
+from logics.shared_store import open_store
+from logics.utils import generate_uuid
+
+# EXIFの撮影日時（DateTimeOriginal、Exif IFD内）
+_EXIF_IFD = 0x8769
+_EXIF_DATETIME_ORIGINAL = 0x9003
+
+# 取り込み済みの画像のハッシュ（元画像と変換前のデータのハッシュ、各プロセスの起動時に設定）
+_known_hashes = frozenset()
+
+def find_images(source):
+    """フォルダ内の画像ファイルを検索（サブフォルダを含む）
+
+    Args:
+        source (Path): 取り込むフォルダ
+
+    Returns:
+        list: 画像ファイルのパスのリスト（パスの順）
+    """
+    images = []
+    for root, dirs, files in os.walk(source):
+        # 隠しフォルダ・macOSが作成する「._」ファイルなどは対象外
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in files:
+            if not name.startswith(".") and Path(name).suffix.lower() in IMPORT_EXTENSIONS:
+                images.append(Path(root) / name)
+    return sorted(images)
+
+def read_capture_time(path):
+    """撮影日時を取得（EXIFの撮影日時、ない場合はファイルの更新日時）
+
+    Args:
+        path (Path): 画像ファイルのパス
+
+    Returns:
+        str: 撮影日時（YYYY-MM-DD HH:MM:SS）
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(path) as img:
+            value = img.getexif().get_ifd(_EXIF_IFD).get(_EXIF_DATETIME_ORIGINAL)
+        if value:
+            return datetime.datetime.strptime(value.strip("\x00 "), "%Y:%m:%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
+    except Exception:
+        pass
+    return datetime.datetime.fromtimestamp(path.stat().st_mtime).strftime("%Y-%m-%d %H:%M:%S")
+
+def _init_worker(known_hashes):
+    """取り込みプロセスの初期化"""
+    global _known_hashes
+    _known_hashes = known_hashes
+    # 元画像の保存などのログは表示しない（進捗は親プロセスが表示する）
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+def import_file(path, fields, render=True):
+    """画像ファイルを1つ取り込み（取り込みプロセスで実行）
+
+    Args:
+        path (Path): 画像ファイルのパス
+        fields (dict): メタデータの入力値（user_name, location, tags, comment）
+        render (bool): メタデータを合成した画像（ZIP・Slack用）も作成する場合はTrue
+
+    Returns:
+        tuple: (結果（imported/skipped/failed）, 画像レコードの辞書（取り込んだ場合のみ）)
+    """
+    try:
+        # 画像でない・解像度が上限を超えるファイルは読み込む前にヘッダーのみで拒否
+        info, _ = check_image(path, path.name)
+        if info is None:
+            return "failed", None
+
+        content = path.read_bytes()
+        if compute_content_hash(content) in _known_hashes:
+            return "skipped", None
+
+        metadata = create_metadata(timestamp=read_capture_time(path), **fields)
+        record = ingest_upload(content, path.name, metadata, info)
+        if record is None:
+            return "failed", None
+
+        if render:
+            render_annotated(record.original_path, record.original_hash, record.metadata)
+        return "imported", record.to_dict()
+
+    except Exception as e:
+        logger.error(f"画像取り込みエラー: {path} - {str(e)}")
+        return "failed", None
+
+def import_folder(source, fields, store, workers=None, render=True, progress=None):
+    """フォルダ内の画像を並列に取り込み、アップロード済み画像リストに追加
+
+    Args:
+        source (Path): 取り込むフォルダ
+        fields (dict): メタデータの入力値（user_name, location, tags, comment）
+        store (MemoryStore or SqliteStore): 追加先のストア
+        workers (int, optional): 取り込みプロセス数（省略時はCPU数）
+        render (bool): メタデータを合成した画像も作成する場合はTrue
+        progress (callable, optional): 進捗を受け取る関数（集計結果の辞書を渡す）
+
+    Returns:
+        dict: total, imported, skipped, failed, seconds, images_per_sec
+    """
+    paths = find_images(source)
+    known_hashes = set()
+    for record in store.images.values():
+        known_hashes.add(record.original_hash)
+        if record.source_hash:
+            known_hashes.add(record.source_hash)
+    stats = {"total": len(paths), "imported": 0, "skipped": 0, "failed": 0, "seconds": 0.0, "images_per_sec": 0.0}
+    pending = {}
+
+    def commit():
+        if pending:
+            store.images.update(pending)
+            pending.clear()
+
+    started = time.perf_counter()
+    last_progress = started
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1,
+                             initializer=_init_worker, initargs=(frozenset(known_hashes),)) as executor:
+        futures = [executor.submit(import_file, path, fields, render) for path in paths]
+        for future in as_completed(futures):
+            status, data = future.result()
+            if data is not None:
+                record = ImageRecord.from_dict(data)
+                # 同じ内容の画像がフォルダ内に複数ある場合は1枚だけ追加
+                if record.original_hash in known_hashes or record.source_hash in known_hashes:
+                    status = "skipped"
+                else:
+                    known_hashes.add(record.original_hash)
+                    if record.source_hash:
+                        known_hashes.add(record.source_hash)
+                    img_uuid = generate_uuid()
+                    render_key = get_render_key(record.original_hash, record.metadata)
+                    record.preview_url = f"/images/{img_uuid}/preview?v={render_key}"
+                    pending[img_uuid] = record
+                    if len(pending) >= IMPORT_COMMIT_SIZE:
+                        commit()
+            stats[status] += 1
+
+            now = time.perf_counter()
+            stats["seconds"] = now - started
+            stats["images_per_sec"] = (stats["imported"] + stats["skipped"] + stats["failed"]) / max(now - started, 1e-9)
+            if progress and now - last_progress >= IMPORT_PROGRESS_INTERVAL:
+                last_progress = now
+                progress(stats)
+    commit()
+
+    logger.info(
+        f"一括取り込み完了: {source} - 取り込み{stats['imported']}枚 / スキップ{stats['skipped']}枚 / "
+        f"失敗{stats['failed']}枚 ({stats['images_per_sec']:.1f}枚/秒)"
+    )
+    return stats
+
+def format_progress(stats):
+    """進捗の表示文字列を作成"""
+    done = stats["imported"] + stats["skipped"] + stats["failed"]
+    return (
+        f"{done}/{stats['total']}枚 (取り込み {stats['imported']} / スキップ {stats['skipped']} / "
+        f"失敗 {stats['failed']}) {stats['images_per_sec']:.1f}枚/秒"
+    )
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="現場報告DXシステム フォルダ・SDカードからの一括取り込み")
+    parser.add_argument("source", help="取り込むフォルダ（サブフォルダを含む）")
+    parser.add_argument("--user-name", default="", help="撮影者の名前")
+    parser.add_argument("--location", default="", help="場所")
+    parser.add_argument("--tags", nargs="*", default=[], help="タグ（複数指定可）")
+    parser.add_argument("--comment", default="", help="コメント")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="取り込みプロセス数")
+    parser.add_argument("--no-render", action="store_true",
+                        help="メタデータを合成した画像（ZIP・Slack用）を作成しない（必要になった時点で作成）")
+    parser.add_argument("--shared-store", default=get_settings().shared_store or DEFAULT_SHARED_STORE,
+                        help="追加先の共有ストア（SQLite）のファイル（サーバーのSHARED_STOREと同じファイル）")
+    args = parser.parse_args(argv)
+
+    source = Path(args.source)
+    if not source.is_dir():
+        print(f"フォルダが見つかりません: {source}", file=sys.stderr)
+        return 1
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    ensure_folders_exist()
+    store = open_store(get_settings().replace(shared_store=args.shared_store))
+
+    interactive = sys.stdout.isatty()
+
+    def show(stats):
+        print(format_progress(stats), end="\r" if interactive else "\n", flush=True)
+
+    fields = {"user_name": args.user_name, "location": args.location, "tags": args.tags, "comment": args.comment}
+    stats = import_folder(source, fields, store, workers=args.workers, render=not args.no_render, progress=show)
+
+    print(format_progress(stats) + f" 所要時間 {stats['seconds']:.1f}秒")
+    if not get_settings().shared_store:
+        print(f"サーバーの画面に表示するには SHARED_STORE={args.shared_store} を指定してサーバーを起動してください")
+    return 0 if stats["failed"] == 0 else 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+現場報告DXシステム - 画像取り込みモジュール
+アップロードされた画像データを検証して元画像として保存
+"""
+import io
+from loguru import logger
+
+from config import HEIF_CONVERT_QUALITY
+from logics.preflight import FORMAT_EXTENSIONS, check_image
+from logics.records import ImageRecord
+from logics.renderer import compute_content_hash, store_original, measure_stage
+from logics.quality import try_analyze_quality
+
+def _convert_to_jpeg(img):
+    """デコード済みのHEIC/HEIF画像を元画像として保存するJPEGに変換（EXIF・カラープロファイルは引き継ぐ）
+
+    Args:
+        img (PIL.Image.Image): デコード済みの画像（向きは補正済み）
+
+    Returns:
+        bytes: JPEGの画像データ
+    """
+    options = {key: img.info[key] for key in ("exif", "icc_profile") if img.info.get(key)}
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=HEIF_CONVERT_QUALITY, **options)
+    return buffer.getvalue()
+
+def check_and_ingest(content, filename, metadata):
+    """画像を取り込めるか確認してから取り込み（ワーカーで実行）
+
+    確認（Pillowの初回読み込みを含む）もワーカーで行い、イベントループを止めない。
+
+    Args:
+        content (bytes): 画像バイナリデータ
+        filename (str): 元のファイル名
+        metadata (dict): メタデータ
+
+    Returns:
+        tuple: (画像レコード, エラーメッセージ)
+               受け付けられない・読み込めない画像の場合は(None, エラーメッセージ)
+    """
+    with measure_stage("upload", "decode"):
+        info, error = check_image(content, filename)
+    if info is None:
+        return None, error
+
+    record = ingest_upload(content, filename, metadata, info)
+    if record is None:
+        return None, "画像を読み込めませんでした"
+    return record, ""
+
+def ingest_upload(content, filename, metadata, info=None):
+    """アップロードされた画像を取り込み、画像レコードを作成
+
+    画像の形式・解像度・色の形式が受け付けられるかをヘッダーのみで確認し（logics.preflight）、元画像をそのまま保存する。
+    ピンぼけ・露出の判定用の値は縮小デコードした画像で計算してレコードに記録する（logics.quality）。
+    HEIC/HEIFは1度だけデコードしてJPEGに変換し、変換後のJPEGを元画像として保存する。
+    バナーの合成は必要になった時点で行う（logics.renderer）。
+
+    Args:
+        content (bytes): 画像バイナリデータ
+        filename (str): 元のファイル名
+        metadata (dict): メタデータ
+        info (dict, optional): 呼び出し元で確認済みの画像の情報（check_imageの戻り値、省略時はここで確認）
+
+    Returns:
+        ImageRecord: 画像レコード（preview_urlは呼び出し元で設定する、変換した場合はsource_hashに変換前のハッシュ）
+              受け付けられない画像（画像でない・形式や解像度が上限外など）の場合はNone
+    """
+    # Pillowは起動時間短縮のため初回使用時に読み込む
+    from PIL import Image
+
+    if info is None:
+        with measure_stage("upload", "decode"):
+            info, _ = check_image(content, filename)
+        if info is None:
+            return None
+
+    source_hash = None
+    try:
+        # 確認済みの形式のプラグインのみで開く
+        with Image.open(io.BytesIO(content), formats=[info["format"]]) as img:
+            if info["format"] == "HEIF":
+                # HEVCは縮小デコードできないため、変換用にフル解像度で1度だけデコードし品質判定にも使う
+                with measure_stage("upload", "decode"):
+                    img.load()
+                with measure_stage("upload", "quality"):
+                    quality = try_analyze_quality(img, filename)
+                with measure_stage("upload", "convert"):
+                    source_hash = compute_content_hash(content)
+                    content = _convert_to_jpeg(img)
+                extension = FORMAT_EXTENSIONS["JPEG"]
+            else:
+                with measure_stage("upload", "quality"):
+                    quality = try_analyze_quality(img, filename)
+                # 拡張子はファイル名ではなく判別した形式から決める（x.phpのような名前でも.jpgで保存）
+                extension = FORMAT_EXTENSIONS[info["format"]]
+    except Exception as e:
+        logger.error(f"画像読み込みエラー: {filename} - {str(e)}")
+        return None
+
+    with measure_stage("upload", "save"):
+        # HEIC/HEIFは変換後のJPEGのハッシュ（同じ写真は同じJPEGに変換されるため重複も判定できる）
+        original_hash = compute_content_hash(content)
+        original_path = store_original(content, original_hash, extension)
+
+    return ImageRecord(original_path, original_hash, metadata, filename, quality=quality, source_hash=source_hash)
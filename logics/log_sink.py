@@ -0,0 +1,333 @@
+"""
+現場報告DXシステム - ログ出力モジュール
+ログをJSON形式に整形し、バックグラウンドのスレッドでファイルに書き込む
+"""
+import os
+import sys
+import gzip
+import json
+import queue
+import shutil
+import datetime
+import threading
+from pathlib import Path
+
+from config import LOG_SAMPLE_RATES, LOG_RETENTION_DAYS, LOG_MAX_TOTAL_SIZE, LOG_MAX_FILE_SIZE, get_settings
+from logics.metrics import Counter
+from logics.tracing import current_trace_id
+
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total", "書き込み待ちが上限に達して破棄したログの件数"
+)
+LOG_RECORDS_SAMPLED_OUT = Counter(
+    "log_records_sampled_out_total", "サンプリングにより出力しなかったログの件数", labels=("sample",)
+)
+
+# JSONに含めないextraのキー（loguruの内部用・サンプリング用）
+_INTERNAL_EXTRA_KEYS = {"_json", "sample"}
+
+def format_json(record):
+    """ログレコードを1行のJSONに整形するloguruのformat関数
+
+    画像のUUID・セッションなどloguruのbind/contextualizeで付与した値と、
+    実行中のトレースIDを含める。
+
+    Args:
+        record (dict): loguruのログレコード
+
+    Returns:
+        str: loguruのフォーマット文字列
+    """
+    data = {
+        "time": record["time"].isoformat(timespec="milliseconds"),
+        "level": record["level"].name,
+        "message": record["message"],
+        "module": record["module"],
+        "function": record["function"],
+        "line": record["line"]
+    }
+
+    trace_id = current_trace_id()
+    if trace_id:
+        data["trace_id"] = trace_id
+
+    for key, value in record["extra"].items():
+        if key not in _INTERNAL_EXTRA_KEYS:
+            data[key] = value
+
+    if record["exception"] is not None:
+        data["exception"] = repr(record["exception"].value)
+
+    record["extra"]["_json"] = json.dumps(data, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
+class SamplingFilter:
+    """大量に出力されるログを間引くloguruのfilter
+
+    logger.bind(sample="zip_entry")のように種類を付けたログを、
+    LOG_SAMPLE_RATESの値Nごとに1件だけ出力する（警告以上は常に出力）。
+    """
+
+    def __init__(self, rates=None):
+        self.rates = LOG_SAMPLE_RATES if rates is None else rates
+        self.counts = {}
+
+    def __call__(self, record):
+        sample = record["extra"].get("sample")
+        if sample is None or record["level"].no >= 30:
+            return True
+
+        rate = self.rates.get(sample, 1)
+        count = self.counts.get(sample, 0)
+        self.counts[sample] = count + 1
+        if count % rate == 0:
+            return True
+
+        LOG_RECORDS_SAMPLED_OUT.inc(sample)
+        return False
+
+class BackgroundFileSink:
+    """ログをバックグラウンドのスレッドでファイルに書き込むloguruのsink
+
+    呼び出し元（イベントループ）はメモリ上のキューに入れるだけで、ファイルの書き込みを待たない。
+    キューがLOG_QUEUE_SIZE件に達した場合は、処理を止めないためにログを破棄して件数を記録する。
+    loguruは書き込みのたびにsinkのflushを呼ぶため、flushは定義しない（書き込み待ちのログはstopで書き出す）。
+    """
+
+    def __init__(self, path, queue_size=None):
+        """
+        Args:
+            path (Path): 書き込み先のファイル
+            queue_size (int, optional): 書き込み待ちの上限件数（省略時は設定のLOG_QUEUE_SIZE）
+        """
+        self.path = Path(path)
+        self.queue = queue.Queue(maxsize=queue_size or get_settings().log_queue_size)
+        self.file = None
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, message):
+        """ログを書き込み待ちに追加（ブロックしない）"""
+        try:
+            self.queue.put_nowait(str(message))
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+    def stop(self):
+        """書き込み待ちのログをすべて書き込んでから停止"""
+        self.queue.put(None)
+        self.thread.join(timeout=10)
+
+    def get_path(self):
+        """現在の書き込み先を取得（書き込みのたびに呼ばれる）"""
+        return self.path
+
+    def before_write(self, path):
+        """書き込みの直前の処理（書き込み先の切り替え・容量管理用）"""
+
+    def _write_lines(self, lines):
+        path = self.get_path()
+        if self.file is not None and self.file.name != str(path):
+            self.file.close()
+
+        self.before_write(path)
+
+        if self.file is None or self.file.closed:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.file = open(path, "a", encoding="utf-8")
+
+        self.file.write("".join(lines))
+        self.file.flush()
+
+    def _run(self):
+        try:
+            while True:
+                message = self.queue.get()
+                if message is None:
+                    self.queue.task_done()
+                    break
+
+                # 溜まっているログをまとめて書き込む
+                lines = [message]
+                stop = False
+                while True:
+                    try:
+                        message = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if message is None:
+                        stop = True
+                        self.queue.task_done()
+                        break
+                    lines.append(message)
+
+                try:
+                    self._write_lines(lines)
+                except OSError as e:
+                    # ログの書き込みに失敗してもアプリケーションは止めない
+                    print(f"ログ書き込みエラー: {str(e)}", file=sys.stderr)
+
+                for _ in lines:
+                    self.queue.task_done()
+
+                if stop:
+                    break
+        finally:
+            if self.file is not None:
+                self.file.close()
+
+class DailyFileSink(BackgroundFileSink):
+    """日付別のフォルダ（folder/YYYYMMDD/filename）に書き込むsink
+
+    日付が変わると再起動なしで新しいフォルダに切り替え、前日以前のログをgzip圧縮する。
+    LOG_RETENTION_DAYSより古い日・LOG_MAX_TOTAL_SIZEを超えた分は古い日から削除し、
+    1ファイルがLOG_MAX_FILE_SIZEを超えた場合は圧縮して新しいファイルに切り替える。
+    複数プロセスで同じログフォルダに書き込む場合、圧縮するのは自分のファイルのみで、
+    古い日の削除はprune=Trueのプロセス（1つだけ）が行う。
+    """
+
+    def __init__(self, folder, filename="app.log", queue_size=None,
+                 retention_days=LOG_RETENTION_DAYS, max_total_size=LOG_MAX_TOTAL_SIZE,
+                 max_file_size=LOG_MAX_FILE_SIZE, prune=True):
+        """
+        Args:
+            folder (Path): ログフォルダ
+            filename (str): 日付別フォルダ内のファイル名
+            queue_size (int, optional): 書き込み待ちの上限件数
+            retention_days (int): ログを残す日数
+            max_total_size (int): ログフォルダ全体の上限（バイト）
+            max_file_size (int): 1ファイルの上限（バイト）
+            prune (bool): 保持期間・合計サイズの上限による古い日の削除も行う場合はTrue
+        """
+        self.folder = Path(folder)
+        self.filename = filename
+        self.retention_days = retention_days
+        self.max_total_size = max_total_size
+        self.max_file_size = max_file_size
+        self.prune = prune
+        self.current_day = None
+        super().__init__(self.folder / self.today() / filename, queue_size)
+
+    def today(self):
+        """現在の日付（YYYYMMDD）"""
+        return datetime.datetime.now().strftime("%Y%m%d")
+
+    def get_path(self):
+        return self.folder / self.today() / self.filename
+
+    def before_write(self, path):
+        day = path.parent.name
+        if day != self.current_day:
+            # 起動時・日付変更時に前日以前のログを整理
+            self.current_day = day
+            self._maintain(day)
+        elif self.file is not None and not self.file.closed and self.file.tell() >= self.max_file_size:
+            self._roll_file(path)
+
+    def _roll_file(self, path):
+        """上限に達したファイルを圧縮し、新しいファイルに切り替え"""
+        self.file.close()
+        rolled = path.with_name(f"{path.stem}.{datetime.datetime.now():%H%M%S}{path.suffix}")
+        os.replace(path, rolled)
+        compress_file(rolled)
+        self._maintain(path.parent.name)
+
+    def _maintain(self, day):
+        maintain_log_folder(self.folder, day, self.retention_days, self.max_total_size,
+                            filename=self.filename, prune=self.prune)
+
+def compress_file(path):
+    """ファイルをgzip圧縮して元のファイルを削除
+
+    Args:
+        path (Path): 圧縮するファイル
+
+    Returns:
+        Path: 圧縮後のファイル
+    """
+    path = Path(path)
+    gz_path = path.with_name(path.name + ".gz")
+    with open(path, "rb") as src, gzip.open(gz_path, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    path.unlink()
+    return gz_path
+
+def maintain_log_folder(folder, today, retention_days=LOG_RETENTION_DAYS, max_total_size=LOG_MAX_TOTAL_SIZE,
+                        filename=None, prune=True):
+    """日付別のログフォルダを整理
+
+    前日以前の*.logを圧縮し、保持期間を過ぎた日・合計サイズの上限を超えた分を古い日から削除する。
+    当日のフォルダは削除しない。
+
+    Args:
+        folder (Path): ログフォルダ
+        today (str): 当日の日付（YYYYMMDD）
+        retention_days (int): ログを残す日数
+        max_total_size (int): ログフォルダ全体の上限（バイト）
+        filename (str, optional): 圧縮するファイル名（省略時はすべての*.log。
+                                  複数プロセスでは他のプロセスが書き込み中のファイルを圧縮しないよう自分のファイルのみ指定）
+        prune (bool): 古い日の削除も行う場合はTrue（複数プロセスでは1つのプロセスのみ）
+
+    Returns:
+        list: 削除した日付のリスト
+    """
+    folder = Path(folder)
+    if not folder.exists():
+        return []
+
+    days = sorted(
+        path for path in folder.iterdir()
+        if path.is_dir() and len(path.name) == 8 and path.name.isdigit()
+    )
+    threshold = (
+        datetime.datetime.strptime(today, "%Y%m%d") - datetime.timedelta(days=retention_days - 1)
+    ).strftime("%Y%m%d")
+
+    removed = []
+    sizes = {}
+    for day_folder in days:
+        if day_folder.name >= today:
+            if prune:
+                sizes[day_folder] = _folder_size(day_folder)
+            continue
+
+        if prune and day_folder.name < threshold:
+            shutil.rmtree(day_folder, ignore_errors=True)
+            removed.append(day_folder.name)
+            continue
+
+        log_files = [day_folder / filename] if filename else list(day_folder.glob("*.log"))
+        for log_file in log_files:
+            if not log_file.exists():
+                continue
+            try:
+                compress_file(log_file)
+            except OSError as e:
+                print(f"ログ圧縮エラー: {log_file} - {str(e)}", file=sys.stderr)
+        if prune:
+            sizes[day_folder] = _folder_size(day_folder)
+
+    if not prune:
+        return removed
+
+    # 合計サイズが上限を超えた場合は古い日から削除
+    total = sum(sizes.values())
+    for day_folder in sorted(sizes):
+        if total <= max_total_size or day_folder.name >= today:
+            break
+        shutil.rmtree(day_folder, ignore_errors=True)
+        total -= sizes[day_folder]
+        removed.append(day_folder.name)
+
+    return removed
+
+def _folder_size(folder):
+    # 他のプロセスが圧縮・削除中のファイルは途中で消えることがあるため、消えたファイルは数えない
+    total = 0
+    for path in folder.rglob("*"):
+        try:
+            if path.is_file():
+                total += path.stat().st_size
+        except FileNotFoundError:
+            continue
+    return total
@@ -9,7 +9,7 @@ from loguru import logger
 
 from config import DEFAULT_METADATA
 
-def create_metadata(user_name, location, tags=None, comment=None):
+def create_metadata(user_name, location, tags=None, comment=None, timestamp=None):
     """画像のメタデータを作成
 
     Args:
@@ -17,19 +17,27 @@ def create_metadata(user_name, location, tags=None, comment=None):
         location (str): 場所
         tags (list, optional): タグリスト
         comment (str, optional): コメント
+        timestamp (str, optional): 撮影日時（YYYY-MM-DD HH:MM:SS、オフラインで撮影して後から送信した場合。省略時は現在時刻）
 
     Returns:
-        dict: メタデータ辞書
+        dict: メタデータ辞書（画像リストにはImageRecordがMetadataに変換して保持）
     """
+    if timestamp:
+        try:
+            datetime.datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            logger.warning(f"撮影日時の形式が不正なため現在時刻を使用します: {timestamp}")
+            timestamp = None
+
     # デフォルト値をコピー
     metadata = DEFAULT_METADATA.copy()
 
     # 値を設定
-    metadata["user_name"] = user_name or "名前未設定"
-    metadata["location"] = location or "場所未設定"
+    metadata["user_name"] = user_name or DEFAULT_METADATA["user_name"]
+    metadata["location"] = location or DEFAULT_METADATA["location"]
     metadata["tags"] = tags or []
     metadata["comment"] = comment or ""
-    metadata["timestamp"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    metadata["timestamp"] = timestamp or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     return metadata
 
@@ -54,11 +62,31 @@ def validate_metadata(metadata):
 
     return True, ""
 
+def matches_filter(metadata, user_name=None, location=None, tag=None):
+    """メタデータが条件に一致するかを判定（指定しない条件は判定しない）
+
+    Args:
+        metadata (dict or Metadata): 判定するメタデータ
+        user_name (str, optional): 撮影者
+        location (str, optional): 場所
+        tag (str, optional): 含まれるタグ
+
+    Returns:
+        bool: すべての条件に一致する場合はTrue
+    """
+    if user_name and metadata.get("user_name") != user_name:
+        return False
+    if location and metadata.get("location") != location:
+        return False
+    if tag and tag not in (metadata.get("tags") or []):
+        return False
+    return True
+
 def save_metadata_to_json(metadata, output_path):
     """メタデータをJSONファイルとして保存
 
     Args:
-        metadata (dict): 保存するメタデータ
+        metadata (dict or Metadata): 保存するメタデータ
         output_path (Path): 出力先JSONファイルのパス
 
     Returns:
@@ -77,7 +105,7 @@ def save_metadata_to_json(metadata, output_path):
 
         # JSON形式で保存
         with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, ensure_ascii=False, indent=2)
+            json.dump(dict(metadata), f, ensure_ascii=False, indent=2)
 
         logger.info(f"メタデータ保存成功: {output_path}")
         return True
@@ -151,6 +179,56 @@ def format_metadata_for_slack(metadata):
 
     return "\n".join(lines)
 
+def format_report_for_slack(metadata_list, part=None, parts=None):
+    """複数の画像をまとめて送信するメッセージの本文を作成
+
+    1枚の場合はformat_metadata_for_slackと同じ内容。
+    複数の場合は全画像で共通の作業者・場所を1度だけ記載し、画像ごとの内容はファイルのタイトルに記載する。
+
+    Args:
+        metadata_list (list): 各画像のメタデータ
+        part (int, optional): 何通目のメッセージか（1から）
+        parts (int, optional): 報告全体のメッセージ数
+
+    Returns:
+        str: Slack通知用にフォーマットされたテキスト
+    """
+    if len(metadata_list) == 1:
+        return format_metadata_for_slack(metadata_list[0])
+
+    header = f"📸 【現場報告写真】 {len(metadata_list)}枚"
+    if parts and parts > 1:
+        header += f" ({part}/{parts})"
+    lines = [header]
+
+    for field, label in (("user_name", "👷 作業者"), ("location", "📍 場所")):
+        values = list(dict.fromkeys(metadata[field] for metadata in metadata_list if metadata))
+        if values:
+            lines.append(f"{label}: {', '.join(values)}")
+
+    timestamps = sorted(metadata["timestamp"] for metadata in metadata_list if metadata and metadata["timestamp"])
+    if timestamps:
+        lines.append(f"🕒 日時: {timestamps[0]} 〜 {timestamps[-1]}" if timestamps[0] != timestamps[-1] else f"🕒 日時: {timestamps[0]}")
+
+    return "\n".join(lines)
+
+def format_file_title(metadata):
+    """Slackに送信する画像ファイルのタイトルを作成（場所・タグ・日時・コメント）
+
+    Args:
+        metadata (dict): メタデータ
+
+    Returns:
+        str: タイトル
+    """
+    parts = [metadata["location"]]
+    if metadata["tags"]:
+        parts.append(", ".join(metadata["tags"]))
+    parts.append(metadata["timestamp"])
+    if metadata.get("comment"):
+        parts.append(metadata["comment"])
+    return " / ".join(part for part in parts if part)
+
 def extract_image_metadata(image_path):
     """画像ファイルからExifメタデータを抽出（将来機能）
 
@@ -0,0 +1,238 @@
+"""
+現場報告DXシステム - メトリクスモジュール
+処理段階ごとの所要時間などを集計し、Prometheusのテキスト形式で出力
+"""
+import os
+import time
+import bisect
+import threading
+
+from config import UPLOAD_FOLDER, METRICS_DURATION_BUCKETS, METRICS_SIZE_BUCKETS, METRICS_DISK_USAGE_TTL
+
+# 登録済みのメトリクス（出力順）
+_registry = []
+
+def _escape(value):
+    """ラベルの値をエスケープ"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names, values, extra=None):
+    """ラベルを {name="value",...} の形式に変換"""
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    """数値をPrometheusの表記に変換"""
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Counter:
+    """単調増加するカウンター"""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        """カウンターを加算
+
+        Args:
+            *label_values: ラベルの値（labelsと同じ順）
+            amount (int): 加算する値
+        """
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+class _Timer:
+    """withブロックの所要時間をヒストグラムに記録"""
+    __slots__ = ("histogram", "label_values", "start")
+
+    def __init__(self, histogram, label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, *self.label_values)
+        return False
+
+class Histogram:
+    """バケットごとの度数・合計・件数を集計するヒストグラム"""
+
+    def __init__(self, name, help_text, labels=(), buckets=METRICS_DURATION_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = sorted(buckets)
+        self._values = {}  # ラベルの値: [バケットごとの度数（累積前）, 合計, 件数]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, *label_values):
+        """値を記録
+
+        Args:
+            value (float): 記録する値（秒・バイトなど）
+            *label_values: ラベルの値（labelsと同じ順）
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, *label_values):
+        """withブロックの所要時間を記録するコンテキストマネージャーを取得"""
+        return _Timer(self, label_values)
+
+    def count(self, *label_values):
+        entry = self._values.get(label_values)
+        return entry[2] if entry else 0
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items())
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + [float("inf")], counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, label_values, ("le", _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Gauge:
+    """出力時に関数を呼び出して値を取得するゲージ（処理中の負荷にならない）"""
+
+    def __init__(self, name, help_text, func):
+        self.name = name
+        self.help = help_text
+        self.func = func
+        _registry.append(self)
+
+    def collect(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            lines.append(f"{self.name} {_format_value(self.func())}")
+        except Exception:
+            # 値を取得できない場合は出力しない
+            pass
+        return lines
+
+def register_gauge(name, help_text, func):
+    """ゲージを登録（同名のゲージがあれば関数を置き換え）
+
+    Args:
+        name (str): メトリクス名
+        help_text (str): 説明
+        func (callable): 値を返す関数
+
+    Returns:
+        Gauge: 登録したゲージ
+    """
+    for metric in _registry:
+        if metric.name == name:
+            metric.func = func
+            return metric
+    return Gauge(name, help_text, func)
+
+def render_metrics():
+    """登録済みのメトリクスをPrometheusのテキスト形式で出力
+
+    Returns:
+        str: テキスト形式のメトリクス
+    """
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+# ディスク使用量（走査は重いため一定時間キャッシュ）
+_disk_usage_cache = {"expires": 0.0, "bytes": 0, "files": 0}
+
+def get_disk_usage(folder=None):
+    """フォルダ内のファイルの合計サイズと数を取得（METRICS_DISK_USAGE_TTL秒キャッシュ）
+
+    Args:
+        folder (Path, optional): 対象フォルダ（省略時はUPLOAD_FOLDER）
+
+    Returns:
+        tuple: (合計バイト数, ファイル数)
+    """
+    now = time.monotonic()
+    if folder is None and now < _disk_usage_cache["expires"]:
+        return _disk_usage_cache["bytes"], _disk_usage_cache["files"]
+
+    total = 0
+    files = 0
+    stack = [str(folder or UPLOAD_FOLDER)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+                        files += 1
+        except OSError:
+            continue
+
+    if folder is None:
+        _disk_usage_cache.update(expires=now + METRICS_DISK_USAGE_TTL, bytes=total, files=files)
+    return total, files
+
+# 画像処理の段階ごとの所要時間
+# pipeline: upload（取り込み）/ annotated（ZIP・Slack用の合成）/ web（プレビュー・サムネイル）
+# stage: decode / quality / overlay / encode / save
+STAGE_DURATION = Histogram(
+    "photo_stage_duration_seconds", "画像処理の段階ごとの所要時間（秒）", labels=("pipeline", "stage")
+)
+
+# Slack API
+SLACK_REQUEST_DURATION = Histogram(
+    "slack_request_duration_seconds", "Slack APIリクエストの所要時間（秒）", labels=("method",)
+)
+SLACK_REQUESTS = Counter(
+    "slack_requests_total", "Slack APIリクエスト数（statusはHTTPステータスまたはerror、okはAPIの応答結果）",
+    labels=("method", "status", "ok")
+)
+
+# ZIP作成
+ZIP_BUILD_DURATION = Histogram("zip_build_duration_seconds", "ZIP作成の所要時間（秒）")
+ZIP_SIZE_BYTES = Histogram("zip_size_bytes", "作成したZIPファイルのサイズ（バイト）", buckets=METRICS_SIZE_BUCKETS)
+
+# 保存フォルダの使用量
+Gauge("upload_folder_bytes", "UPLOAD_FOLDER内のファイルの合計サイズ（バイト）", lambda: get_disk_usage()[0])
+Gauge("upload_folder_files", "UPLOAD_FOLDER内のファイル数", lambda: get_disk_usage()[1])
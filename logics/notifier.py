@@ -2,93 +2,216 @@
 現場報告DXシステム - Slack通知モジュール
 画像とメタデータをSlackに送信
 """
-import os
-import aiohttp
+import json
+import time
 import asyncio
 from pathlib import Path
 from loguru import logger
-from dotenv import load_dotenv
 
-from logics.metadata import format_metadata_for_slack
+from config import SLACK_FILES_PER_MESSAGE, get_settings
+from logics.metadata import format_report_for_slack, format_file_title
+from logics.metrics import SLACK_REQUEST_DURATION, SLACK_REQUESTS
+from logics.storage import file_size, iter_file
+from logics.tracing import span, image_span
 
-# 環境変数のロード
-load_dotenv()
+def _record_request(method, started, status, ok):
+    """Slack APIリクエストの所要時間と結果をメトリクスに記録"""
+    SLACK_REQUEST_DURATION.observe(time.perf_counter() - started, method)
+    SLACK_REQUESTS.inc(method, str(status), "true" if ok else "false")
 
-# Slack設定
-SLACK_TOKEN = os.getenv("SLACK_TOKEN", "")
-SLACK_CHANNEL = os.getenv("SLACK_CHANNEL", "")
-SLACK_ENABLED = os.getenv("SLACK_ENABLED", "false").lower() == "true"
-
-async def send_slack_notification(img_path, metadata=None):
-    """画像とメタデータをSlackに送信
-
-    Args:
-        img_path (str): 送信する画像ファイルのパス
-        metadata (dict, optional): 送信するメタデータ
-
-    Returns:
-        bool: 送信成功時はTrue
-    """
+def _check_settings(settings):
+    """Slackに送信できる設定かを確認"""
     # Slack機能が無効な場合
-    if not SLACK_ENABLED:
+    if not settings.slack_enabled:
         logger.warning("Slack機能は無効です。config.pyまたは.envで有効化してください")
         return False
 
     # トークンやチャンネルが未設定の場合
-    if not SLACK_TOKEN or not SLACK_CHANNEL:
+    if not settings.slack_token or not settings.slack_channel:
         logger.error("SlackトークンまたはチャンネルIDが設定されていません")
         return False
 
-    # 画像ファイルの存在確認
-    img_path = Path(img_path)
-    if not img_path.exists():
-        logger.error(f"送信する画像が存在しません: {img_path}")
-        return False
+    return True
+
+async def _call_api(session, settings, method, data):
+    """Slack Web APIを呼び出し（application/x-www-form-urlencoded）
+
+    Args:
+        session (aiohttp.ClientSession): HTTPセッション
+        settings (Settings): 設定
+        method (str): APIメソッド名
+        data (dict): 引数
 
+    Returns:
+        dict: 応答（通信エラーの場合は{"ok": False, "error": エラー内容}）
+    """
+    started = time.perf_counter()
+    status, ok = "error", False
     try:
-        # メタデータがあればフォーマット
-        text = format_metadata_for_slack(metadata) if metadata else "現場報告写真"
+        async with session.post(
+            f"{settings.slack_api_base}/{method}",
+            headers={"Authorization": f"Bearer {settings.slack_token}"},
+            data=data
+        ) as response:
+            status = response.status
+            response_data = await response.json()
+            ok = response_data.get("ok", False)
+            return response_data
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+    finally:
+        _record_request(method, started, status, ok)
 
-        # POSTリクエストの準備
-        headers = {
-            "Authorization": f"Bearer {SLACK_TOKEN}"
-        }
+async def _upload_file(session, settings, img_path, title):
+    """画像を1枚アップロード（チャンネルへの共有はfiles.completeUploadExternalでまとめて行う）
 
-        # ファイルアップロード用データ
-        file_name = img_path.name
+    files.getUploadURLExternalでアップロード先を取得し、本文を送信する。
+    本文はファイル入出力ワーカーで分割して読み込みながら送信する（イベントループを止めない）。
 
-        # multipart/form-dataとしてアップロード
-        async with aiohttp.ClientSession() as session:
-            # ファイル送信用のフォームデータを作成
-            with open(img_path, "rb") as f:
-                form_data = aiohttp.FormData()
-                form_data.add_field(
-                    name="file",
-                    value=f,
-                    filename=file_name,
-                    content_type="image/jpeg"
-                )
-                form_data.add_field("channels", SLACK_CHANNEL)
-                form_data.add_field("initial_comment", text)
-
-                # ファイルアップロードAPIを呼び出し
-                async with session.post(
-                    "https://slack.com/api/files.upload",
-                    headers=headers,
-                    data=form_data
-                ) as response:
-                    response_data = await response.json()
+    Args:
+        session (aiohttp.ClientSession): HTTPセッション
+        settings (Settings): 設定
+        img_path (Path): 画像ファイルのパス
+        title (str): ファイルのタイトル
 
-                    if not response_data.get("ok", False):
-                        logger.error(f"Slack送信エラー: {response_data.get('error', '不明なエラー')}")
-                        return False
+    Returns:
+        dict: {"id": ファイルID, "title": タイトル}（失敗時はNone）
+    """
+    with span("slack.upload_file", file=img_path.name):
+        length = await file_size(img_path)
+        if length is None:
+            logger.error(f"送信する画像が存在しません: {img_path}")
+            return None
+
+        response_data = await _call_api(session, settings, "files.getUploadURLExternal", {
+            "filename": img_path.name,
+            "length": str(length)
+        })
+        if not response_data.get("ok"):
+            logger.error(f"Slackアップロード先の取得エラー: {img_path.name} - {response_data.get('error', '不明なエラー')}")
+            return None
+
+        started = time.perf_counter()
+        status = "error"
+        try:
+            async with session.post(
+                response_data["upload_url"],
+                data=iter_file(img_path),
+                headers={"Content-Length": str(length)}
+            ) as response:
+                status = response.status
+        except Exception as e:
+            logger.error(f"Slackアップロードエラー: {img_path.name} - {str(e)}")
+        finally:
+            _record_request("upload_url", started, status, status == 200)
 
-        logger.info(f"Slack送信成功: {img_path}")
-        return True
+        if status != 200:
+            logger.error(f"Slackアップロードエラー: {img_path.name} - HTTP {status}")
+            return None
+
+    return {"id": response_data["file_id"], "title": title}
+
+async def send_slack_report(image_paths, metadata_list=None, image_uuids=None, progress_callback=None):
+    """複数の画像を1つの報告としてSlackに送信
+
+    画像は並列（SLACK_UPLOAD_CONCURRENCY枚ずつ）にアップロードし、
+    SLACK_FILES_PER_MESSAGE枚ごとに1つのメッセージとしてチャンネルに共有する。
+
+    Args:
+        image_paths (list): 送信する画像パスのリスト
+        metadata_list (list, optional): 各画像に対応するメタデータのリスト
+        image_uuids (list, optional): 各画像のUUID（トレースに記録する場合）
+        progress_callback (callable, optional): 画像のアップロードが終わるたびに(完了数, 全体数)で呼ばれる関数
+
+    Returns:
+        tuple: (成功数, 失敗数)
+    """
+    settings = get_settings()
+    total = len(image_paths)
+    if not total:
+        return 0, 0
+    if not _check_settings(settings):
+        return 0, total
+
+    metadata_list = list(metadata_list or [])
+    metadata_list += [None] * (total - len(metadata_list))
+    image_uuids = list(image_uuids or [])
+    image_uuids += [None] * (total - len(image_uuids))
+
+    # aiohttpは起動時間短縮のため初回送信時に読み込む
+    import aiohttp
+
+    semaphore = asyncio.Semaphore(settings.slack_upload_concurrency)
+    completed = 0
+
+    async def upload(session, img_path, metadata, image_uuid):
+        nonlocal completed
+        img_path = Path(img_path)
+        title = format_file_title(metadata) if metadata else img_path.name
+        async with semaphore:
+            if image_uuid:
+                with image_span("send_slack_notification", image_uuid):
+                    uploaded = await _upload_file(session, settings, img_path, title)
+            else:
+                uploaded = await _upload_file(session, settings, img_path, title)
+
+        completed += 1
+        if progress_callback:
+            progress_callback(completed, total)
+        return uploaded
+
+    success_count = 0
+    parts = (total + SLACK_FILES_PER_MESSAGE - 1) // SLACK_FILES_PER_MESSAGE
+    try:
+        async with aiohttp.ClientSession() as session:
+            for part in range(parts):
+                start = part * SLACK_FILES_PER_MESSAGE
+                end = start + SLACK_FILES_PER_MESSAGE
+                if part:
+                    # Slack APIレート制限対策のため少し待機（送信間隔は再起動せずに変更できるため毎回取得する）
+                    await asyncio.sleep(get_settings().slack_send_interval)
+
+                uploaded = await asyncio.gather(*(
+                    upload(session, *item)
+                    for item in zip(image_paths[start:end], metadata_list[start:end], image_uuids[start:end])
+                ))
+                succeeded = [(item, metadata) for item, metadata in zip(uploaded, metadata_list[start:end]) if item]
+                if not succeeded:
+                    continue
+
+                # アップロードできた画像を1つのメッセージとしてチャンネルに共有
+                files = [item for item, _ in succeeded]
+                reported = [metadata for _, metadata in succeeded if metadata]
+                text = format_report_for_slack(reported, part + 1, parts) if reported else "現場報告写真"
+                response_data = await _call_api(session, settings, "files.completeUploadExternal", {
+                    "files": json.dumps(files, ensure_ascii=False),
+                    "channel_id": settings.slack_channel,
+                    "initial_comment": text
+                })
+                if not response_data.get("ok"):
+                    logger.error(f"Slack送信エラー: {response_data.get('error', '不明なエラー')}")
+                    continue
+
+                success_count += len(files)
+                logger.info(f"Slack送信成功: {len(files)}枚 ({part + 1}/{parts})")
 
     except Exception as e:
         logger.error(f"Slack送信エラー: {str(e)}")
-        return False
+
+    return success_count, total - success_count
+
+async def send_slack_notification(img_path, metadata=None):
+    """画像とメタデータをSlackに送信
+
+    Args:
+        img_path (str): 送信する画像ファイルのパス
+        metadata (dict, optional): 送信するメタデータ
+
+    Returns:
+        bool: 送信成功時はTrue
+    """
+    success_count, _ = await send_slack_report([img_path], [metadata])
+    return success_count == 1
 
 async def send_slack_message(message):
     """テキストメッセージをSlackに送信
@@ -99,40 +222,44 @@ async def send_slack_message(message):
     Returns:
         bool: 送信成功時はTrue
     """
-    # Slack機能が無効な場合
-    if not SLACK_ENABLED:
-        logger.warning("Slack機能は無効です。config.pyまたは.envで有効化してください")
-        return False
-
-    # トークンやチャンネルが未設定の場合
-    if not SLACK_TOKEN or not SLACK_CHANNEL:
-        logger.error("SlackトークンまたはチャンネルIDが設定されていません")
+    settings = get_settings()
+    if not _check_settings(settings):
         return False
 
     try:
         # POSTリクエストの準備
         headers = {
-            "Authorization": f"Bearer {SLACK_TOKEN}",
+            "Authorization": f"Bearer {settings.slack_token}",
             "Content-Type": "application/json"
         }
 
         data = {
-            "channel": SLACK_CHANNEL,
+            "channel": settings.slack_channel,
             "text": message
         }
 
+        # aiohttpは起動時間短縮のため初回送信時に読み込む
+        import aiohttp
+
         # API呼び出し
         async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://slack.com/api/chat.postMessage",
-                headers=headers,
-                json=data
-            ) as response:
-                response_data = await response.json()
+            started = time.perf_counter()
+            status, ok = "error", False
+            try:
+                async with session.post(
+                    f"{settings.slack_api_base}/chat.postMessage",
+                    headers=headers,
+                    json=data
+                ) as response:
+                    status = response.status
+                    response_data = await response.json()
+                    ok = response_data.get("ok", False)
+            finally:
+                _record_request("chat.postMessage", started, status, ok)
 
-                if not response_data.get("ok", False):
-                    logger.error(f"Slackメッセージ送信エラー: {response_data.get('error', '不明なエラー')}")
-                    return False
+            if not ok:
+                logger.error(f"Slackメッセージ送信エラー: {response_data.get('error', '不明なエラー')}")
+                return False
 
         logger.info(f"Slackメッセージ送信成功")
         return True
@@ -151,23 +278,7 @@ async def send_bulk_to_slack(image_paths, metadata_list=None):
     Returns:
         tuple: (成功数, 失敗数)
     """
-    success_count = 0
-    failure_count = 0
-
-    # 各画像を順番に送信
-    for i, img_path in enumerate(image_paths):
-        # 対応するメタデータがあれば使用
-        metadata = metadata_list[i] if metadata_list and i < len(metadata_list) else None
-
-        # 送信
-        if await send_slack_notification(img_path, metadata):
-            success_count += 1
-        else:
-            failure_count += 1
-
-        # Slack APIレート制限対策のため少し待機
-        await asyncio.sleep(1)
-
+    success_count, failure_count = await send_slack_report(image_paths, metadata_list)
     logger.info(f"Slack一括送信結果: 成功={success_count}, 失敗={failure_count}")
     return success_count, failure_count
 
@@ -0,0 +1,173 @@
+"""
+現場報告DXシステム - 画像オーバーレイモジュール
+写真の上部にメタデータ（名前・場所・タグ・日時）のバナーを合成
+"""
+from collections import namedtuple
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
+from loguru import logger
+
+from config import (
+    FONT_SIZE, SMALL_FONT_SIZE, BANNER_PADDING, BANNER_LINE_HEIGHT,
+    BANNER_BASE_SIZE, BANNER_SIZE_BUCKETS, BANNER_MIN_FONT_SIZE, get_settings
+)
+from logics.utils import detect_font_path
+
+# バナーの文字色・背景色（半透明の黒）
+TEXT_COLOR = (255, 255, 255, 255)
+BACKGROUND_COLOR = (0, 0, 0, 128)
+
+# バナーのレイアウト（フォントサイズ・余白・行の高さ）
+BannerLayout = namedtuple("BannerLayout", ["font_size", "small_font_size", "padding", "line_height"])
+
+# 事前描画したバナー（静的部分のタイル・日時の描画位置・日時のフォント）
+BannerTemplate = namedtuple("BannerTemplate", ["tile", "timestamp_xy", "timestamp_font"])
+
+@lru_cache(maxsize=None)
+def load_font(size):
+    """日本語対応フォントを読み込み（サイズごとにキャッシュ）
+
+    Args:
+        size (int): フォントサイズ
+
+    Returns:
+        ImageFont: 読み込んだフォント（見つからない場合はデフォルトフォント）
+    """
+    # 設定のFONT_PATH、未設定の場合はOSごとの候補（config.FONT_PATHS）から探す
+    font_path = get_settings().font_path or detect_font_path()
+    if font_path:
+        try:
+            return ImageFont.truetype(font_path, size)
+        except IOError as e:
+            logger.warning(f"フォント読み込みエラー: {font_path} - {str(e)}")
+
+    # フォントが見つからない場合はデフォルトフォント
+    return ImageFont.load_default()
+
+def select_size_bucket(width, height):
+    """画像サイズに対応するバナーのサイズバケットを選択
+
+    Args:
+        width (int): 画像の幅
+        height (int): 画像の高さ
+
+    Returns:
+        int: 短辺以下で最大のバケット（短辺が最小バケット未満なら最小バケット）
+    """
+    short_side = min(width, height)
+    bucket = BANNER_SIZE_BUCKETS[0]
+    for size in BANNER_SIZE_BUCKETS:
+        if size <= short_side:
+            bucket = size
+    return bucket
+
+@lru_cache(maxsize=None)
+def get_banner_layout(bucket):
+    """サイズバケットに応じたバナーのレイアウトを計算
+
+    Args:
+        bucket (int): サイズバケット（短辺のpx）
+
+    Returns:
+        BannerLayout: バナーのレイアウト
+    """
+    scale = bucket / BANNER_BASE_SIZE
+    return BannerLayout(
+        font_size=max(round(FONT_SIZE * scale), BANNER_MIN_FONT_SIZE),
+        small_font_size=max(round(SMALL_FONT_SIZE * scale), BANNER_MIN_FONT_SIZE),
+        padding=max(round(BANNER_PADDING * scale), 2),
+        line_height=max(round(BANNER_LINE_HEIGHT * scale), BANNER_MIN_FONT_SIZE + 2)
+    )
+
+# キャッシュ数は起動時の設定で固定（変更は再起動後に反映）
+@lru_cache(maxsize=get_settings().banner_cache_size)
+def get_banner_template(width, bucket, user_name, location, tags, comment):
+    """メタデータの静的部分（名前・場所・タグ・コメント）を描画したバナーを取得
+
+    同じ作業者が同じ現場で撮影した写真は名前・場所・タグが共通のため、
+    バナーは1度だけ描画してキャッシュし、写真ごとには日時のみを描画する。
+
+    Args:
+        width (int): 画像の幅（バナーの幅）
+        bucket (int): サイズバケット（select_size_bucketの結果）
+        user_name (str): 名前
+        location (str): 場所
+        tags (tuple): タグ
+        comment (str): コメント
+
+    Returns:
+        BannerTemplate: 事前描画したバナー
+    """
+    layout = get_banner_layout(bucket)
+    font = load_font(layout.font_size)
+    small_font = load_font(layout.small_font_size)
+
+    # テキスト情報の作成（日時の行は写真ごとに描画するため空けておく）
+    text_lines = [
+        f"名前: {user_name}",
+        f"場所: {location}",
+        f"タグ: {', '.join(tags)}",
+        None,
+    ]
+    if comment:
+        text_lines.append(f"コメント: {comment}")
+
+    # 背景の高さを計算
+    bg_height = len(text_lines) * layout.line_height + layout.padding * 2
+
+    # 半透明の背景にテキストを描画したタイルを作成
+    tile = Image.new("RGBA", (width, bg_height), BACKGROUND_COLOR)
+    draw = ImageDraw.Draw(tile)
+
+    last_index = len(text_lines) - 1
+    timestamp_xy = None
+    timestamp_font = None
+    for i, line in enumerate(text_lines):
+        xy = (layout.padding, layout.padding + i * layout.line_height)
+        line_font = small_font if i == last_index else font
+
+        if line is None:
+            timestamp_xy = xy
+            timestamp_font = line_font
+            continue
+
+        draw.text(xy, line, font=line_font, fill=TEXT_COLOR)
+
+    return BannerTemplate(tile, timestamp_xy, timestamp_font)
+
+def add_text_to_image(img, metadata, inplace=False):
+    """画像の左上にメタデータを追加
+
+    Args:
+        img (PIL.Image.Image): 元画像
+        metadata (dict): メタデータ
+        inplace (bool): RGBの元画像に直接合成する場合はTrue（呼び出し元が他で使わない画像のみ。既定は元画像を変更しない）
+
+    Returns:
+        PIL.Image.Image: メタデータを合成したRGB画像
+    """
+    template = get_banner_template(
+        img.width,
+        select_size_bucket(img.width, img.height),
+        metadata["user_name"],
+        metadata["location"],
+        tuple(metadata["tags"]),
+        metadata["comment"]
+    )
+
+    # JPEGとして保存するためRGBに変換（変換しない場合は元画像を変更しないようコピー）
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    elif not inplace:
+        img = img.copy()
+
+    # 事前描画したバナーを貼り付け、日時の1行だけを描画
+    img.paste(template.tile, (0, 0), template.tile)
+    ImageDraw.Draw(img).text(
+        template.timestamp_xy,
+        f"日時: {metadata['timestamp']}",
+        font=template.timestamp_font,
+        fill=TEXT_COLOR
+    )
+
+    return img
@@ -0,0 +1,135 @@
+"""
+現場報告DXシステム - 取り込み前の画像の確認モジュール
+画像のヘッダーのみを読み込み（デコードしない）、形式・解像度・色の形式が受け付けられるかを確認
+
+画素数の大きい画像（数KBのファイルでも展開すると数GBになる画像）や画像でないファイルを、
+ワーカーでデコードしてメモリを使い切る前に拒否する。
+"""
+import io
+from pathlib import Path
+from loguru import logger
+
+from config import ALLOWED_IMAGE_MODES, get_settings
+from logics.image_formats import enable_heif
+
+# ファイルの先頭のバイト列と画像形式（PillowのImage.format）
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+)
+
+# HEIC/HEIF（ISO BMFFのftypボックス）のブランド
+_HEIF_BRANDS = {b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis", b"hevm", b"hevs", b"mif1", b"msf1"}
+
+# 画像形式ごとの保存時の拡張子（元画像はクライアントが付けたファイル名ではなく判別した形式の拡張子で保存）
+FORMAT_EXTENSIONS = {
+    "JPEG": ".jpg",
+    "PNG": ".png",
+    "WEBP": ".webp",
+    "GIF": ".gif",
+    "BMP": ".bmp",
+    "HEIF": ".heic"
+}
+
+# 形式の判別に読み込む先頭のバイト数
+SNIFF_BYTES = 32
+
+def sniff_format(head):
+    """ファイルの先頭のバイト列から画像形式を判別（Pillowを使わない）
+
+    Args:
+        head (bytes): ファイルの先頭（SNIFF_BYTESバイト以上）
+
+    Returns:
+        str: 画像形式（JPEG/PNG/WEBP/GIF/BMP/HEIF、判別できない場合はNone）
+    """
+    # WebPはRIFFコンテナ（RIFF + サイズ4バイト + WEBP）
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    # HEIC/HEIFはISO BMFF（ボックスのサイズ4バイト + ftyp + ブランド）
+    if head[4:8] == b"ftyp" and head[8:12] in _HEIF_BRANDS:
+        return "HEIF"
+    for signature, name in _SIGNATURES:
+        if head.startswith(signature):
+            return name
+    return None
+
+def probe_image(source, settings=None):
+    """画像のヘッダーのみを読み込み、取り込めるかを確認
+
+    画素のデータはデコードしないため、画像の大きさによらず短時間で終わる。
+
+    Args:
+        source (bytes or Path): 画像バイナリデータまたは画像ファイルのパス
+        settings (Settings, optional): 設定（省略時は現在の設定）
+
+    Returns:
+        tuple: (画像の情報の辞書（format, width, height, mode）, エラーメッセージ)
+               受け付けられない場合は(None, エラーメッセージ)
+    """
+    # Pillowは起動時間短縮のため初回使用時に読み込む
+    from PIL import Image
+
+    settings = settings or get_settings()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        fp = io.BytesIO(source)
+    else:
+        fp = open(Path(source), "rb")
+
+    try:
+        image_format = sniff_format(fp.read(SNIFF_BYTES))
+        fp.seek(0)
+        if image_format is None:
+            return None, "画像ファイルではありません"
+        if image_format not in settings.image_formats:
+            return None, f"対応していない画像形式です ({image_format})"
+        if image_format == "HEIF" and not enable_heif():
+            return None, "HEIC形式の画像を読み込むにはpillow-heifのインストールが必要です"
+
+        # 判別した形式のプラグインのみでヘッダーを読み込む
+        # 画素数の上限は下で幅×高さと設定の値を比較する（Pillow全体の設定のImage.MAX_IMAGE_PIXELSは変更しない）
+        try:
+            with Image.open(fp, formats=[image_format]) as img:
+                width, height = img.size
+                mode = img.mode
+        except Image.DecompressionBombError:
+            # Pillowの上限（Image.MAX_IMAGE_PIXELSの2倍）を超える画像はワーカーでもデコードできないため拒否
+            return None, f"画像の解像度が上限（{settings.max_image_pixels}画素）を超えています"
+        except Exception:
+            return None, "画像として読み込めません"
+
+        if width <= 0 or height <= 0:
+            return None, "画像として読み込めません"
+        if max(width, height) > settings.max_image_side:
+            return None, f"画像の幅・高さが上限（{settings.max_image_side}画素）を超えています ({width}x{height})"
+        if width * height > settings.max_image_pixels:
+            return None, f"画像の解像度が上限（{settings.max_image_pixels}画素）を超えています ({width}x{height})"
+        if mode not in ALLOWED_IMAGE_MODES:
+            return None, f"対応していない色の形式です ({mode})"
+
+        return {"format": image_format, "width": width, "height": height, "mode": mode}, ""
+
+    finally:
+        fp.close()
+
+def check_image(source, filename, settings=None):
+    """画像を取り込めるかを確認し、受け付けられない場合はログに出力
+
+    Args:
+        source (bytes or Path): 画像バイナリデータまたは画像ファイルのパス
+        filename (str): ログに出力するファイル名
+        settings (Settings, optional): 設定（省略時は現在の設定）
+
+    Returns:
+        tuple: probe_imageの戻り値
+    """
+    try:
+        info, error = probe_image(source, settings)
+    except OSError as e:
+        info, error = None, f"ファイルを読み込めません ({str(e)})"
+    if info is None:
+        logger.warning(f"画像の受け付けを拒否: {filename} - {error}")
+    return info, error
@@ -0,0 +1,187 @@
+"""
+現場報告DXシステム - プロファイラーモジュール
+稼働中のサーバーのスタックを一定間隔で採取し、フレームグラフ用のfolded形式で出力
+"""
+import sys
+import time
+import threading
+from collections import Counter
+from loguru import logger
+
+from config import PROFILE_INTERVAL, PROFILE_MAX_DURATION
+
+# 待機中とみなす関数（この関数で止まっているスレッドは既定で集計しない）
+IDLE_FUNCTIONS = {"wait", "select", "poll", "accept"}
+IDLE_FRAMES = {
+    "asyncio.runners:run",                   # uvloopのイベントループ（C実装）で待機中
+    "asyncio.base_events:run_forever",
+    "concurrent.futures.thread:_worker",     # ワーカープールで処理待ち
+    "anyio._backends._asyncio:run"           # AnyIOのワーカースレッドで処理待ち
+}
+
+# プロファイルの状態
+_state = {
+    "thread": None,
+    "stop_event": None,
+    "samples": Counter(),
+    "sample_count": 0,
+    "started_at": None,
+    "finished_at": None,
+    "duration": 0.0,
+    "interval": PROFILE_INTERVAL
+}
+_state_lock = threading.Lock()
+
+# 段階ごとの所要時間をログに出力するか（実行中に切り替え可能）
+_stage_timing = {"enabled": False}
+
+def _frame_label(frame):
+    """フレームを「モジュール:関数」の表記に変換"""
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{frame.f_code.co_name}"
+
+def _is_idle(frame):
+    """待機中のスレッドかどうか"""
+    return frame.f_code.co_name in IDLE_FUNCTIONS or _frame_label(frame) in IDLE_FRAMES
+
+def _sample_loop(stop_event, interval, deadline, include_idle):
+    """スタックを採取するスレッドの処理"""
+    own_ident = threading.get_ident()
+    thread_names = {}
+
+    while not stop_event.wait(interval) and time.monotonic() < deadline:
+        frames = sys._current_frames()
+        if len(thread_names) != len(frames):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        stacks = []
+        for ident, frame in frames.items():
+            if ident == own_ident:
+                continue
+            if not include_idle and _is_idle(frame):
+                continue
+
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(thread_names.get(ident, str(ident)))
+            stacks.append(";".join(reversed(labels)))
+
+        with _state_lock:
+            _state["samples"].update(stacks)
+            _state["sample_count"] += 1
+
+    with _state_lock:
+        _state["finished_at"] = time.time()
+    logger.info(f"プロファイル終了: {_state['sample_count']}回採取")
+
+def start_profiling(duration=30, interval=PROFILE_INTERVAL, include_idle=False):
+    """スタックの採取を開始（duration秒後に自動で終了）
+
+    Args:
+        duration (float): 採取する時間（秒、PROFILE_MAX_DURATIONまで）
+        interval (float): 採取の間隔（秒）
+        include_idle (bool): 待機中のスレッドも集計するか
+
+    Returns:
+        bool: 開始した場合はTrue（採取中の場合はFalse）
+    """
+    duration = min(max(float(duration), 0.1), PROFILE_MAX_DURATION)
+    interval = max(float(interval), 0.001)
+
+    with _state_lock:
+        if is_profiling():
+            return False
+
+        stop_event = threading.Event()
+        _state.update(
+            stop_event=stop_event,
+            samples=Counter(),
+            sample_count=0,
+            started_at=time.time(),
+            finished_at=None,
+            duration=duration,
+            interval=interval
+        )
+        _state["thread"] = threading.Thread(
+            target=_sample_loop,
+            args=(stop_event, interval, time.monotonic() + duration, include_idle),
+            name="profiler",
+            daemon=True
+        )
+        _state["thread"].start()
+
+    logger.info(f"プロファイル開始: {duration}秒間, 間隔{interval}秒")
+    return True
+
+def stop_profiling():
+    """スタックの採取を終了
+
+    Returns:
+        dict: 採取結果の概要（get_profile_statusと同じ）
+    """
+    thread = _state["thread"]
+    if thread is not None and thread.is_alive():
+        _state["stop_event"].set()
+        thread.join(timeout=5)
+    return get_profile_status()
+
+def is_profiling():
+    """採取中かどうか"""
+    thread = _state["thread"]
+    return thread is not None and thread.is_alive()
+
+def get_profile_status(top=20):
+    """採取の状態と、多く採取された関数の一覧を取得
+
+    Args:
+        top (int): 一覧に含める関数の数
+
+    Returns:
+        dict: running, started_at, finished_at, duration, interval, samples, top_functions
+    """
+    with _state_lock:
+        samples = dict(_state["samples"])
+        status = {
+            "running": is_profiling(),
+            "started_at": _state["started_at"],
+            "finished_at": _state["finished_at"],
+            "duration": _state["duration"],
+            "interval": _state["interval"],
+            "samples": _state["sample_count"]
+        }
+
+    # スタックの末尾（実行中の関数）ごとの集計
+    leaf_counts = Counter()
+    for stack, count in samples.items():
+        leaf_counts[stack.rsplit(";", 1)[-1]] += count
+    status["top_functions"] = [
+        {"function": function, "samples": count} for function, count in leaf_counts.most_common(top)
+    ]
+    return status
+
+def get_folded_profile():
+    """採取したスタックをfolded形式で取得
+
+    flamegraph.pl・speedscope・inferno などでフレームグラフとして表示できる。
+
+    Returns:
+        str: 1行に「スレッド名;呼び出し元;...;関数 回数」
+    """
+    with _state_lock:
+        samples = sorted(_state["samples"].items())
+    return "".join(f"{stack} {count}\n" for stack, count in samples)
+
+def set_stage_timing(enabled):
+    """段階ごとの所要時間のログ出力を切り替え
+
+    Args:
+        enabled (bool): 出力する場合はTrue
+    """
+    _stage_timing["enabled"] = bool(enabled)
+    logger.info(f"段階ごとの所要時間のログ出力: {'有効' if enabled else '無効'}")
+
+def is_stage_timing_enabled():
+    """段階ごとの所要時間をログに出力するか"""
+    return _stage_timing["enabled"]
@@ -0,0 +1,119 @@
+"""
+現場報告DXシステム - 画像の品質判定モジュール
+ピンぼけ（ラプラシアンの分散）と露出（明るさのヒストグラム）を取り込み時に計算し、品質の低い写真を判定
+
+縮小したグレースケール画像をNumPyでまとめて計算するため、1枚あたり数ミリ秒で判定できる。
+"""
+from loguru import logger
+
+from config import QUALITY_ANALYSIS_SIZE, QUALITY_CLIP_LEVELS, get_settings
+
+# 品質の問題の表示名（画面の表示・Slack/ZIPから除外した際の通知）
+QUALITY_LABELS = {
+    "blurry": "ピンぼけ",
+    "dark": "暗い",
+    "overexposed": "明るすぎ"
+}
+
+def analyze_quality(img):
+    """画像のシャープネスと露出を計算
+
+    JPEGは縮小デコード（draft）で読み込むため、フル解像度のデコードより大幅に軽い。
+    読み込み前（Image.openの直後）の画像を渡すこと。
+
+    Args:
+        img (PIL.Image.Image): 対象画像
+
+    Returns:
+        dict: sharpness（ラプラシアンの分散、大きいほど鮮明）,
+              brightness（平均の明るさ 0〜255）,
+              dark（黒つぶれした画素の割合）, bright（白飛びした画素の割合）
+    """
+    # NumPy・Pillowは起動時間短縮のため初回使用時に読み込む
+    import numpy as np
+    from PIL import Image
+
+    size = (QUALITY_ANALYSIS_SIZE, QUALITY_ANALYSIS_SIZE)
+    # 縮小デコードは縦横とも指定の大きさ以上になる範囲で縮小するため、縦横比を合わせて指定
+    scale = QUALITY_ANALYSIS_SIZE / max(img.size)
+    img.draft("L", (round(img.width * scale), round(img.height * scale)))
+    gray = img.convert("L")
+    # 解像度によって値が変わらないよう、同じ大きさに縮小してから計算
+    gray.thumbnail(size, Image.BILINEAR)
+    pixels = np.asarray(gray)
+
+    # 4近傍のラプラシアン（隣接画素との差）の分散
+    center = pixels[1:-1, 1:-1].astype(np.float32)
+    laplacian = (
+        pixels[:-2, 1:-1].astype(np.float32) + pixels[2:, 1:-1] + pixels[1:-1, :-2] + pixels[1:-1, 2:]
+        - 4 * center
+    )
+
+    histogram = np.bincount(pixels.ravel(), minlength=256)
+    total = max(int(histogram.sum()), 1)
+    dark_level, bright_level = QUALITY_CLIP_LEVELS
+
+    return {
+        "sharpness": round(float(laplacian.var()), 1) if laplacian.size else 0.0,
+        "brightness": round(float(np.dot(histogram, np.arange(256)) / total), 1),
+        "dark": round(float(histogram[:dark_level + 1].sum() / total), 3),
+        "bright": round(float(histogram[bright_level:].sum() / total), 3)
+    }
+
+def try_analyze_quality(img, filename=""):
+    """画像の品質を計算（失敗しても取り込みは止めない）
+
+    Args:
+        img (PIL.Image.Image): 対象画像
+        filename (str, optional): ログに出力するファイル名
+
+    Returns:
+        dict: analyze_qualityの戻り値（計算できない場合はNone）
+    """
+    try:
+        return analyze_quality(img)
+    except Exception as e:
+        logger.warning(f"画像の品質判定エラー: {filename} - {str(e)}")
+        return None
+
+def get_quality_flags(quality, settings=None):
+    """品質の問題を判定（しきい値は設定から取得するため、設定の再読み込みがすぐに反映される）
+
+    Args:
+        quality (dict): analyze_qualityの戻り値（Noneの場合は判定しない）
+        settings (Settings, optional): 設定（省略時は現在の設定）
+
+    Returns:
+        list: 問題のリスト（dark/overexposed/blurryのいずれか、問題がない場合は空）
+    """
+    if not quality:
+        return []
+    settings = settings or get_settings()
+    if quality["brightness"] < settings.quality_min_brightness or quality["dark"] > settings.quality_max_clipped:
+        return ["dark"]
+    if quality["brightness"] > settings.quality_max_brightness or quality["bright"] > settings.quality_max_clipped:
+        return ["overexposed"]
+    # 露出が極端な写真はコントラストが低くシャープネスも小さくなるため、露出に問題がない場合のみ判定
+    if quality["sharpness"] < settings.quality_min_sharpness:
+        return ["blurry"]
+    return []
+
+def format_quality_flags(flags):
+    """品質の問題を表示用の文字列に変換（例: 「ピンぼけ」）"""
+    return "・".join(QUALITY_LABELS[flag] for flag in flags)
+
+def exclude_flagged(items, settings=None):
+    """Slack送信・ZIP保存の対象から品質に問題がある写真を除外（QUALITY_EXCLUDE_FLAGGEDが有効な場合のみ）
+
+    Args:
+        items (list): (画像のUUID, ImageRecord)のリスト
+        settings (Settings, optional): 設定（省略時は現在の設定）
+
+    Returns:
+        tuple: (対象の(画像のUUID, ImageRecord)のリスト, 除外した数)
+    """
+    settings = settings or get_settings()
+    if not settings.quality_exclude_flagged:
+        return items, 0
+    kept = [(img_uuid, record) for img_uuid, record in items if not get_quality_flags(record.quality, settings)]
+    return kept, len(items) - len(kept)
@@ -0,0 +1,159 @@
+"""
+現場報告DXシステム - 画像レコードモジュール
+アップロード済み画像のレコードとメタデータを省メモリに保持（JSONの辞書形式と相互変換）
+"""
+import sys
+
+from config import DEFAULT_USERNAME, DEFAULT_LOCATION
+
+# メタデータの項目（JSON・辞書形式のキーの順）
+METADATA_FIELDS = ("user_name", "location", "tags", "comment", "timestamp")
+
+# 同じタグの組み合わせ（順序を含む）で共有するタプル
+_shared_tags = {}
+
+def share_tags(tags):
+    """タグのリストを共有のタプルに変換（同じ組み合わせのレコードは同じタプルを参照）
+
+    Args:
+        tags (list): タグのリスト
+
+    Returns:
+        tuple: タグのタプル（指定した順のまま）
+    """
+    key = tuple(sys.intern(tag) for tag in tags or ())
+    return _shared_tags.setdefault(key, key)
+
+class Metadata:
+    """画像のメタデータ（名前・場所・タグ・コメント・日時）
+
+    名前・場所は同じ現場の写真で共通のため文字列をinternして共有し、
+    タグは同じ組み合わせのレコードで共有するタプルで保持する（指定した順のまま）。
+    読み取りは辞書と同じ形式（metadata["tags"]など）でも行える。
+    画面・APIなどレコードの外に渡す場合はto_dictで辞書に変換する。
+    """
+    __slots__ = ("user_name", "location", "tag_tuple", "comment", "timestamp")
+
+    def __init__(self, user_name=None, location=None, tags=None, comment=None, timestamp=None):
+        # 未入力の名前・場所はデフォルト値
+        self.user_name = sys.intern(user_name or DEFAULT_USERNAME)
+        self.location = sys.intern(location or DEFAULT_LOCATION)
+        self.tag_tuple = share_tags(tags)
+        self.comment = comment or ""
+        self.timestamp = timestamp or ""
+
+    @property
+    def tags(self):
+        """タグのリスト（指定した順、共有のタプルを変更しないよう毎回新しいリスト）"""
+        return list(self.tag_tuple)
+
+    @classmethod
+    def from_dict(cls, data):
+        """辞書（JSON形式）からメタデータを作成
+
+        Args:
+            data (dict): メタデータの辞書
+
+        Returns:
+            Metadata: メタデータ
+        """
+        if isinstance(data, cls):
+            return data
+        return cls(
+            user_name=data.get("user_name"),
+            location=data.get("location"),
+            tags=data.get("tags"),
+            comment=data.get("comment"),
+            timestamp=data.get("timestamp")
+        )
+
+    def to_dict(self):
+        """辞書（JSON形式）に変換
+
+        Returns:
+            dict: user_name, location, tags, comment, timestamp
+        """
+        return {key: self[key] for key in METADATA_FIELDS}
+
+    # 辞書と同じ形式での読み取り（メタデータを辞書で受け取る関数でそのまま使えるように）
+    def __getitem__(self, key):
+        if key not in METADATA_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in METADATA_FIELDS
+
+    def get(self, key, default=None):
+        return self[key] if key in METADATA_FIELDS else default
+
+    def keys(self):
+        return METADATA_FIELDS
+
+    def __eq__(self, other):
+        if isinstance(other, (Metadata, dict)):
+            return self.to_dict() == Metadata.from_dict(other).to_dict()
+        return NotImplemented
+
+    def __repr__(self):
+        return f"Metadata({self.to_dict()!r})"
+
+class ImageRecord:
+    """アップロード済み画像のレコード"""
+    __slots__ = ("original_path", "original_hash", "metadata", "preview_url", "filename", "quality", "source_hash")
+
+    def __init__(self, original_path, original_hash, metadata, filename, preview_url=None, quality=None,
+                 source_hash=None):
+        self.original_path = str(original_path)
+        self.original_hash = original_hash
+        self.metadata = Metadata.from_dict(metadata)
+        self.filename = filename
+        self.preview_url = preview_url
+        # 取り込み時に計算した品質（logics.quality.analyze_qualityの戻り値、計算していない場合はNone）
+        # バナーに表示する項目ではないため、作成済み画像のキャッシュキーに影響しないようmetadataとは分けて保持
+        self.quality = quality
+        # HEIC/HEIFをJPEGに変換して保存した場合の変換前のデータのハッシュ（変換していない場合はNone）
+        # 一括取り込みで、変換せずに取り込み済みの写真を判定するために使用する
+        self.source_hash = source_hash
+
+    @classmethod
+    def from_dict(cls, data):
+        """辞書（JSON形式）からレコードを作成
+
+        Args:
+            data (dict): original_path, original_hash, metadata, filename, preview_url, quality, source_hash
+
+        Returns:
+            ImageRecord: レコード
+        """
+        return cls(
+            original_path=data["original_path"],
+            original_hash=data["original_hash"],
+            metadata=data.get("metadata") or {},
+            filename=data.get("filename", ""),
+            preview_url=data.get("preview_url"),
+            quality=data.get("quality"),
+            source_hash=data.get("source_hash")
+        )
+
+    def to_dict(self):
+        """辞書（JSON形式）に変換
+
+        Returns:
+            dict: original_path, original_hash, metadata, preview_url, filename, quality
+                  （変換して保存した画像はsource_hashも含む）
+        """
+        data = {
+            "original_path": self.original_path,
+            "original_hash": self.original_hash,
+            "metadata": self.metadata.to_dict(),
+            "preview_url": self.preview_url,
+            "filename": self.filename,
+            "quality": self.quality
+        }
+        if self.source_hash:
+            data["source_hash"] = self.source_hash
+        return data
+
+    def __repr__(self):
+        return f"ImageRecord({self.to_dict()!r})"
@@ -0,0 +1,303 @@
+"""
+現場報告DXシステム - 画像レンダリングモジュール
+元画像を保持し、メタデータ付き画像・プレビュー画像を必要になった時点で作成してキャッシュ
+"""
+import os
+import io
+import json
+import hashlib
+import time
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from loguru import logger
+
+from config import (
+    ORIGINAL_FOLDER, RENDER_CACHE_FOLDER, PREVIEW_FOLDER,
+    PREVIEW_SIZES, BANNER_LAYOUT_VERSION, get_settings
+)
+from logics.image_formats import OUTPUT_FORMATS, encode_image
+from logics.image_server import forget_etag
+from logics.metrics import STAGE_DURATION
+from logics.profiler import is_stage_timing_enabled
+from logics.tracing import span
+
+# 同じ画像を複数のリクエストから同時に作成しないためのロック（出力パス: [ロック, ロックを待っている・保持している数]）
+_render_locks = {}
+_render_locks_guard = threading.Lock()
+
+@contextmanager
+def measure_stage(pipeline, stage, span_name=None):
+    """処理段階の所要時間をメトリクスとトレースのスパンに記録
+
+    Args:
+        pipeline (str): 処理の種類（upload/annotated/web）
+        stage (str): 処理段階（decode/quality/convert/overlay/encode/save）
+        span_name (str, optional): スパン名（省略時はstage）
+    """
+    with STAGE_DURATION.time(pipeline, stage) as timer, span(span_name or stage, pipeline=pipeline):
+        yield
+
+    # 管理者用APIで有効にした場合のみ、段階ごとの所要時間をログに出力
+    if is_stage_timing_enabled():
+        duration_ms = round((time.perf_counter() - timer.start) * 1000, 2)
+        logger.bind(pipeline=pipeline, stage=stage, duration_ms=duration_ms).info(
+            f"処理時間: {pipeline}/{stage} {duration_ms}ms"
+        )
+
+def compute_content_hash(content):
+    """画像データのSHA-256ハッシュを計算
+
+    Args:
+        content (bytes): 画像バイナリデータ
+
+    Returns:
+        str: 16進数のハッシュ文字列
+    """
+    return hashlib.sha256(content).hexdigest()
+
+def encode_version():
+    """作成済み画像の画質・大きさの設定の文字列を作成
+
+    圧縮率・Web配信用の品質・プレビューのサイズを変更すると値が変わる。
+
+    Returns:
+        str: 設定の文字列
+    """
+    settings = get_settings()
+    sizes = ",".join(f"{variant}:{size}" for variant, size in sorted(PREVIEW_SIZES.items()))
+    return (f"jpeg={settings.compression_quality},webp={settings.webp_quality},"
+            f"avif={settings.avif_quality},sizes={sizes}")
+
+def metadata_version(metadata):
+    """メタデータ・バナーのレイアウト・画質の設定のバージョン文字列を作成
+
+    メタデータ・バナーのレイアウト・圧縮率などの画質の設定のいずれかが変わると値が変わるため、
+    作成済み画像のキャッシュキー（プレビューURLのv=）として使用する。
+
+    Args:
+        metadata (dict or Metadata): メタデータ
+
+    Returns:
+        str: バージョン文字列
+    """
+    payload = json.dumps(dict(metadata), ensure_ascii=False, sort_keys=True)
+    payload += f"|layout={BANNER_LAYOUT_VERSION}|encode={encode_version()}"
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+def get_render_key(original_hash, metadata):
+    """作成済み画像のキャッシュキーを取得
+
+    Args:
+        original_hash (str): 元画像のハッシュ
+        metadata (dict): メタデータ
+
+    Returns:
+        str: キャッシュキー（元画像のハッシュ + メタデータ・レイアウト・画質の設定のバージョン）
+    """
+    return f"{original_hash[:32]}_{metadata_version(metadata)}"
+
+def store_original(content, original_hash, extension):
+    """元画像をハッシュ名で保存（同じ内容の画像は1度だけ保存）
+
+    Args:
+        content (bytes): 画像バイナリデータ
+        original_hash (str): 画像データのハッシュ
+        extension (str): 拡張子（例: ".jpg"）
+
+    Returns:
+        Path: 保存先パス
+    """
+    original_folder = Path(ORIGINAL_FOLDER)
+    original_folder.mkdir(parents=True, exist_ok=True)
+
+    original_path = original_folder / f"{original_hash}{extension.lower()}"
+    if not original_path.exists():
+        _write_atomic(original_path, content)
+        logger.info(f"元画像保存: {original_path}")
+
+    return original_path
+
+def _write_atomic(path, data):
+    """一時ファイルに書き込んでから置き換え（書き込み途中のファイルを配信しないため）"""
+    # 複数のプロセスで動かす場合も一時ファイルが重ならないようプロセスIDを含める
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+@contextmanager
+def _path_lock(path):
+    """出力パスごとのロックを保持（待っている処理がなくなったロックは削除）"""
+    key = str(path)
+    with _render_locks_guard:
+        entry = _render_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        # 作成に失敗した場合も削除する（待っている処理がある間は同じロックを使わせる）
+        with _render_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                _render_locks.pop(key, None)
+
+def _load_pillow():
+    """Pillowとバナー合成のモジュールを読み込み（起動時間短縮のため初回の画像作成時に読み込む）"""
+    from PIL import Image
+    from logics.overlay import add_text_to_image
+    return Image, add_text_to_image
+
+def _render_once(output_path, render, pipeline, overwrite=False):
+    """出力ファイルがなければ作成（同時要求は1度だけ作成、overwriteの場合は作成し直す）"""
+    if output_path.exists() and not overwrite:
+        return output_path
+
+    with _path_lock(output_path):
+        if overwrite or not output_path.exists():
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            started = time.perf_counter()
+            data = render()
+            with measure_stage(pipeline, "save"):
+                _write_atomic(output_path, data)
+            duration_ms = round((time.perf_counter() - started) * 1000, 1)
+            logger.bind(sample="render", pipeline=pipeline, duration_ms=duration_ms).info(f"画像作成: {output_path}")
+
+    return output_path
+
+def render_annotated(original_path, original_hash, metadata, overwrite=False):
+    """メタデータを合成したJPEG画像を取得（未作成の場合は作成）
+
+    ZIP・Slack送信用のフル解像度画像。
+
+    Args:
+        original_path (Path): 元画像のパス
+        original_hash (str): 元画像のハッシュ
+        metadata (dict): メタデータ
+        overwrite (bool): 作成済みの場合も作成し直す（圧縮率を変更した場合の再作成用）
+
+    Returns:
+        Path: メタデータ合成済み画像のパス
+    """
+    output_path = Path(RENDER_CACHE_FOLDER) / f"{get_render_key(original_hash, metadata)}.jpg"
+
+    def render():
+        Image, add_text_to_image = _load_pillow()
+        with Image.open(original_path) as img:
+            with measure_stage("annotated", "decode"):
+                img.load()
+            with measure_stage("annotated", "overlay", "add_text_to_image"):
+                # デコードした画像はここでしか使わないため直接合成（フル解像度のコピーを避ける）
+                annotated = add_text_to_image(img, metadata, inplace=True)
+        with measure_stage("annotated", "encode"):
+            buffer = io.BytesIO()
+            annotated.save(buffer, "JPEG", quality=get_settings().compression_quality)
+        return buffer.getvalue()
+
+    return _render_once(output_path, render, "annotated", overwrite)
+
+def render_web_variant(original_path, original_hash, metadata, variant, fmt, overwrite=False):
+    """プレビュー・サムネイル用のメタデータ合成済み画像を取得（未作成の場合は作成）
+
+    元画像を縮小してからバナーを合成するため、フル解像度の合成より軽量。
+
+    Args:
+        original_path (Path): 元画像のパス
+        original_hash (str): 元画像のハッシュ
+        metadata (dict): メタデータ
+        variant (str): バリアント名（PREVIEW_SIZESのキー）
+        fmt (str): フォーマット名（jpeg/webp/avif）
+        overwrite (bool): 作成済みの場合も作成し直す
+
+    Returns:
+        Path: 作成した画像のパス
+    """
+    max_size = PREVIEW_SIZES[variant]
+    ext = OUTPUT_FORMATS[fmt]["ext"]
+    output_path = Path(PREVIEW_FOLDER) / f"{get_render_key(original_hash, metadata)}_{variant}{ext}"
+
+    def render():
+        Image, add_text_to_image = _load_pillow()
+        with Image.open(original_path) as img:
+            with measure_stage("web", "decode"):
+                # JPEGは縮小デコードで読み込みを軽量化
+                img.draft("RGB", (max_size, max_size))
+                img.load()
+                img.thumbnail((max_size, max_size), Image.LANCZOS)
+            with measure_stage("web", "overlay", "add_text_to_image"):
+                # デコードした画像はここでしか使わないため直接合成（フル解像度のコピーを避ける）
+                annotated = add_text_to_image(img, metadata, inplace=True)
+        with measure_stage("web", "encode"):
+            return encode_image(annotated, fmt)
+
+    return _render_once(output_path, render, "web", overwrite)
+
+def delete_rendered(original_hash):
+    """元画像から作成した画像のキャッシュをすべて削除
+
+    Args:
+        original_hash (str): 元画像のハッシュ
+
+    Returns:
+        int: 削除したファイル数
+    """
+    return delete_rendered_many([original_hash])
+
+def delete_stale_rendered(current_keys):
+    """メタデータ・バナーのレイアウト・画質の設定が変わる前に作成した画像のキャッシュを削除
+
+    current_keysに含まれる元画像のうち、現在のキャッシュキー以外で作成した画像を削除する
+    （含まれない元画像の画像は、取り込み中の可能性があるため削除しない）。
+
+    Args:
+        current_keys (set): 現在のキャッシュキー（get_render_keyの戻り値）
+
+    Returns:
+        int: 削除したファイル数
+    """
+    prefixes = {key[:32] for key in current_keys}
+    count = 0
+    for folder in (Path(RENDER_CACHE_FOLDER), Path(PREVIEW_FOLDER)):
+        if not folder.exists():
+            continue
+        for path in folder.iterdir():
+            # ファイル名は「元画像のハッシュ32文字_メタデータのバージョン12文字...」
+            key = path.name[:45]
+            if path.name[32:33] != "_" or key[:32] not in prefixes or key in current_keys:
+                continue
+            try:
+                path.unlink()
+                forget_etag(path)
+                count += 1
+            except OSError as e:
+                logger.warning(f"作成済み画像の削除エラー: {path} - {str(e)}")
+    return count
+
+def delete_rendered_many(original_hashes):
+    """複数の元画像から作成した画像のキャッシュをまとめて削除
+
+    フォルダの一覧は1度だけ取得する（元画像ごとに検索しない）。
+
+    Args:
+        original_hashes (list): 元画像のハッシュのリスト
+
+    Returns:
+        int: 削除したファイル数
+    """
+    prefixes = {original_hash[:32] for original_hash in original_hashes}
+    count = 0
+    for folder in (Path(RENDER_CACHE_FOLDER), Path(PREVIEW_FOLDER)):
+        if not folder.exists():
+            continue
+        for path in folder.iterdir():
+            # ファイル名は「元画像のハッシュ32文字_メタデータのバージョン...」
+            if path.name[32:33] != "_" or path.name[:32] not in prefixes:
+                continue
+            try:
+                path.unlink()
+                forget_etag(path)
+                count += 1
+            except OSError as e:
+                logger.warning(f"作成済み画像の削除エラー: {path} - {str(e)}")
+    return count
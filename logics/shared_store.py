@@ -0,0 +1,389 @@
+"""
+現場報告DXシステム - 共有ストアモジュール
+アップロード済み画像リスト・入力中のユーザー情報・Slack送信の受付状況を保持
+
+SHARED_STOREを指定した場合はSQLite（WALモード）に保存し、同じマシンで動かす複数のサーバープロセスで共有する。
+未指定の場合は従来どおりプロセスのメモリに保持する（1プロセスで動かす場合）。
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from loguru import logger
+
+from config import BASE_DIR, SHARED_STORE_TIMEOUT, NOTIFICATION_STALE_SECONDS, get_settings
+from logics.records import ImageRecord
+
+# 1つのSQL文で指定するUUIDの数の上限（SQLiteの変数の上限より小さく）
+_SQL_BATCH_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    uuid TEXT NOT NULL UNIQUE,
+    record TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS client_uploads (
+    client_id TEXT PRIMARY KEY,
+    uuid TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS notifications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    worker TEXT NOT NULL,
+    status TEXT NOT NULL,
+    image_count INTEGER NOT NULL,
+    success INTEGER,
+    failure INTEGER,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+"""
+
+class MemoryStore:
+    """プロセスのメモリに保持するストア（1プロセスで動かす場合）"""
+    shared = False
+
+    def __init__(self):
+        self.images = {}  # uuid: ImageRecord（original_path, original_hash, metadata, preview_url, filename）
+        self._state = {}
+        self._notification = None  # 送信中のSlack送信の(ID, 開始時刻)
+        self._client_uploads = {}  # 端末が付けたID: 画像のUUID
+        self._next_notification = 1
+
+    def get_state(self, key, default=None):
+        """状態（ユーザー情報など）を取得"""
+        return self._state.get(key, default)
+
+    def update_state(self, key, **changes):
+        """状態の一部の項目を変更
+
+        Args:
+            key (str): 状態のキー
+            **changes: 変更する項目
+
+        Returns:
+            dict: 変更後の状態
+        """
+        value = dict(self._state.get(key) or {})
+        value.update(changes)
+        self._state[key] = value
+        return value
+
+    def delete_images(self, img_uuids):
+        """複数の画像をアップロード済み画像リストから削除
+
+        Args:
+            img_uuids (list): 削除する画像のUUID
+
+        Returns:
+            list: 削除した(UUID, ImageRecord)のリスト
+        """
+        return [(img_uuid, self.images.pop(img_uuid)) for img_uuid in img_uuids if img_uuid in self.images]
+
+    def get_client_upload(self, client_id):
+        """端末が付けたIDで受け付け済みの画像のUUIDを取得（再送された写真を2回登録しないため）"""
+        return self._client_uploads.get(client_id)
+
+    def set_client_upload(self, client_id, img_uuid):
+        """端末が付けたIDと受け付けた画像のUUIDを記録"""
+        self._client_uploads[client_id] = img_uuid
+
+    def images_version(self):
+        """アップロード済み画像リストの変更回数（他のプロセスでの変更はないため常に0）"""
+        return 0
+
+    def start_notification(self, image_count):
+        """Slack送信を受け付け（送信中の場合は受け付けない）
+
+        Args:
+            image_count (int): 送信する画像の枚数
+
+        Returns:
+            int: 受付ID（送信中の場合はNone）
+        """
+        now = time.time()
+        if self._notification and now - self._notification[1] < NOTIFICATION_STALE_SECONDS:
+            return None
+        job_id = self._next_notification
+        self._next_notification += 1
+        self._notification = (job_id, now)
+        return job_id
+
+    def finish_notification(self, job_id, success, failure):
+        """Slack送信の終了を記録"""
+        if self._notification and self._notification[0] == job_id:
+            self._notification = None
+
+class SharedImageIndex:
+    """SQLiteに保存するアップロード済み画像リスト（uuid: ImageRecordの辞書と同じ形式で読み書き）"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return self.store.query("SELECT COUNT(*) FROM images")[0][0]
+
+    def __bool__(self):
+        return bool(self.store.query("SELECT 1 FROM images LIMIT 1"))
+
+    def __contains__(self, img_uuid):
+        return bool(self.store.query("SELECT 1 FROM images WHERE uuid = ?", (img_uuid,)))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __getitem__(self, img_uuid):
+        record = self.get(img_uuid)
+        if record is None:
+            raise KeyError(img_uuid)
+        return record
+
+    def __setitem__(self, img_uuid, record):
+        with self.store.transaction() as conn:
+            # 既存の画像を差し替える場合も追加順（seq）は変えない
+            conn.execute(
+                "INSERT INTO images (uuid, record) VALUES (?, ?) "
+                "ON CONFLICT(uuid) DO UPDATE SET record = excluded.record",
+                (img_uuid, json.dumps(record.to_dict(), ensure_ascii=False))
+            )
+            self.store.bump_version(conn)
+
+    def update(self, records):
+        """複数の画像をまとめて追加（1つのトランザクションで追加、一括取り込み用）
+
+        Args:
+            records (dict): uuid: ImageRecord
+        """
+        with self.store.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO images (uuid, record) VALUES (?, ?) "
+                "ON CONFLICT(uuid) DO UPDATE SET record = excluded.record",
+                [(img_uuid, json.dumps(record.to_dict(), ensure_ascii=False)) for img_uuid, record in records.items()]
+            )
+            self.store.bump_version(conn)
+
+    def get(self, img_uuid, default=None):
+        rows = self.store.query("SELECT record FROM images WHERE uuid = ?", (img_uuid,))
+        return ImageRecord.from_dict(json.loads(rows[0][0])) if rows else default
+
+    def pop(self, img_uuid, *default):
+        with self.store.transaction() as conn:
+            row = conn.execute("SELECT record FROM images WHERE uuid = ?", (img_uuid,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM images WHERE uuid = ?", (img_uuid,))
+                self.store.bump_version(conn)
+        if row is None:
+            if default:
+                return default[0]
+            raise KeyError(img_uuid)
+        return ImageRecord.from_dict(json.loads(row[0]))
+
+    def keys(self):
+        return [row[0] for row in self.store.query("SELECT uuid FROM images ORDER BY seq")]
+
+    def items(self):
+        rows = self.store.query("SELECT uuid, record FROM images ORDER BY seq")
+        return [(img_uuid, ImageRecord.from_dict(json.loads(record))) for img_uuid, record in rows]
+
+    def values(self):
+        return [record for _, record in self.items()]
+
+    def clear(self):
+        with self.store.transaction() as conn:
+            conn.execute("DELETE FROM images")
+            self.store.bump_version(conn)
+
+class SqliteStore:
+    """SQLite（WALモード）に保存するストア（同じマシンの複数のプロセスで共有）
+
+    WALモードでは読み込みが書き込みを待たないため、画面の更新・画像の配信は他のプロセスの書き込み中も止まらない。
+    書き込みはBEGIN IMMEDIATEで1つずつ行い、他のプロセスが書き込み中の場合はSHARED_STORE_TIMEOUT秒まで待つ。
+    接続はスレッドごとに作成する（sqlite3の接続はスレッド間で共有できないため）。
+    """
+    shared = True
+
+    def __init__(self, path, worker_name=""):
+        """
+        Args:
+            path (Path): SQLiteのファイル
+            worker_name (str, optional): このプロセスの名前（Slack送信の受付に記録）
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.worker_name = worker_name or f"pid{os.getpid()}"
+        self._local = threading.local()
+        self.connect().executescript(_SCHEMA)
+        self.images = SharedImageIndex(self)
+
+    def connect(self):
+        """このスレッドの接続を取得（初回は接続してWALモードに設定）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # トランザクションはtransaction()で明示的に開始する
+            conn = sqlite3.connect(self.path, timeout=SHARED_STORE_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """書き込みのトランザクション（他のプロセスの書き込みが終わるまで待って開始）"""
+        conn = self.connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def query(self, sql, params=()):
+        """読み込みのみのクエリを実行
+
+        Returns:
+            list: 結果の行のリスト
+        """
+        return self.connect().execute(sql, params).fetchall()
+
+    def bump_version(self, conn):
+        """アップロード済み画像リストの変更回数を増やす（画像の追加・削除と同じトランザクションで呼び出す）"""
+        conn.execute(
+            "INSERT INTO state (key, value) VALUES ('images_version', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def delete_images(self, img_uuids):
+        """複数の画像をアップロード済み画像リストから削除（1つのトランザクションで削除）
+
+        Args:
+            img_uuids (list): 削除する画像のUUID
+
+        Returns:
+            list: 削除した(UUID, ImageRecord)のリスト
+        """
+        img_uuids = list(dict.fromkeys(img_uuids))
+        removed = []
+        with self.transaction() as conn:
+            # SQLiteの変数の上限を超えないよう分割して削除
+            for start in range(0, len(img_uuids), _SQL_BATCH_SIZE):
+                batch = img_uuids[start:start + _SQL_BATCH_SIZE]
+                placeholders = ", ".join("?" * len(batch))
+                removed += conn.execute(
+                    f"SELECT uuid, record FROM images WHERE uuid IN ({placeholders}) ORDER BY seq", batch
+                ).fetchall()
+                conn.execute(f"DELETE FROM images WHERE uuid IN ({placeholders})", batch)
+            if removed:
+                self.bump_version(conn)
+        return [(img_uuid, ImageRecord.from_dict(json.loads(record))) for img_uuid, record in removed]
+
+    def get_client_upload(self, client_id):
+        """端末が付けたIDで受け付け済みの画像のUUIDを取得（再送された写真を2回登録しないため）"""
+        rows = self.query("SELECT uuid FROM client_uploads WHERE client_id = ?", (client_id,))
+        return rows[0][0] if rows else None
+
+    def set_client_upload(self, client_id, img_uuid):
+        """端末が付けたIDと受け付けた画像のUUIDを記録"""
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO client_uploads (client_id, uuid) VALUES (?, ?)", (client_id, img_uuid)
+            )
+
+    def images_version(self):
+        """アップロード済み画像リストの変更回数（他のプロセスでの変更を画面に反映する判定に使用）"""
+        rows = self.query("SELECT value FROM state WHERE key = 'images_version'")
+        return int(rows[0][0]) if rows else 0
+
+    def get_state(self, key, default=None):
+        """状態（ユーザー情報など）を取得"""
+        rows = self.query("SELECT value FROM state WHERE key = ?", (key,))
+        return json.loads(rows[0][0]) if rows else default
+
+    def update_state(self, key, **changes):
+        """状態の一部の項目を変更（他のプロセスの変更と混ざらないよう読み込みと書き込みを1つのトランザクションで行う）
+
+        Args:
+            key (str): 状態のキー
+            **changes: 変更する項目
+
+        Returns:
+            dict: 変更後の状態
+        """
+        with self.transaction() as conn:
+            row = conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+            value = json.loads(row[0]) if row else {}
+            value.update(changes)
+            conn.execute(
+                "INSERT INTO state (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, json.dumps(value, ensure_ascii=False))
+            )
+        return value
+
+    def start_notification(self, image_count):
+        """Slack送信を受け付け（いずれかのプロセスで送信中の場合は受け付けない）
+
+        複数の管理者が別々のプロセスから同時に送信し、同じ画像が2回送信されるのを防ぐ。
+        NOTIFICATION_STALE_SECONDSを過ぎても終了しない受付（送信中に停止したプロセス）は無効とみなす。
+
+        Args:
+            image_count (int): 送信する画像の枚数
+
+        Returns:
+            int: 受付ID（送信中の場合はNone）
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE notifications SET status = 'stale', finished_at = ? WHERE status = 'running' AND started_at < ?",
+                (now, now - NOTIFICATION_STALE_SECONDS)
+            )
+            running = conn.execute(
+                "SELECT worker FROM notifications WHERE status = 'running' LIMIT 1"
+            ).fetchone()
+            if running:
+                logger.warning(f"Slack送信中のため受け付けません（送信中のプロセス: {running[0]}）")
+                return None
+            cursor = conn.execute(
+                "INSERT INTO notifications (worker, status, image_count, started_at) VALUES (?, 'running', ?, ?)",
+                (self.worker_name, image_count, now)
+            )
+            return cursor.lastrowid
+
+    def finish_notification(self, job_id, success, failure):
+        """Slack送信の終了を記録
+
+        Args:
+            job_id (int): 受付ID
+            success (int): 送信に成功した画像の枚数
+            failure (int): 送信に失敗した画像の枚数
+        """
+        with self.transaction() as conn:
+            conn.execute(
+                "UPDATE notifications SET status = 'done', success = ?, failure = ?, finished_at = ? WHERE id = ?",
+                (success, failure, time.time(), job_id)
+            )
+
+def open_store(settings=None):
+    """設定に応じたストアを作成
+
+    Args:
+        settings (Settings, optional): 設定（省略時は現在の設定）
+
+    Returns:
+        MemoryStore or SqliteStore: SHARED_STOREを指定した場合はSqliteStore
+    """
+    settings = settings or get_settings()
+    if not settings.shared_store:
+        return MemoryStore()
+
+    path = Path(settings.shared_store)
+    if not path.is_absolute():
+        path = BASE_DIR / path
+    return SqliteStore(path, settings.worker_name)
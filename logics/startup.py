@@ -0,0 +1,49 @@
+"""
+現場報告DXシステム - 起動処理モジュール
+起動にかかった時間の記録と、接続受付後に行う初期化（ウォームアップ）
+"""
+import time
+
+# main.pyの読み込み開始時刻（このモジュールはmain.pyで最初に読み込む）
+_started = time.perf_counter()
+
+# 起動の段階ごとの経過時間（秒、読み込み開始からの累計）
+_timings = {}
+
+def mark(phase):
+    """起動の段階の完了を記録
+
+    Args:
+        phase (str): 段階名（imports/initialize/ready/warm_up など）
+
+    Returns:
+        float: 読み込み開始からの経過時間（秒）
+    """
+    elapsed = time.perf_counter() - _started
+    _timings[phase] = elapsed
+    return elapsed
+
+def get_startup_timings():
+    """記録した起動の段階ごとの経過時間を取得
+
+    Returns:
+        dict: {段階名: 読み込み開始からの経過時間（秒）}
+    """
+    return dict(_timings)
+
+def warm_up():
+    """初回のアップロード・表示を速くするための読み込み
+
+    起動時間を短くするため、接続の受付を開始した後にワーカーで実行する。
+    Pillowのプラグイン・フォント・配信可能なフォーマットを読み込んでおく。
+    """
+    from loguru import logger
+    from config import FONT_SIZE
+    from logics.image_formats import get_enabled_formats
+    from logics.overlay import load_font
+
+    started = time.perf_counter()
+    formats = get_enabled_formats()
+    load_font(FONT_SIZE)
+    logger.info(f"ウォームアップ完了: {time.perf_counter() - started:.3f}秒 (配信フォーマット: {', '.join(formats)})")
+    return mark("warm_up")
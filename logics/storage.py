@@ -0,0 +1,147 @@
+"""
+現場報告DXシステム - ストレージモジュール
+ファイルの読み書き・削除・ZIP化をファイル入出力ワーカーで実行（イベントループを止めない）
+
+SDカード・eMMCなど遅いストレージでは1回の読み書きで数十〜数百ミリ秒止まることがあるため、
+イベントループ（UI・他のリクエスト）から呼ぶファイル操作はこのモジュールを経由する。
+"""
+import os
+import asyncio
+from pathlib import Path
+from loguru import logger
+
+from config import FILE_CHUNK_SIZE, DELETE_BATCH_SIZE
+from logics import file_manager
+from logics.renderer import delete_rendered_many
+from logics.workers import run_io
+
+async def file_size(path):
+    """ファイルサイズを取得
+
+    Args:
+        path (Path): 対象ファイルのパス
+
+    Returns:
+        int: ファイルサイズ（存在しない場合はNone）
+    """
+    try:
+        return (await run_io(os.stat, path)).st_size
+    except OSError:
+        return None
+
+async def read_file(path):
+    """ファイル全体を読み込み
+
+    Args:
+        path (Path): 対象ファイルのパス
+
+    Returns:
+        bytes: ファイルの内容
+    """
+    return await run_io(Path(path).read_bytes)
+
+async def iter_file(path, start=0, end=None, chunk_size=FILE_CHUNK_SIZE):
+    """ファイルを分割して読み込み（ファイル全体をメモリに載せずに送信する場合）
+
+    Args:
+        path (Path): 対象ファイルのパス
+        start (int): 開始位置
+        end (int, optional): 終了位置（この位置を含む。省略時はファイルの末尾）
+        chunk_size (int): 1回に読み込む大きさ
+
+    Yields:
+        bytes: ファイルの内容（chunk_sizeごと）
+    """
+    f = await run_io(open, path, "rb")
+    try:
+        if start:
+            await run_io(f.seek, start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            chunk = await run_io(f.read, size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+    finally:
+        await run_io(f.close)
+
+async def read_upload(upload, max_bytes, chunk_size=FILE_CHUNK_SIZE):
+    """アップロードされたファイルを分割して読み込み（上限を超えた時点で読み込みを中止）
+
+    Args:
+        upload (UploadFile): Starletteのアップロードファイル
+        max_bytes (int): 受け付ける最大サイズ
+        chunk_size (int): 1回に読み込む大きさ
+
+    Returns:
+        bytes: ファイルの内容（上限を超えた場合はNone）
+    """
+    chunks = []
+    total = 0
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            logger.warning(f"アップロードサイズ上限超過: {upload.filename} ({max_bytes}バイト)")
+            return None
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+async def save_image(image_content, file_path, metadata=None):
+    """画像ファイルを保存（file_manager.save_imageをファイル入出力ワーカーで実行）"""
+    return await run_io(file_manager.save_image, image_content, Path(file_path), metadata)
+
+async def delete_image(file_path):
+    """画像ファイルを削除（file_manager.delete_imageをファイル入出力ワーカーで実行）"""
+    return await run_io(file_manager.delete_image, file_path)
+
+def _delete_files(paths):
+    """ファイルをまとめて削除（ファイル入出力ワーカーで実行、存在しないファイルは無視）"""
+    count = 0
+    for path in paths:
+        try:
+            Path(path).unlink()
+            count += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"画像削除エラー: {path} - {str(e)}")
+    return count
+
+async def delete_originals(originals, batch_size=DELETE_BATCH_SIZE):
+    """複数の元画像と元画像から作成した画像のキャッシュをまとめて削除
+
+    元画像はbatch_size件ずつファイル入出力ワーカーに分けて並列に削除し、
+    作成済み画像はフォルダの一覧を1度だけ取得して削除する。
+
+    Args:
+        originals (dict): 元画像のハッシュ: 元画像のパス
+        batch_size (int): 1つのワーカーにまとめて渡す件数
+
+    Returns:
+        int: 削除した元画像の数
+    """
+    paths = list(originals.values())
+    counts = await asyncio.gather(*(
+        run_io(_delete_files, paths[start:start + batch_size])
+        for start in range(0, len(paths), batch_size)
+    ))
+    await run_io(delete_rendered_many, list(originals))
+    return sum(counts)
+
+async def create_zip_archive(file_paths, output_path, arcnames=None):
+    """複数の画像ファイルをZIP化（file_manager.create_zip_archiveをファイル入出力ワーカーで実行）"""
+    return await run_io(file_manager.create_zip_archive, file_paths, output_path, arcnames)
+
+async def move_to_archive(source_paths, archive_folder):
+    """ファイルをアーカイブフォルダに移動（file_manager.move_to_archiveをファイル入出力ワーカーで実行）"""
+    return await run_io(file_manager.move_to_archive, source_paths, archive_folder)
+
+async def cleanup_old_files(days=30):
+    """古いファイルを削除（file_manager.cleanup_old_filesをファイル入出力ワーカーで実行）"""
+    return await run_io(file_manager.cleanup_old_files, days)
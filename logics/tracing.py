@@ -0,0 +1,326 @@
+"""
+現場報告DXシステム - トレースモジュール
+画像ごとにアップロード・合成・保存・Slack送信の所要時間をスパンとして記録
+OpenTelemetry（OTLP/JSON）形式でファイル・コレクターに出力できる
+"""
+import os
+import json
+import time
+import queue
+import threading
+import contextvars
+import urllib.request
+from pathlib import Path
+from contextlib import contextmanager
+from collections import OrderedDict
+from loguru import logger
+
+from config import TRACE_MAX_SPANS, TRACE_SERVICE_NAME, get_settings
+
+# 実行中のスパン（asyncioのタスク・ワーカースレッドへはcontextvarsで引き継ぐ）
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# 直近のトレース（trace_id: {"root": ルートスパンID, "spans": [Span, ...]}）
+_traces = OrderedDict()
+_traces_lock = threading.Lock()
+
+# 出力待ちのスパン（バックグラウンドのスレッドでファイル・コレクターに出力）
+_export_queue = queue.SimpleQueue()
+_exporter_thread = None
+_exporter_lock = threading.Lock()
+
+class Span:
+    """1つの処理の開始・終了時刻と属性"""
+    __slots__ = (
+        "trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error", "entry"
+    )
+
+    def __init__(self, trace_id, parent_id, name, attributes, entry=False):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+        self.entry = entry  # トレースの入口となる処理（アップロード・合成・Slack送信など）
+
+    def set_attribute(self, key, value):
+        """属性を追加"""
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+def current_trace_id():
+    """実行中のスパンのトレースIDを取得
+
+    Returns:
+        str: トレースID（実行中のスパンがなければNone）
+    """
+    current = _current_span.get()
+    return current.trace_id if current is not None else None
+
+def trace_id_for(image_uuid):
+    """画像のUUIDからトレースIDを作成（UUIDの16進数32桁をそのまま使う）
+
+    Args:
+        image_uuid (str): 画像のUUID
+
+    Returns:
+        str: トレースID
+    """
+    return image_uuid.replace("-", "")
+
+@contextmanager
+def span(name, trace_id=None, **attributes):
+    """スパンを記録するコンテキストマネージャー
+
+    trace_idを指定すると、その画像のトレースにスパンを追加する。
+    省略した場合は実行中のスパンの子になり、実行中のスパンがなければ何も記録しない。
+
+    Args:
+        name (str): スパン名
+        trace_id (str, optional): トレースID（trace_id_forで作成）
+        **attributes: スパンの属性
+
+    Yields:
+        Span: 記録中のスパン（記録しない場合はNone）
+    """
+    parent = _current_span.get()
+    if not get_settings().tracing_enabled or (trace_id is None and parent is None):
+        yield None
+        return
+
+    entry = not (trace_id is None or (parent is not None and parent.trace_id == trace_id))
+    if entry:
+        # 後から行う処理（合成・Slack送信）はアップロード時のルートスパンにつなげる
+        with _traces_lock:
+            trace = _traces.get(trace_id)
+            parent_id = trace["root"] if trace else None
+    else:
+        trace_id = parent.trace_id
+        parent_id = parent.span_id
+
+    current = Span(trace_id, parent_id, name, attributes, entry)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = str(e) or type(e).__name__
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        _finish_span(current)
+
+@contextmanager
+def image_span(name, image_uuid, **attributes):
+    """画像のトレースにスパンを追加し、その間のログに画像のUUIDを付与
+
+    Args:
+        name (str): スパン名
+        image_uuid (str): 画像のUUID
+        **attributes: スパンの属性
+
+    Yields:
+        Span: 記録中のスパン（記録しない場合はNone）
+    """
+    with logger.contextualize(image_uuid=image_uuid):
+        with span(name, trace_id=trace_id_for(image_uuid), **attributes) as current:
+            yield current
+
+def _finish_span(finished):
+    """終了したスパンを直近のトレースに追加し、出力待ちに入れる"""
+    settings = get_settings()
+    with _traces_lock:
+        trace = _traces.get(finished.trace_id)
+        if trace is None:
+            trace = _traces[finished.trace_id] = {"root": None, "spans": []}
+        else:
+            _traces.move_to_end(finished.trace_id)
+        if finished.parent_id is None and trace["root"] is None:
+            trace["root"] = finished.span_id
+        if len(trace["spans"]) < TRACE_MAX_SPANS:
+            trace["spans"].append(finished)
+
+        while len(_traces) > settings.trace_buffer_size:
+            _traces.popitem(last=False)
+
+    if settings.trace_export_file or settings.trace_export_url:
+        _ensure_exporter()
+        _export_queue.put(finished)
+
+def _attribute_value(value):
+    """属性値をOTLPのAnyValue形式に変換"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def to_otlp(spans):
+    """スパンをOTLP/JSON（ExportTraceServiceRequest）形式に変換
+
+    Args:
+        spans (list): Spanのリスト
+
+    Returns:
+        dict: OTLP/JSON形式のデータ
+    """
+    otlp_spans = []
+    for item in spans:
+        otlp_span = {
+            "traceId": item.trace_id,
+            "spanId": item.span_id,
+            "name": item.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(item.start_ns),
+            "endTimeUnixNano": str(item.end_ns),
+            "attributes": [
+                {"key": key, "value": _attribute_value(value)} for key, value in item.attributes.items()
+            ],
+            "status": {"code": 2, "message": item.error} if item.error else {"code": 1}
+        }
+        if item.parent_id:
+            otlp_span["parentSpanId"] = item.parent_id
+        otlp_spans.append(otlp_span)
+
+    return {
+        "resourceSpans": [{
+            "resource": {
+                "attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]
+            },
+            "scopeSpans": [{
+                "scope": {"name": "logics.tracing"},
+                "spans": otlp_spans
+            }]
+        }]
+    }
+
+def _ensure_exporter():
+    """出力用のスレッドを起動（初回のみ）"""
+    global _exporter_thread
+    if _exporter_thread is not None:
+        return
+    with _exporter_lock:
+        if _exporter_thread is None:
+            _exporter_thread = threading.Thread(target=_export_loop, name="trace-exporter", daemon=True)
+            _exporter_thread.start()
+
+def _export_loop():
+    """出力待ちのスパンをまとめてファイル・コレクターに出力"""
+    while True:
+        batch = [_export_queue.get()]
+        # 1秒間に終了したスパンをまとめて出力
+        deadline = time.monotonic() + 1.0
+        while len(batch) < 512:
+            try:
+                batch.append(_export_queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        export_spans(batch)
+
+def export_spans(spans):
+    """スパンをOTLP/JSON形式でファイル・コレクターに出力
+
+    ファイルには1行に1リクエスト分（OpenTelemetry CollectorのFile Exporterと同じ形式）で追記し、
+    TRACE_EXPORT_URLが設定されていればOTLP/HTTPで送信する。
+
+    Args:
+        spans (list): Spanのリスト
+
+    Returns:
+        bool: 出力成功時はTrue
+    """
+    settings = get_settings()
+    payload = json.dumps(to_otlp(spans), ensure_ascii=False)
+    success = True
+
+    if settings.trace_export_file:
+        try:
+            path = Path(settings.trace_export_file)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(payload + "\n")
+        except Exception as e:
+            logger.error(f"トレース出力エラー: {settings.trace_export_file} - {str(e)}")
+            success = False
+
+    if settings.trace_export_url:
+        try:
+            request = urllib.request.Request(
+                settings.trace_export_url,
+                data=payload.encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                method="POST"
+            )
+            with urllib.request.urlopen(request, timeout=5):
+                pass
+        except Exception as e:
+            logger.error(f"トレース送信エラー: {settings.trace_export_url} - {str(e)}")
+            success = False
+
+    return success
+
+def get_slowest_traces(limit=20):
+    """直近のトレースを所要時間の長い順に取得
+
+    所要時間は入口となる処理（アップロード・合成・Slack送信など）の合計で、
+    利用者の操作を待っていた時間は含まない。
+
+    Args:
+        limit (int): 取得する件数
+
+    Returns:
+        list: トレースの辞書（trace_id, name, start_ns, duration_ms, elapsed_ms, error, spans）のリスト
+    """
+    with _traces_lock:
+        traces = [(trace_id, list(trace["spans"])) for trace_id, trace in _traces.items()]
+
+    results = []
+    for trace_id, spans in traces:
+        parents = {item.span_id: item.parent_id for item in spans}
+
+        def depth(item):
+            level = 0
+            parent_id = item.parent_id
+            while parent_id in parents:
+                level += 1
+                parent_id = parents[parent_id]
+            return level
+
+        start_ns = min(item.start_ns for item in spans)
+        end_ns = max(item.end_ns for item in spans)
+        root = next((item for item in spans if item.parent_id is None), spans[0])
+        results.append({
+            "trace_id": trace_id,
+            "name": root.name,
+            "start_ns": start_ns,
+            "duration_ms": sum(item.duration_ms for item in spans if item.entry),
+            "elapsed_ms": (end_ns - start_ns) / 1e6,
+            "error": any(item.error for item in spans),
+            "spans": [
+                {
+                    "name": item.name,
+                    "depth": depth(item),
+                    "offset_ms": (item.start_ns - start_ns) / 1e6,
+                    "duration_ms": item.duration_ms,
+                    "error": item.error,
+                    "attributes": dict(item.attributes)
+                }
+                for item in sorted(spans, key=lambda item: item.start_ns)
+            ]
+        })
+
+    results.sort(key=lambda trace: trace["duration_ms"], reverse=True)
+    return results[:limit]
+
+def clear_traces():
+    """直近のトレースを破棄"""
+    with _traces_lock:
+        _traces.clear()
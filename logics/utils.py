@@ -9,6 +9,9 @@ import platform
 from pathlib import Path
 from loguru import logger
 
+from config import FONT_PATHS, get_settings
+from logics.preflight import probe_image
+
 def generate_uuid():
     """一意のIDを生成
 
@@ -56,30 +59,8 @@ def detect_font_path():
     Returns:
         str: フォントのパス（見つからない場合はNone）
     """
-    system = platform.system()
-
-    if system == "Windows":
-        # Windowsの一般的な日本語フォント
-        font_paths = [
-            "C:/Windows/Fonts/meiryo.ttc",
-            "C:/Windows/Fonts/msgothic.ttc",
-            "C:/Windows/Fonts/YuGothM.ttc"
-        ]
-    elif system == "Darwin":  # macOS
-        # macOSの一般的な日本語フォント
-        font_paths = [
-            "/System/Library/Fonts/ヒラギノ角ゴシック W4.ttc",
-            "/Library/Fonts/Osaka.ttf",
-            "/System/Library/Fonts/AppleGothic.ttf"
-        ]
-    else:  # Linux
-        # Linuxの一般的な日本語フォント
-        font_paths = [
-            "/usr/share/fonts/truetype/fonts-japanese-gothic.ttf",
-            "/usr/share/fonts/truetype/noto/NotoSansCJK-Regular.ttc",
-            "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
-            "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"  # 代替
-        ]
+    # OSごとの候補（config.FONT_PATHS、不明なOSはLinuxの候補）
+    font_paths = FONT_PATHS.get(platform.system(), FONT_PATHS["Linux"])
 
     # 存在するフォントパスを検索
     for path in font_paths:
@@ -92,33 +73,29 @@ def detect_font_path():
 def is_valid_image_file(file_path):
     """有効な画像ファイルかどうかをチェック
 
+    拡張子ではなくファイルの内容（ヘッダー）で形式を判別し、形式・解像度（ALLOWED_IMAGE_FORMATS・MAX_IMAGE_SIDE・
+    MAX_IMAGE_PIXELS）とファイルサイズ（MAX_UPLOAD_BYTES）がアップロードと同じ上限以内かを確認する。
+
     Args:
         file_path (str): 画像ファイルのパス
 
     Returns:
         bool: 有効な画像ファイルの場合はTrue
     """
-    # 拡張子チェック
-    valid_extensions = {".jpg", ".jpeg", ".png", ".gif", ".bmp"}
-    extension = Path(file_path).suffix.lower()
-
-    if extension not in valid_extensions:
-        return False
-
     # ファイルサイズチェック
     try:
         file_size = os.path.getsize(file_path)
-        if file_size <= 0:
-            return False
-
-        # サイズ上限（例: 20MB）
-        max_size = 20 * 1024 * 1024
-        if file_size > max_size:
-            return False
-    except:
+    except OSError:
+        return False
+    if file_size <= 0 or file_size > get_settings().max_upload_bytes:
         return False
 
-    return True
+    # 形式・解像度チェック（ヘッダーのみ読み込み）
+    try:
+        info, _ = probe_image(Path(file_path))
+    except OSError:
+        return False
+    return info is not None
 
 def create_dir_if_not_exists(dir_path):
     """ディレクトリが存在しなければ作成
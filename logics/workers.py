@@ -0,0 +1,160 @@
+"""
+現場報告DXシステム - ワーカープールモジュール
+画像のデコード・合成・エンコードなどの重い処理と、ファイルの読み書きをイベントループの外で実行
+"""
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from loguru import logger
+
+from config import get_settings
+from logics.metrics import register_gauge
+
+# 画像処理用のスレッドプール（PillowはデコードやエンコードでGILを解放する）
+_executor = None
+_executor_workers = 0
+
+# 投入済みで完了していない処理の数（実行中 + 待機中）
+_inflight = 0
+
+# ファイルの読み書き用のスレッドプール
+# 画像処理の待ち行列の後ろでファイルの読み書きが待たされないよう、画像処理とは分ける
+_io_executor = None
+_io_inflight = 0
+
+def get_executor():
+    """画像処理用のスレッドプールを取得（初回呼び出し時に作成）
+
+    設定のワーカー数（IMAGE_WORKERS）が再読み込みで変わった場合は新しいプールに切り替える。
+    切り替え前のプールに投入済みの処理はそのまま完了する。
+
+    Returns:
+        ThreadPoolExecutor: スレッドプール
+    """
+    global _executor, _executor_workers
+    workers = get_settings().image_workers
+    if _executor is None or _executor_workers != workers:
+        previous = _executor
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-worker")
+        _executor_workers = workers
+        if previous is not None:
+            previous.shutdown(wait=False)
+        logger.info(f"画像処理ワーカー起動: {workers}スレッド")
+    return _executor
+
+async def run_in_worker(func, *args, **kwargs):
+    """関数をワーカープールで実行し、完了を待機
+
+    実行中のトレースのスパンを引き継ぐため、呼び出し元のcontextvarsの中で実行する。
+
+    Args:
+        func (callable): 実行する関数
+        *args: 関数の引数
+        **kwargs: 関数のキーワード引数
+
+    Returns:
+        関数の戻り値
+    """
+    global _inflight
+    loop = asyncio.get_running_loop()
+    _inflight += 1
+    try:
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(get_executor(), partial(context.run, func, *args, **kwargs))
+    finally:
+        _inflight -= 1
+
+class ConcurrencyLimiter:
+    """同時に実行する処理の数を制限（上限は実行中に変更できる）
+
+    async withで囲んだ処理を、上限を超える分は空きが出るまで待機させる。
+    """
+
+    def __init__(self, get_limit):
+        """
+        Args:
+            get_limit (callable): 現在の上限を返す関数（呼び出しのたびに評価する）
+        """
+        self.get_limit = get_limit
+        self.active = 0
+        self.waiting = 0
+        self._condition = None
+
+    async def __aenter__(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            self.waiting += 1
+            try:
+                await self._condition.wait_for(lambda: self.active < self.get_limit())
+            finally:
+                self.waiting -= 1
+            self.active += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        async with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+# アップロードの取り込みの同時実行数（設定のUPLOAD_CONCURRENCY）
+upload_limiter = ConcurrencyLimiter(lambda: get_settings().upload_concurrency)
+
+def get_io_executor():
+    """ファイルの読み書き用のスレッドプールを取得（初回呼び出し時に作成）
+
+    Returns:
+        ThreadPoolExecutor: スレッドプール
+    """
+    global _io_executor
+    if _io_executor is None:
+        workers = get_settings().io_workers
+        _io_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="io-worker")
+        logger.info(f"ファイル入出力ワーカー起動: {workers}スレッド")
+    return _io_executor
+
+async def run_io(func, *args, **kwargs):
+    """ファイルの読み書きなどブロックする関数をI/O用のスレッドで実行し、完了を待機
+
+    Args:
+        func (callable): 実行する関数
+        *args: 関数の引数
+        **kwargs: 関数のキーワード引数
+
+    Returns:
+        関数の戻り値
+    """
+    global _io_inflight
+    loop = asyncio.get_running_loop()
+    _io_inflight += 1
+    try:
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(get_io_executor(), partial(context.run, func, *args, **kwargs))
+    finally:
+        _io_inflight -= 1
+
+def get_queue_depth():
+    """ワーカーの空きを待っている処理の数を取得
+
+    Returns:
+        int: 待機中の処理数
+    """
+    if _executor is None:
+        return 0
+    return _executor._work_queue.qsize()
+
+def shutdown_workers():
+    """ワーカープールを停止（実行中の処理は完了を待つ）"""
+    global _executor, _io_executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+    if _io_executor is not None:
+        _io_executor.shutdown(wait=True)
+        _io_executor = None
+
+register_gauge("image_worker_queue_depth", "画像処理ワーカーの空きを待っている処理数", get_queue_depth)
+register_gauge("image_worker_inflight", "画像処理ワーカーに投入済みで未完了の処理数", lambda: _inflight)
+register_gauge("io_worker_inflight", "ファイル入出力ワーカーに投入済みで未完了の処理数", lambda: _io_inflight)
+register_gauge("upload_waiting", "同時実行数の上限により取り込みを待っているアップロード数", lambda: upload_limiter.waiting)
@@ -2,237 +2,458 @@
 現場報告DXシステム - メインアプリケーション
 NiceGUIベースの現場報告画像アップロードシステム
 """
-import os
+# 起動時間の計測のため最初に読み込む
+from logics.startup import mark, get_startup_timings, warm_up
+
+import hmac
+import dataclasses
 import uuid
+import time
 import datetime
+import weakref
 from pathlib import Path
 from loguru import logger
-from nicegui import ui, app
+from nicegui import ui, app, Client
 import asyncio
-from PIL import Image, ImageDraw, ImageFont
-from dotenv import load_dotenv
+from fastapi import Request
+from fastapi.responses import Response, JSONResponse
 
 # ローカルモジュールのインポート
 from config import (
-    UPLOAD_FOLDER, LOG_FOLDER, TAGS, COMPRESSION_QUALITY,
-    SLACK_ENABLED, DEFAULT_LOCATION_PRESETS
+    UPLOAD_FOLDER, LOG_FOLDER, TAGS, PREVIEW_SIZES, DEFAULT_LOCATION_PRESETS, PROFILE_INTERVAL,
+    SHARED_REFRESH_INTERVAL, PWA_FOLDER, PWA_SYNC_CONCURRENCY, PWA_RETRY_BASE_SECONDS, PWA_RETRY_MAX_SECONDS,
+    get_settings, reload_settings
+)
+from logics.file_manager import ensure_folders_exist
+from logics import storage
+from logics.image_formats import OUTPUT_FORMATS, get_enabled_formats, negotiate_format
+from logics.image_server import build_image_response
+from logics.ingest import check_and_ingest
+from logics.renderer import get_render_key, render_annotated, render_web_variant
+from logics.workers import run_in_worker, run_io, upload_limiter
+from logics.shared_store import open_store
+from logics.tracing import image_span, get_slowest_traces
+from logics.log_sink import DailyFileSink, SamplingFilter, format_json
+from logics.profiler import (
+    start_profiling, stop_profiling, get_profile_status, get_folded_profile,
+    set_stage_timing, is_stage_timing_enabled
 )
-from logics.file_manager import save_image, create_zip_archive, ensure_folders_exist
-from logics.notifier import send_slack_notification
-from logics.metadata import create_metadata, validate_metadata
+from logics.metrics import render_metrics, register_gauge
+from logics.notifier import send_slack_report
+from logics.metadata import create_metadata, validate_metadata, matches_filter
+from logics.quality import get_quality_flags, format_quality_flags, exclude_flagged
 from logics.utils import get_timestamp, generate_uuid
 from ui_components import create_mobile_ui, create_desktop_ui, create_shared_ui_elements
 
-# 環境変数のロード
-load_dotenv()
+# 設定（環境変数・.env）はconfigの読み込み時に1度だけ読み込んで検証する
+mark("imports")
 
 # グローバル変数
-uploaded_images = {}  # uuid: {path, metadata, preview_url}
-current_user = {"name": "", "location": ""}
+# アップロード済み画像リスト・ユーザー情報はストアに保持（SHARED_STOREを指定した場合は複数のプロセスで共有）
+store = open_store()
+uploaded_images = store.images  # uuid: ImageRecord（original_path, original_hash, metadata, preview_url, filename）
+selected_images = set()  # 一括削除のために画面で選択した画像のUUID
 device_type = "desktop"  # desktop/mobile（デバイス検出用）
+# ブラウザ（NiceGUIのクライアント）ごとのプレビュー表示領域（クライアントID: ui.column、切断されたクライアントの分は自動で消える）
+preview_containers = weakref.WeakValueDictionary()
+
+async def run_store(func, *args, **kwargs):
+    """ストアの読み書きを実行
+
+    共有ストア（SQLite）はファイルの読み書き・他のプロセスの書き込み待ち（SHARED_STORE_TIMEOUT秒まで）で
+    イベントループを止めないようファイル入出力ワーカーで実行する。メモリのストアはそのまま実行する。
+
+    Args:
+        func (callable): ストアの読み書きを行う関数
+        *args: 関数の引数
+        **kwargs: 関数のキーワード引数
+
+    Returns:
+        関数の戻り値
+    """
+    if store.shared:
+        return await run_io(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+def list_images():
+    """アップロード済み画像の(UUID, ImageRecord)のリストを取得（run_storeで呼び出す）"""
+    return list(uploaded_images.items())
 
 # ログの初期化
 def setup_logging():
-    """日付ベースのログフォルダを作成し、loguruを設定"""
-    today = datetime.datetime.now().strftime("%Y%m%d")
-    log_path = Path(LOG_FOLDER) / today
-    log_path.mkdir(parents=True, exist_ok=True)
+    """日付別のログフォルダ（log/YYYYMMDD/app.log）に出力するようloguruを設定
+
+    ファイルへの書き込みはバックグラウンドのスレッドで行い、イベントループを止めない。
+    日付が変わると再起動なしで新しいフォルダに切り替わり、古いログは圧縮・削除される。
+    """
+    if get_settings().log_format == "json":
+        # 1行1レコードのJSON（画像のUUID・セッション・所要時間などを含む）
+        log_format = format_json
+    else:
+        log_format = "{time:YYYY-MM-DD HH:mm:ss.SSS} | {level} | {file}:{function}:{line} - {message}\n"
 
     # loguruの設定
     logger.remove()  # デフォルトのハンドラを削除
+    # 複数プロセスで動かす場合はプロセスごとのファイルに書き込む
+    worker_name = get_settings().worker_name
     logger.add(
-        log_path / "app.log",
-        rotation="00:00",  # 日付変更時にローテーション
-        format="{time:YYYY-MM-DD HH:mm:ss.SSS} | {level} | {file}:{function}:{line} - {message}",
-        level="INFO"
+        DailyFileSink(LOG_FOLDER, f"app.{worker_name}.log" if worker_name else "app.log",
+                      prune=get_settings().log_prune),
+        format=log_format,
+        filter=SamplingFilter(),  # ZIP追加などファイルごとのログを間引く
+        level="INFO",
+        colorize=False
     )
-    logger.info(f"アプリケーション起動 - ログ出力先: {log_path}")
+    logger.info(f"アプリケーション起動 - ログ出力先: {LOG_FOLDER}")
+    logger.info(f"設定: {get_settings()}")
 
 # 初期化処理
 def initialize_app():
-    """アプリケーションの初期化処理"""
+    """アプリケーションの初期化処理（接続の受付開始前に必要な最小限の処理）"""
+    # ログの設定（ファイルの作成・古いログの整理は書き込みスレッドで行う）
+    setup_logging()
     # 必要なフォルダを作成
     ensure_folders_exist()
-    # ログの設定
-    setup_logging()
-    logger.info("アプリケーション初期化完了")
+    if store.shared:
+        logger.info(f"共有ストア: {store.path} (プロセス: {store.worker_name})")
+    logger.info(f"アプリケーション初期化完了 ({mark('initialize'):.3f}秒)")
+
+async def on_startup():
+    """接続の受付開始後の処理"""
+    timings = get_startup_timings()
+    ready = mark("ready")
+    logger.bind(**{f"{phase}_sec": round(value, 3) for phase, value in timings.items()}).info(
+        f"接続受付開始: {ready:.3f}秒 (モジュール読み込み {timings.get('imports', 0):.3f}秒)"
+    )
 
-# 画像アップロード処理
-async def handle_upload(e):
-    """画像アップロード時の処理"""
-    for file in e.files:
-        file_uuid = generate_uuid()
-        temp_path = Path(UPLOAD_FOLDER) / f"{file_uuid}.jpg"
+    # 初回のアップロード・表示で読み込む処理を先に済ませておく（接続の受付は止めない）
+    asyncio.create_task(run_in_worker(warm_up))
 
-        # 画像の保存
-        content = await file.read()
+# アップロード画像の登録
+async def register_upload(content, filename, metadata):
+    """画像を取り込んでアップロード済み画像リストに追加
 
-        # PILで画像を開いて圧縮
-        img = Image.open(file.file)
+    Args:
+        content (bytes): 画像バイナリデータ
+        filename (str): 元のファイル名
+        metadata (dict): メタデータ
 
-        # メタデータを作成
-        metadata = create_metadata(
-            user_name=current_user.get("name", "名前なし"),
-            location=current_user.get("location", "場所なし"),
-            tags=current_user.get("tags", []),
-            comment=current_user.get("comment", "")
-        )
+    Returns:
+        tuple: (画像のUUID, エラーメッセージ)
+               受け付けられない・読み込めない画像の場合は(None, エラーメッセージ)
+    """
+    file_uuid = generate_uuid()
 
-        # 画像にメタデータを追加
-        img_with_text = add_text_to_image(img, metadata)
+    with image_span("handle_upload", file_uuid, filename=filename, size=len(content)):
+        started = time.perf_counter()
 
-        # 圧縮して保存
-        img_with_text.save(temp_path, "JPEG", quality=COMPRESSION_QUALITY)
+        # 形式・解像度をヘッダーのみで確認してから、元画像をそのまま保存（バナーの合成は必要になった時点で行う）
+        # 確認もワーカーで行う（受け付けられない画像はデコードせずにすぐ終わる）
+        # 同時に取り込む数は設定のUPLOAD_CONCURRENCYまで（超えた分は順番待ち）
+        async with upload_limiter:
+            record, error = await run_in_worker(check_and_ingest, content, filename, metadata)
+        if record is None:
+            return None, error
 
-        # プレビュー用URL作成
-        preview_url = f"/_nicegui/auto/local_file/{str(temp_path)}"
+        # プレビュー用URL作成（フォーマットは配信時にAcceptヘッダーで決定）
+        # 元画像とメタデータのバージョンを付与し、ブラウザに長期キャッシュさせる
+        render_key = get_render_key(record.original_hash, record.metadata)
+        record.preview_url = f"/images/{file_uuid}/preview?v={render_key}"
 
         # アップロード済み画像リストに追加
-        uploaded_images[file_uuid] = {
-            "path": str(temp_path),
-            "metadata": metadata,
-            "preview_url": preview_url,
-            "filename": file.name
-        }
-
-        logger.info(f"画像アップロード: {file.name} -> {temp_path} (UUID: {file_uuid})")
-
-        # UIの更新（画像プレビュー表示）
-        update_image_previews()
+        await run_store(uploaded_images.__setitem__, file_uuid, record)
 
-# 画像にテキスト追加
-def add_text_to_image(img, metadata):
-    """画像の左上にメタデータを追加"""
-    draw = ImageDraw.Draw(img)
-
-    # フォントの設定（日本語対応フォント）
-    try:
-        # Windowsの場合
-        font_path = "C:/Windows/Fonts/meiryo.ttc"
-        if not os.path.exists(font_path):
-            # Macの場合
-            font_path = "/System/Library/Fonts/ヒラギノ角ゴシック W4.ttc"
-            if not os.path.exists(font_path):
-                # Linuxの場合
-                font_path = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
-
-        font = ImageFont.truetype(font_path, 24)
-        small_font = ImageFont.truetype(font_path, 18)
-    except IOError:
-        # フォントが見つからない場合はデフォルトフォント
-        font = ImageFont.load_default()
-        small_font = ImageFont.load_default()
-
-    # 半透明の背景を追加
-    overlay = Image.new('RGBA', img.size, (0, 0, 0, 0))
-    draw_overlay = ImageDraw.Draw(overlay)
-
-    # テキスト情報の作成
-    text_lines = [
-        f"名前: {metadata['user_name']}",
-        f"場所: {metadata['location']}",
-        f"タグ: {', '.join(metadata['tags'])}",
-        f"日時: {metadata['timestamp']}",
-    ]
+        duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.bind(duration_ms=duration_ms, size=len(content)).info(
+            f"画像アップロード: {filename} -> {record.original_path} (UUID: {file_uuid})"
+        )
 
-    if metadata['comment']:
-        text_lines.append(f"コメント: {metadata['comment']}")
+    return file_uuid, ""
 
-    # 背景の高さを計算
-    padding = 10
-    line_height = 30
-    bg_height = len(text_lines) * line_height + padding * 2
+# 画像アップロード処理
+async def handle_upload(e):
+    """画像アップロード時の処理"""
+    # ログにブラウザのセッション（NiceGUIのクライアントID）を付与
+    with logger.contextualize(session=ui.context.client.id):
+        max_bytes = get_settings().max_upload_bytes
+        for file in e.files:
+            if file.size() > max_bytes:
+                logger.warning(f"アップロードサイズ上限超過: {file.name} ({max_bytes}バイト)")
+                ui.notify(f"画像のサイズが大きすぎます: {file.name}", color="negative")
+                continue
+
+            # 画像データの読み込み（NiceGUIが大きいファイルを一時ファイルに保存した場合もイベントループを止めずに読み込む）
+            content = await file.read()
+
+            # メタデータを作成
+            current_user = await run_store(store.get_state, "current_user", {})
+            metadata = create_metadata(
+                user_name=current_user.get("name", "名前なし"),
+                location=current_user.get("location", "場所なし"),
+                tags=current_user.get("tags", []),
+                comment=current_user.get("comment", "")
+            )
 
-    # 半透明の背景を描画
-    draw_overlay.rectangle(
-        [(0, 0), (img.width, bg_height)],
-        fill=(0, 0, 0, 128)
-    )
+            file_uuid, error = await register_upload(content, file.name, metadata)
+            if file_uuid is None:
+                ui.notify(f"{error}: {file.name}", color="negative")
+                continue
+
+            # UIの更新（画像プレビュー表示）
+            await update_image_previews()
+
+# HTTP APIによるアップロード
+@app.post("/api/upload")
+async def api_upload(request: Request):
+    """multipart/form-dataで画像とメタデータを受け付けるアップロードAPI
+
+    フォーム項目: file（複数可）, user_name, location, tags（複数可）, comment,
+    timestamp（撮影日時、省略時は受信時刻）, client_id（端末が付けたID、再送された写真を2回登録しない）
+    オフライン対応版（/pwa/index.html）・負荷試験（benchmarks/loadtest.py）などNiceGUIの画面を経由しないクライアント用。
+    """
+    with logger.contextualize(session=f"api:{request.client.host if request.client else '-'}"):
+        form = await request.form()
+        files = form.getlist("file")
+        if not files:
+            return JSONResponse({"ok": False, "error": "ファイルがありません"}, status_code=400)
 
-    # テキストを描画
-    for i, line in enumerate(text_lines):
-        draw.text(
-            (padding, padding + i * line_height),
-            line,
-            font=small_font if i == len(text_lines) - 1 else font,
-            fill=(255, 255, 255)
+        metadata = create_metadata(
+            user_name=form.get("user_name"),
+            location=form.get("location"),
+            tags=form.getlist("tags"),
+            comment=form.get("comment"),
+            timestamp=form.get("timestamp")
+        )
+        client_id = form.get("client_id")
+
+        results = []
+        max_bytes = get_settings().max_upload_bytes
+        for index, upload in enumerate(files):
+            # 通信が切れて応答を受け取れなかった端末が再送した写真は、登録済みのUUIDを返す
+            upload_id = f"{client_id}:{index}" if client_id else None
+            file_uuid = await run_store(store.get_client_upload, upload_id) if upload_id else None
+            if file_uuid:
+                logger.info(f"再送された画像を受け付け済みとして応答: {upload.filename} (UUID: {file_uuid})")
+                results.append({"filename": upload.filename, "uuid": file_uuid, "ok": True})
+                continue
+
+            # 分割して読み込み、上限を超えた画像は最後まで読み込まずに拒否
+            content = await storage.read_upload(upload, max_bytes)
+            if content is None:
+                results.append({"filename": upload.filename, "uuid": None, "ok": False, "error": "サイズが大きすぎます"})
+                continue
+            file_uuid, error = await register_upload(content, upload.filename, metadata)
+            if file_uuid is None:
+                results.append({"filename": upload.filename, "uuid": None, "ok": False, "error": error})
+                continue
+            if upload_id:
+                await run_store(store.set_client_upload, upload_id, file_uuid)
+            results.append({"filename": upload.filename, "uuid": file_uuid, "ok": True})
+
+        ok = all(result["ok"] for result in results)
+        return JSONResponse({"ok": ok, "files": results}, status_code=200 if ok else 400)
+
+# オフライン対応版の画面で使う選択肢・送信設定
+@app.get("/api/options")
+def api_options():
+    """タグ・場所のプリセットと送信待ちの写真の送信設定（オフライン対応版がキャッシュして圏外でも使用）"""
+    return JSONResponse({
+        "tags": TAGS,
+        "location_presets": DEFAULT_LOCATION_PRESETS,
+        "sync": {
+            "concurrency": PWA_SYNC_CONCURRENCY,
+            "retry_base_seconds": PWA_RETRY_BASE_SECONDS,
+            "retry_max_seconds": PWA_RETRY_MAX_SECONDS
+        }
+    })
+
+# オフライン対応版（Service Worker・画面）の静的ファイル
+app.add_static_files("/pwa", PWA_FOLDER)
+
+# メタデータ合成済み画像の取得
+async def get_annotated_path(img_uuid, img_data):
+    """メタデータ合成済み画像のパスを取得（未作成の場合はワーカーで作成）"""
+    with image_span("render_annotated", img_uuid):
+        return await run_in_worker(
+            render_annotated,
+            img_data.original_path,
+            img_data.original_hash,
+            img_data.metadata
         )
 
-    # 元の画像と半透明背景を合成
-    if img.mode != 'RGBA':
-        img = img.convert('RGBA')
+# 画像プレビュー更新
+async def update_image_previews(preview_container=None):
+    """アップロードされた画像のプレビューを更新
 
-    result = Image.alpha_composite(img, overlay)
-    return result.convert('RGB')  # JPEGとして保存するためRGB変換
+    Args:
+        preview_container (ui.column, optional): 更新するプレビュー表示領域（省略時は操作中のブラウザの表示領域）
+    """
+    if preview_container is None:
+        preview_container = preview_containers.get(ui.context.client.id)
+        if preview_container is None:
+            return
+
+    items = await run_store(list_images)
 
-# 画像プレビュー更新
-def update_image_previews():
-    """アップロードされた画像のプレビューを更新"""
     # 既存のプレビュー表示をクリア
     preview_container.clear()
 
-    if not uploaded_images:
+    if not items:
         with preview_container:
             ui.label("アップロードされた画像はありません").classes("text-gray-500")
         return
 
     # 画像プレビューを表示
     with preview_container:
-        for img_uuid, img_data in uploaded_images.items():
+        for img_uuid, img_data in items:
             with ui.card().classes("mb-2 w-full").style("max-width: 800px"):
-                ui.image(img_data["preview_url"]).classes("w-full")
+                ui.image(img_data.preview_url).classes("w-full")
+
+                # ピンぼけ・露出の問題（取り込み時の判定）
+                flags = get_quality_flags(img_data.quality)
+                if flags:
+                    ui.label(f"⚠ {format_quality_flags(flags)}の可能性があります").classes(
+                        "text-sm text-orange-700 bg-orange-100 rounded px-2 py-1"
+                    )
 
                 with ui.row().classes("w-full justify-between items-center"):
-                    ui.label(f"ファイル: {img_data['filename']}").classes("text-sm")
+                    ui.checkbox(
+                        f"ファイル: {img_data.filename}",
+                        value=img_uuid in selected_images,
+                        on_change=lambda e, u=img_uuid: select_image(u, e.value)
+                    ).classes("text-sm")
                     ui.button(
                         "削除",
                         color="red",
                         on_click=lambda u=img_uuid: delete_image(u)
                     ).classes("text-xs")
 
-                location = img_data["metadata"]["location"]
-                tags = ", ".join(img_data["metadata"]["tags"])
-                timestamp = img_data["metadata"]["timestamp"]
+                location = img_data.metadata.location
+                tags = ", ".join(img_data.metadata.tags)
+                timestamp = img_data.metadata.timestamp
 
                 with ui.column().classes("text-xs text-gray-600 w-full"):
-                    ui.label(f"撮影者: {img_data['metadata']['user_name']}")
+                    ui.label(f"撮影者: {img_data.metadata.user_name}")
                     ui.label(f"場所: {location}")
                     ui.label(f"タグ: {tags}")
                     ui.label(f"日時: {timestamp}")
 
-                    if img_data["metadata"]["comment"]:
-                        ui.label(f"コメント: {img_data['metadata']['comment']}")
+                    if img_data.metadata.comment:
+                        ui.label(f"コメント: {img_data.metadata.comment}")
+
+# 画像の選択（一括削除用）
+def select_image(img_uuid, selected):
+    """画像の選択状態を変更"""
+    if selected:
+        selected_images.add(img_uuid)
+    else:
+        selected_images.discard(img_uuid)
 
 # 画像削除
-def delete_image(img_uuid):
+async def delete_images(img_uuids):
+    """複数の画像をまとめて削除
+
+    画像リストからの削除は1回のトランザクション、画面の更新は1回のみ行い、
+    ファイルの削除は画面の更新後にファイル入出力ワーカーでまとめて行う。
+
+    Args:
+        img_uuids (list): 削除する画像のUUID
+
+    Returns:
+        list: 削除した(UUID, ImageRecord)のリスト
+    """
+    removed = await run_store(store.delete_images, img_uuids)
+    if not removed:
+        return removed
+    selected_images.difference_update(img_uuid for img_uuid, _ in removed)
+
+    # UIの更新
+    await update_image_previews()
+
+    # 同じ元画像を参照する画像が残っていなければ元画像と作成済み画像を削除
+    remaining = {record.original_hash for _, record in await run_store(list_images)}
+    originals = {
+        record.original_hash: record.original_path
+        for _, record in removed if record.original_hash not in remaining
+    }
+    started = time.perf_counter()
+    deleted = await storage.delete_originals(originals)
+    duration_ms = round((time.perf_counter() - started) * 1000, 1)
+    logger.bind(duration_ms=duration_ms).info(f"画像削除: {len(removed)}枚 (元画像 {deleted}件)")
+    return removed
+
+async def delete_image(img_uuid):
     """画像を削除"""
-    if img_uuid in uploaded_images:
-        path = uploaded_images[img_uuid]["path"]
-        filename = uploaded_images[img_uuid]["filename"]
+    removed = await delete_images([img_uuid])
+    if removed:
+        ui.notify(f"画像を削除しました: {removed[0][1].filename}")
+
+# 一括削除
+async def open_delete_dialog():
+    """削除する画像（すべて・選択した画像・条件に一致する画像）を選んで一括削除"""
+    items = await run_store(list_images)
+    if not items:
+        ui.notify("削除する画像がありません", color="warning")
+        return
 
-        try:
-            os.remove(path)
-            logger.info(f"画像削除: {path}")
-        except Exception as e:
-            logger.error(f"画像削除エラー: {path} - {str(e)}")
+    selected = [img_uuid for img_uuid, _ in items if img_uuid in selected_images]
+    user_names = sorted({img_data.metadata.user_name for _, img_data in items})
+    locations = sorted({img_data.metadata.location for _, img_data in items})
+
+    def targets():
+        if mode.value == "selected":
+            return selected
+        if mode.value == "filter":
+            return [
+                img_uuid for img_uuid, img_data in items
+                if matches_filter(img_data.metadata, user_select.value, location_select.value, tag_select.value)
+            ]
+        return [img_uuid for img_uuid, _ in items]
+
+    def update_count():
+        count_label.set_text(f"削除する画像: {len(targets())}枚")
+
+    async def confirm():
+        img_uuids = targets()
+        dialog.close()
+        removed = await delete_images(img_uuids)
+        ui.notify(f"{len(removed)}枚の画像を削除しました", color="positive")
 
-        # 削除
-        del uploaded_images[img_uuid]
+    with ui.dialog() as dialog, ui.card():
+        ui.label("画像を削除").classes("text-lg font-bold")
+        mode = ui.radio(
+            {"all": "すべて", "selected": f"選択した画像（{len(selected)}枚）", "filter": "条件に一致する画像"},
+            value="selected" if selected else "all",
+            on_change=update_count
+        )
+        with ui.column().classes("w-full").bind_visibility_from(mode, "value", value="filter"):
+            user_select = ui.select(user_names, label="撮影者", clearable=True, on_change=update_count).classes("w-full")
+            location_select = ui.select(locations, label="場所", clearable=True, on_change=update_count).classes("w-full")
+            tag_select = ui.select(TAGS, label="タグ", clearable=True, on_change=update_count).classes("w-full")
+        count_label = ui.label().classes("text-red-600")
+        update_count()
 
-        # UIの更新
-        update_image_previews()
-        ui.notify(f"画像を削除しました: {filename}")
+        with ui.row().classes("w-full justify-end"):
+            ui.button("キャンセル", on_click=dialog.close).props("flat")
+            ui.button("削除", color="red", on_click=confirm)
+
+    dialog.open()
 
 # Slack通知送信
 async def send_to_slack():
     """アップロードされた画像をSlackに送信"""
-    if not uploaded_images:
+    images = await run_store(list_images)
+    if not images:
         ui.notify("送信する画像がありません", color="warning")
         return
 
+    items, excluded = exclude_flagged(images)
+
     with ui.dialog() as dialog, ui.card():
         ui.label("Slackに送信しますか？").classes("text-lg font-bold")
-        ui.label(f"送信する画像: {len(uploaded_images)}枚")
+        ui.label(f"送信する画像: {len(items)}枚")
+        if excluded:
+            ui.label(f"ピンぼけ・露出に問題がある画像{excluded}枚は送信しません").classes("text-sm text-orange-700")
 
         with ui.row():
             ui.button("キャンセル", on_click=dialog.close).classes("mr-2")
@@ -249,6 +470,19 @@ async def slack_send_confirmed(dialog):
     """Slack送信確認後の処理"""
     dialog.close()
 
+    # 品質に問題がある写真は設定（QUALITY_EXCLUDE_FLAGGED）に応じて除外
+    items, excluded = exclude_flagged(await run_store(list_images))
+    if not items:
+        ui.notify("送信できる画像がありません（ピンぼけ・露出に問題がある画像は送信しません）", color="warning")
+        return
+
+    # 他の端末（別のプロセスを含む）から送信中の場合は送信しない（同じ画像を2回送信しないため）
+    job_id = await run_store(store.start_notification, len(items))
+    if job_id is None:
+        ui.notify("別の端末からSlackに送信中です。送信が終わってから再度お試しください", color="warning")
+        return
+    success_count, failure_count = 0, len(items)
+
     with ui.dialog() as progress_dialog, ui.card():
         progress = ui.progress()
         status_label = ui.label("Slackに送信中...")
@@ -256,24 +490,26 @@ async def slack_send_confirmed(dialog):
     progress_dialog.open()
 
     try:
-        # 送信処理
-        for i, (img_uuid, img_data) in enumerate(uploaded_images.items()):
-            # 進捗更新
-            progress.set_value(i / len(uploaded_images))
-
-            # Slack送信
-            success = await send_slack_notification(
-                img_path=img_data["path"],
-                metadata=img_data["metadata"]
-            )
+        # メタデータ合成済み画像を用意（未作成の画像はワーカーで並列に作成）
+        status_label.set_text("画像を準備中...")
+        img_paths = await asyncio.gather(
+            *(get_annotated_path(img_uuid, img_data) for img_uuid, img_data in items)
+        )
+
+        # 1つの報告として送信（画像は並列にアップロードし、複数枚を1つのメッセージにまとめる）
+        status_label.set_text("Slackに送信中...")
+        success_count, failure_count = await send_slack_report(
+            img_paths,
+            [img_data.metadata for _, img_data in items],
+            image_uuids=[img_uuid for img_uuid, _ in items],
+            progress_callback=lambda done, total: progress.set_value(done / total)
+        )
 
-            if success:
-                logger.info(f"Slack送信成功: {img_data['path']}")
-            else:
-                logger.error(f"Slack送信失敗: {img_data['path']}")
-                ui.notify(f"画像の送信に失敗しました: {img_data['filename']}", color="negative")
-                progress_dialog.close()
-                return
+        if failure_count:
+            logger.error(f"Slack送信失敗: {failure_count}枚 (成功 {success_count}枚)")
+            ui.notify(f"{failure_count}枚の画像の送信に失敗しました", color="negative")
+            progress_dialog.close()
+            return
 
         # 全て送信完了
         progress.set_value(1.0)
@@ -295,10 +531,14 @@ async def slack_send_confirmed(dialog):
         await asyncio.sleep(2)
         progress_dialog.close()
 
+    finally:
+        await run_store(store.finish_notification, job_id, success_count, failure_count)
+
 # 一括ZIP保存
 async def save_as_zip():
     """アップロードされた画像をZIPで保存"""
-    if not uploaded_images:
+    images = await run_store(list_images)
+    if not images:
         ui.notify("保存する画像がありません", color="warning")
         return
 
@@ -308,11 +548,22 @@ async def save_as_zip():
         zip_filename = f"現場報告_{timestamp}.zip"
         zip_path = Path(UPLOAD_FOLDER).parent / zip_filename
 
-        # 画像パスのリスト
-        image_paths = [img_data["path"] for img_data in uploaded_images.values()]
+        # 品質に問題がある写真は設定（QUALITY_EXCLUDE_FLAGGED）に応じて除外
+        items, excluded = exclude_flagged(images)
+        if not items:
+            ui.notify("保存できる画像がありません（ピンぼけ・露出に問題がある画像は保存しません）", color="warning")
+            return
+        if excluded:
+            ui.notify(f"ピンぼけ・露出に問題がある画像{excluded}枚を除外しました", color="warning")
+
+        # メタデータ合成済み画像のパスのリスト（未作成の画像はワーカーで並列に作成）
+        image_paths = await asyncio.gather(
+            *(get_annotated_path(img_uuid, img_data) for img_uuid, img_data in items)
+        )
+        arcnames = [f"{img_uuid}.jpg" for img_uuid, _ in items]
 
         # ZIP作成
-        success = create_zip_archive(image_paths, zip_path)
+        success = await storage.create_zip_archive(image_paths, zip_path, arcnames)
 
         if success:
             logger.info(f"ZIP作成成功: {zip_path}")
@@ -330,16 +581,17 @@ async def save_as_zip():
         ui.notify(f"エラー: {str(e)}", color="negative")
 
 # ユーザー情報更新
-def update_user_info(name, location, tags=None, comment=None):
+async def update_user_info(name, location, tags=None, comment=None):
     """ユーザー情報を更新"""
-    current_user["name"] = name
-    current_user["location"] = location
+    changes = {"name": name, "location": location}
 
     if tags is not None:
-        current_user["tags"] = tags
+        changes["tags"] = tags
 
     if comment is not None:
-        current_user["comment"] = comment
+        changes["comment"] = comment
+
+    await run_store(store.update_state, "current_user", **changes)
 
     logger.info(f"ユーザー情報更新: {name} @ {location}")
 
@@ -352,13 +604,211 @@ def detect_device_type(request):
         return "mobile"
     return "desktop"
 
+# 画像配信（Acceptヘッダーによるフォーマット選択・HTTPキャッシュ対応）
+@app.api_route("/images/{img_uuid}/{variant}", methods=["GET", "HEAD"])
+async def serve_image(img_uuid: str, variant: str, request: Request):
+    """派生画像をブラウザが対応する最も軽量なフォーマットで配信
+
+    サーバー上のパスは公開せず、UUIDで画像を特定する。
+    ETagによる304応答とRange要求に対応。
+    """
+    img_data = await run_store(uploaded_images.get, img_uuid)
+    if img_data is None:
+        return Response(status_code=404)
+
+    if variant not in PREVIEW_SIZES:
+        return Response(status_code=404)
+
+    name = negotiate_format(request.headers.get("accept", ""), get_enabled_formats())
+
+    # 初回要求時にメタデータを合成して作成（以降はキャッシュを配信）
+    try:
+        with image_span("render_web_variant", img_uuid, variant=variant, format=name):
+            path = await run_in_worker(
+                render_web_variant,
+                img_data.original_path,
+                img_data.original_hash,
+                img_data.metadata,
+                variant,
+                name
+            )
+    except Exception as e:
+        logger.error(f"プレビュー作成エラー: {img_uuid} - {str(e)}")
+        return Response(status_code=500)
+
+    # ファイルの確認とETagの計算はファイル入出力ワーカーで行う（本文は送信時に分割して読み込む）
+    return await run_io(
+        build_image_response,
+        path,
+        media_type=OUTPUT_FORMATS[name]["mime"],
+        request_headers=request.headers,
+        extra_headers={"Vary": "Accept"}
+    )
+
+# 死活監視（ロードバランサーのヘルスチェック用）
+@app.get("/healthz")
+def healthz():
+    """プロセスが応答できるかを返す（複数プロセスで動かす場合はプロセス名も返す）"""
+    return JSONResponse({"ok": True, "worker": get_settings().worker_name or None, "shared": store.shared})
+
+# メトリクス（Prometheusのテキスト形式）
+@app.get("/metrics")
+def metrics():
+    """処理段階ごとの所要時間・Slack送信・ZIP作成・キュー・保存容量などのメトリクス
+
+    同期関数のためFastAPIのスレッドプールで実行される（画像の件数など共有ストアの読み込みでイベントループを止めない）。
+    """
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+register_gauge(
+    "active_sessions", "WebSocketで接続中のブラウザ数",
+    lambda: sum(1 for client in Client.instances.values() if client.has_socket_connection)
+)
+register_gauge("uploaded_images", "アップロード済み画像リストの件数", lambda: len(uploaded_images))
+register_gauge(
+    "startup_ready_seconds", "main.pyの読み込み開始から接続受付開始までの時間（秒）",
+    lambda: get_startup_timings().get("ready", 0.0)
+)
+
+# 管理者用API
+def check_admin(request):
+    """管理者用APIのトークンを確認
+
+    トークンはX-Admin-TokenヘッダーまたはAuthorization: Bearerで指定する。
+
+    Returns:
+        Response: 拒否する場合の応答（許可する場合はNone）
+    """
+    # トークン未設定の場合は管理者用APIの存在自体を公開しない
+    admin_token = get_settings().admin_token
+    if not admin_token:
+        return Response(status_code=404)
+
+    token = request.headers.get("x-admin-token", "")
+    authorization = request.headers.get("authorization", "")
+    if not token and authorization.lower().startswith("bearer "):
+        token = authorization[7:].strip()
+
+    if not hmac.compare_digest(token.encode("utf-8"), admin_token.encode("utf-8")):
+        logger.warning(f"管理者用APIの認証失敗: {request.url.path}")
+        return Response(status_code=403)
+    return None
+
+@app.post("/admin/profile/start")
+async def admin_profile_start(request: Request, duration: float = 30, interval: float = PROFILE_INTERVAL,
+                              include_idle: bool = False):
+    """スタックの採取を開始（duration秒後に自動で終了）"""
+    denied = check_admin(request)
+    if denied:
+        return denied
+
+    if not start_profiling(duration, interval, include_idle):
+        return JSONResponse({"ok": False, "error": "プロファイルを採取中です"}, status_code=409)
+    return JSONResponse({"ok": True, "status": get_profile_status()})
+
+@app.post("/admin/profile/stop")
+async def admin_profile_stop(request: Request):
+    """スタックの採取を終了し、概要を取得"""
+    denied = check_admin(request)
+    if denied:
+        return denied
+    return JSONResponse({"ok": True, "status": await run_in_worker(stop_profiling)})
+
+@app.get("/admin/profile")
+async def admin_profile(request: Request, format: str = "folded"):
+    """採取結果を取得（folded: フレームグラフ用のテキスト / json: 概要）"""
+    denied = check_admin(request)
+    if denied:
+        return denied
+
+    if format == "json":
+        return JSONResponse(get_profile_status())
+    return Response(
+        get_folded_profile(),
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="profile.folded"'}
+    )
+
+@app.post("/admin/stage-timing")
+async def admin_stage_timing(request: Request, enabled: bool = True):
+    """アップロード・画像作成の段階ごとの所要時間のログ出力を切り替え"""
+    denied = check_admin(request)
+    if denied:
+        return denied
+
+    set_stage_timing(enabled)
+    return JSONResponse({"ok": True, "enabled": is_stage_timing_enabled()})
+
+@app.get("/admin/settings")
+async def admin_settings(request: Request):
+    """現在の設定を取得（トークンは含めない）"""
+    denied = check_admin(request)
+    if denied:
+        return denied
+
+    settings = get_settings()
+    return JSONResponse({
+        field.name: getattr(settings, field.name) for field in dataclasses.fields(settings) if field.repr
+    })
+
+@app.post("/admin/settings/reload")
+async def admin_settings_reload(request: Request):
+    """.envと環境変数を読み直し、画像処理・送信の調整値を再起動せずに反映"""
+    denied = check_admin(request)
+    if denied:
+        return denied
+
+    try:
+        result = reload_settings()
+    except ValueError as e:
+        logger.error(f"設定の再読み込みエラー: {str(e)}")
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=400)
+
+    logger.info(f"設定を再読み込み: 反映={result['changed']}, 再起動が必要={result['restart_required']}")
+    return JSONResponse({"ok": True, **result})
+
+# トレースのデバッグページ
+@ui.page("/debug/traces")
+def traces_page():
+    """直近のトレースを所要時間の長い順に表示（DEBUG=trueの場合のみ）"""
+    if not get_settings().debug:
+        ui.label("このページはDEBUG=trueの場合のみ表示できます").classes("text-gray-500")
+        return
+
+    ui.label("処理に時間のかかった画像（直近）").classes("text-xl font-bold")
+    ui.label("所要時間はアップロード・合成・Slack送信などの処理の合計（操作待ちの時間を除く）").classes("text-xs text-gray-500")
+
+    columns = [
+        {"name": "name", "label": "処理", "field": "name", "align": "left"},
+        {"name": "offset", "label": "開始(ms)", "field": "offset"},
+        {"name": "duration", "label": "所要時間(ms)", "field": "duration"},
+        {"name": "error", "label": "エラー", "field": "error", "align": "left"}
+    ]
+
+    for trace in get_slowest_traces():
+        title = f"{trace['duration_ms']:.1f}ms - {trace['name']} - {trace['trace_id']}"
+        if trace["error"]:
+            title += "（エラーあり）"
+
+        with ui.expansion(title).classes("w-full"):
+            rows = [
+                {
+                    "name": "　" * item["depth"] + item["name"],
+                    "offset": f"{item['offset_ms']:.1f}",
+                    "duration": f"{item['duration_ms']:.1f}",
+                    "error": item["error"] or ""
+                }
+                for item in trace["spans"]
+            ]
+            ui.table(columns=columns, rows=rows).classes("w-full")
+
 # メインページ
 @ui.page("/")
-def main_page():
-    global preview_container, device_type
+def main_page(request: Request):
+    global device_type
 
-    # デバイスタイプの検出
-    device_type = detect_device_type(app.storage.user.get("request"))
+    # デバイスタイプの検出（NiceGUIがページ関数にリクエストを渡す）
+    device_type = detect_device_type(request)
     logger.info(f"デバイスタイプ: {device_type}")
 
     # 共通UI要素
@@ -379,6 +829,7 @@ def main_page():
                 update_user_info=update_user_info,
                 send_to_slack=send_to_slack,
                 save_as_zip=save_as_zip,
+                delete_images=open_delete_dialog,
                 tags=TAGS,
                 location_presets=DEFAULT_LOCATION_PRESETS
             )
@@ -386,11 +837,26 @@ def main_page():
         # プレビューコンテナ（両方のUIで共有）
         ui.label("アップロードされた画像").classes("text-xl font-bold mt-4")
         preview_container = ui.column().classes("w-full")
+        # 画像の追加・削除時はこのブラウザの表示領域を更新（他のブラウザの表示領域は更新しない）
+        preview_containers[ui.context.client.id] = preview_container
 
         # 初期状態では「アップロードされた画像はありません」と表示
         with preview_container:
             ui.label("アップロードされた画像はありません").classes("text-gray-500")
 
+        # 複数プロセスで動かす場合は、他のプロセスで追加・削除された画像を定期的に反映
+        if store.shared:
+            shown_version = None
+
+            async def refresh_if_changed():
+                nonlocal shown_version
+                version = await run_store(store.images_version)
+                if version != shown_version:
+                    shown_version = version
+                    await update_image_previews(preview_container)
+
+            ui.timer(SHARED_REFRESH_INTERVAL, refresh_if_changed)
+
         # フッター
         with ui.row().classes("w-full justify-between items-center mt-8 text-xs text-gray-500"):
             ui.label("© 2025 現場報告DXシステム")
@@ -399,7 +865,12 @@ def main_page():
 # アプリケーション初期化
 def main():
     initialize_app()
-    ui.run(port=8080, title="現場報告システム", favicon="📸")
-
-if __name__ == "__main__":
+    app.on_startup(on_startup)
+    # 終了時に書き込み待ちのログを書き出す（ハンドラの削除時にsinkのstopが呼ばれる）
+    app.on_shutdown(lambda: logger.remove())
+    # 自動リロードは開発時のみ（有効にするとサーバー用のプロセスでmain.pyをもう1度読み込むため起動が遅くなる）
+    ui.run(port=get_settings().port, title="現場報告システム", favicon="📸", reload=get_settings().debug)
+
+# NiceGUIはリロード用のサブプロセス（__mp_main__）でもui.run()の呼び出しが必要
+if __name__ in {"__main__", "__mp_main__"}:
     main()
\ No newline at end of file
@@ -0,0 +1,197 @@
+// 現場報告DXシステム - オフライン対応版の画面
+// フォームの内容と撮影した写真を端末に保存し、電波があるときに送信待ちのキュー（queue.js）から送信する。
+
+const FORM_STORAGE_KEY = "photo-drop-form";
+const OPTIONS_STORAGE_KEY = "photo-drop-options";
+
+// 再送の待ち時間が過ぎた写真を送信する間隔（ミリ秒、画面を開いている間）
+const SYNC_INTERVAL_MS = 15 * 1000;
+
+const elements = {
+  userName: document.getElementById("user_name"),
+  location: document.getElementById("location"),
+  locationPresets: document.getElementById("location_presets"),
+  tags: document.getElementById("tags"),
+  comment: document.getElementById("comment"),
+  photo: document.getElementById("photo"),
+  connection: document.getElementById("connection"),
+  pending: document.getElementById("pending"),
+  syncNote: document.getElementById("sync_note"),
+  retry: document.getElementById("retry"),
+  failed: document.getElementById("failed")
+};
+
+let registration = null;
+
+// ------------------------------------------------------------
+// フォーム（名前・場所・タグ・コメント）
+// ------------------------------------------------------------
+
+function renderOptions(options) {
+  elements.locationPresets.replaceChildren(...options.location_presets.map((location) => {
+    const option = document.createElement("option");
+    option.value = location;
+    return option;
+  }));
+
+  const saved = loadForm();
+  elements.tags.replaceChildren(...options.tags.map((tag) => {
+    const label = document.createElement("label");
+    const checkbox = document.createElement("input");
+    checkbox.type = "checkbox";
+    checkbox.value = tag;
+    checkbox.checked = (saved.tags || []).includes(tag);
+    checkbox.addEventListener("change", saveForm);
+    label.append(checkbox, tag);
+    return label;
+  }));
+}
+
+async function loadOptions() {
+  // 圏外でも選択肢を表示できるよう、前回取得した選択肢を先に表示する
+  const cached = localStorage.getItem(OPTIONS_STORAGE_KEY);
+  if (cached) {
+    renderOptions(JSON.parse(cached));
+  }
+  const options = await loadSyncOptions();
+  if (options) {
+    localStorage.setItem(OPTIONS_STORAGE_KEY, JSON.stringify(options));
+    renderOptions(options);
+  }
+}
+
+function loadForm() {
+  try {
+    return JSON.parse(localStorage.getItem(FORM_STORAGE_KEY)) || {};
+  } catch (e) {
+    return {};
+  }
+}
+
+function currentMetadata() {
+  return {
+    user_name: elements.userName.value.trim(),
+    location: elements.location.value.trim(),
+    tags: [...elements.tags.querySelectorAll("input:checked")].map((checkbox) => checkbox.value),
+    comment: elements.comment.value.trim()
+  };
+}
+
+function saveForm() {
+  localStorage.setItem(FORM_STORAGE_KEY, JSON.stringify(currentMetadata()));
+}
+
+function restoreForm() {
+  const saved = loadForm();
+  elements.userName.value = saved.user_name || "";
+  elements.location.value = saved.location || "";
+  elements.comment.value = saved.comment || "";
+  for (const input of [elements.userName, elements.location, elements.comment]) {
+    input.addEventListener("change", saveForm);
+  }
+}
+
+// ------------------------------------------------------------
+// 送信待ちの写真
+// ------------------------------------------------------------
+
+async function renderQueue() {
+  const items = await listQueue();
+  const pending = items.filter((item) => item.status === "pending");
+  const failed = items.filter((item) => item.status === "failed");
+
+  elements.pending.textContent = `送信待ち: ${pending.length}枚`;
+
+  const waiting = pending.filter((item) => item.error);
+  elements.syncNote.textContent = waiting.length ? `${waiting[0].error}（自動で再送します）` : "";
+
+  elements.failed.replaceChildren(...failed.map((item) => {
+    const li = document.createElement("li");
+    const remove = document.createElement("button");
+    remove.textContent = "削除";
+    remove.addEventListener("click", () => removeFromQueue(item.id));
+    li.append(`${item.filename}（${item.capturedAt}）: ${item.error} `, remove);
+    return li;
+  }));
+}
+
+function renderConnection() {
+  elements.connection.textContent = navigator.onLine ? "● オンライン" : "● 圏外（撮影した写真は端末に保存します）";
+  elements.connection.className = navigator.onLine ? "online" : "offline";
+}
+
+// 送信を依頼（Service Workerが使える場合は画面を閉じても送信されるようBackground Syncにも登録）
+async function requestSync() {
+  if (registration && registration.sync) {
+    try {
+      await registration.sync.register(SYNC_TAG);
+    } catch (e) {
+      // Background Syncに対応していないブラウザでは画面から送信する
+    }
+  }
+  if (navigator.onLine) {
+    await syncQueue();
+  }
+}
+
+elements.photo.addEventListener("change", async () => {
+  const metadata = currentMetadata();
+  saveForm();
+  for (const file of elements.photo.files) {
+    await enqueuePhoto(file, metadata);
+  }
+  // 同じ写真を選び直せるよう選択をクリア
+  elements.photo.value = "";
+  await renderQueue();
+  requestSync();
+});
+
+elements.retry.addEventListener("click", async () => {
+  await retryAllNow();
+  requestSync();
+});
+
+window.addEventListener("online", async () => {
+  renderConnection();
+  // 電波が戻ったら再送の待ち時間を待たずに送信
+  await retryAllNow();
+  requestSync();
+});
+
+window.addEventListener("offline", renderConnection);
+
+if (queueChannel) {
+  queueChannel.onmessage = () => renderQueue();
+}
+
+// ------------------------------------------------------------
+// 起動
+// ------------------------------------------------------------
+
+async function start() {
+  restoreForm();
+  renderConnection();
+  await loadOptions();
+  await renderQueue();
+
+  // Service WorkerはHTTPSまたはlocalhostでのみ使用できる（使えない場合も画面を開いている間は送信する）
+  if ("serviceWorker" in navigator && window.isSecureContext) {
+    try {
+      registration = await navigator.serviceWorker.register("sw.js");
+    } catch (e) {
+      registration = null;
+    }
+  }
+  if (!registration) {
+    elements.syncNote.textContent = "この接続では画面を開いている間のみ送信します";
+  }
+
+  setInterval(() => {
+    if (navigator.onLine) {
+      syncQueue();
+    }
+  }, SYNC_INTERVAL_MS);
+  requestSync();
+}
+
+start();
@@ -0,0 +1,248 @@
+// 現場報告DXシステム - 送信待ちの写真のキュー（IndexedDB）
+// 画面（app.js）とService Worker（sw.js）の両方から読み込み、どちらからでも送信する。
+// 同じ写真を同時に送らないよう、送信する写真は1つのトランザクションで「送信中」にしてから送る。
+
+const QUEUE_DB_NAME = "photo-drop";
+const QUEUE_STORE = "queue";
+const SYNC_TAG = "photo-drop-upload";
+const UPLOAD_URL = "/api/upload";
+const OPTIONS_URL = "/api/options";
+
+// 送信中の写真を他の送信処理が扱わない時間（ミリ秒、送信中に画面を閉じた場合はこの後に再送）
+const LOCK_MS = 2 * 60 * 1000;
+
+// サーバーの設定（/api/options）を取得するまでの既定値
+let syncOptions = { concurrency: 2, retry_base_seconds: 5, retry_max_seconds: 300 };
+
+// キューの変更を画面に知らせる（Service Workerでの送信も画面の表示に反映する）
+const queueChannel = typeof BroadcastChannel !== "undefined" ? new BroadcastChannel("photo-drop-queue") : null;
+
+function notifyQueueChanged() {
+  if (queueChannel) {
+    queueChannel.postMessage({ type: "changed" });
+  }
+}
+
+function openQueueDb() {
+  return new Promise((resolve, reject) => {
+    const request = indexedDB.open(QUEUE_DB_NAME, 1);
+    request.onupgradeneeded = () => {
+      request.result.createObjectStore(QUEUE_STORE, { keyPath: "id" });
+    };
+    request.onsuccess = () => resolve(request.result);
+    request.onerror = () => reject(request.error);
+  });
+}
+
+// 1つのトランザクションを実行し、完了後にfnが返したリクエストの結果を返す
+function runQueueTransaction(mode, fn) {
+  return openQueueDb().then((db) => new Promise((resolve, reject) => {
+    const tx = db.transaction(QUEUE_STORE, mode);
+    const request = fn(tx.objectStore(QUEUE_STORE));
+    tx.oncomplete = () => {
+      db.close();
+      resolve(request ? request.result : undefined);
+    };
+    tx.onerror = tx.onabort = () => {
+      db.close();
+      reject(tx.error);
+    };
+  }));
+}
+
+function newId() {
+  if (self.crypto && self.crypto.randomUUID) {
+    return self.crypto.randomUUID();
+  }
+  return `${Date.now().toString(16)}-${Math.random().toString(16).slice(2)}`;
+}
+
+// サーバーのメタデータと同じ形式の日時（YYYY-MM-DD HH:MM:SS、端末の時刻）
+function formatTimestamp(date) {
+  const pad = (value) => String(value).padStart(2, "0");
+  return `${date.getFullYear()}-${pad(date.getMonth() + 1)}-${pad(date.getDate())} ` +
+    `${pad(date.getHours())}:${pad(date.getMinutes())}:${pad(date.getSeconds())}`;
+}
+
+// 撮影した写真とフォームの内容をキューに追加
+async function enqueuePhoto(file, metadata) {
+  const item = {
+    id: newId(),
+    blob: file,
+    filename: file.name || "photo.jpg",
+    metadata: metadata,
+    capturedAt: formatTimestamp(new Date()),
+    status: "pending",  // pending: 送信待ち / failed: サーバーが受け付けなかった（再送しない）
+    attempts: 0,
+    nextAttemptAt: 0,
+    lockedUntil: 0,
+    error: ""
+  };
+  await runQueueTransaction("readwrite", (store) => store.add(item));
+  notifyQueueChanged();
+  return item;
+}
+
+function listQueue() {
+  return runQueueTransaction("readonly", (store) => store.getAll());
+}
+
+async function removeFromQueue(id) {
+  await runQueueTransaction("readwrite", (store) => store.delete(id));
+  notifyQueueChanged();
+}
+
+// 送信できる写真を取り出して送信中にする
+function claimNext() {
+  const now = Date.now();
+  let claimed = null;
+  return openQueueDb().then((db) => new Promise((resolve, reject) => {
+    const tx = db.transaction(QUEUE_STORE, "readwrite");
+    tx.objectStore(QUEUE_STORE).openCursor().onsuccess = (event) => {
+      const cursor = event.target.result;
+      if (!cursor) {
+        return;
+      }
+      const item = cursor.value;
+      if (item.status === "pending" && item.nextAttemptAt <= now && item.lockedUntil <= now) {
+        item.lockedUntil = now + LOCK_MS;
+        cursor.update(item);
+        claimed = item;
+        return;
+      }
+      cursor.continue();
+    };
+    tx.oncomplete = () => {
+      db.close();
+      resolve(claimed);
+    };
+    tx.onerror = tx.onabort = () => {
+      db.close();
+      reject(tx.error);
+    };
+  }));
+}
+
+// 送信待ちの写真をすぐに再送する（電波が戻ったとき・再送ボタン）
+// 送信中の写真を他の送信処理と取り合わないよう、読み込みと書き込みを1つのトランザクションで行う
+async function retryAllNow() {
+  await runQueueTransaction("readwrite", (store) => {
+    store.openCursor().onsuccess = (event) => {
+      const cursor = event.target.result;
+      if (!cursor) {
+        return;
+      }
+      const item = cursor.value;
+      if (item.status === "failed") {
+        item.status = "pending";
+        item.attempts = 0;
+      }
+      item.nextAttemptAt = 0;
+      cursor.update(item);
+      cursor.continue();
+    };
+  });
+  notifyQueueChanged();
+}
+
+// 再送を待つ（失敗するたびに待ち時間を2倍、上限あり。多数の端末が同時に再送しないよう揺らぎを加える）
+async function scheduleRetry(item, error) {
+  item.attempts += 1;
+  const seconds = Math.min(
+    syncOptions.retry_base_seconds * 2 ** (item.attempts - 1),
+    syncOptions.retry_max_seconds
+  ) * (0.8 + Math.random() * 0.4);
+  item.nextAttemptAt = Date.now() + seconds * 1000;
+  item.lockedUntil = 0;
+  item.error = error;
+  await runQueueTransaction("readwrite", (store) => store.put(item));
+}
+
+async function markFailed(item, error) {
+  item.status = "failed";
+  item.lockedUntil = 0;
+  item.error = error;
+  await runQueueTransaction("readwrite", (store) => store.put(item));
+}
+
+async function uploadItem(item) {
+  const form = new FormData();
+  form.append("file", item.blob, item.filename);
+  form.append("client_id", item.id);
+  form.append("timestamp", item.capturedAt);
+  form.append("user_name", item.metadata.user_name || "");
+  form.append("location", item.metadata.location || "");
+  form.append("comment", item.metadata.comment || "");
+  for (const tag of item.metadata.tags || []) {
+    form.append("tags", tag);
+  }
+
+  let response;
+  try {
+    response = await fetch(UPLOAD_URL, { method: "POST", body: form });
+  } catch (e) {
+    await scheduleRetry(item, "通信できませんでした");
+    return;
+  }
+
+  if (response.ok) {
+    await runQueueTransaction("readwrite", (store) => store.delete(item.id));
+    return;
+  }
+
+  // 画像として読み込めない・大きすぎるなど、再送しても受け付けられない写真
+  if (response.status === 400 || response.status === 413) {
+    let error = `受け付けられませんでした (HTTP ${response.status})`;
+    try {
+      const body = await response.json();
+      error = (body.files && body.files[0] && body.files[0].error) || body.error || error;
+    } catch (e) {
+      // 応答がJSONでない場合はHTTPステータスを表示
+    }
+    await markFailed(item, error);
+    return;
+  }
+
+  await scheduleRetry(item, `サーバーエラー (HTTP ${response.status})`);
+}
+
+async function loadSyncOptions() {
+  try {
+    const response = await fetch(OPTIONS_URL);
+    if (response.ok) {
+      const options = await response.json();
+      syncOptions = Object.assign(syncOptions, options.sync || {});
+      return options;
+    }
+  } catch (e) {
+    // 圏外の場合は既定値のまま
+  }
+  return null;
+}
+
+// 送信待ちの写真を送信（同時に送る数はsyncOptions.concurrencyまで）
+let runningSync = null;
+
+function syncQueue() {
+  if (runningSync) {
+    return runningSync;
+  }
+  const worker = async () => {
+    for (;;) {
+      const item = await claimNext();
+      if (!item) {
+        return;
+      }
+      await uploadItem(item);
+      notifyQueueChanged();
+    }
+  };
+  const workers = [];
+  for (let i = 0; i < syncOptions.concurrency; i++) {
+    workers.push(worker());
+  }
+  runningSync = Promise.all(workers).finally(() => {
+    runningSync = null;
+  });
+  return runningSync;
+}
@@ -0,0 +1,66 @@
+// 現場報告DXシステム - オフライン対応版のService Worker
+// 画面のファイルをキャッシュして圏外でも開けるようにし、電波が戻ったら送信待ちの写真をバックグラウンドで送信する。
+
+importScripts("queue.js");
+
+// 画面のファイルを変更したら番号を上げる（古いキャッシュを削除して読み込み直す）
+const CACHE_NAME = "photo-drop-pwa-v1";
+const APP_SHELL = ["index.html", "app.js", "queue.js", "manifest.json", "icon.svg"];
+
+self.addEventListener("install", (event) => {
+  event.waitUntil(
+    caches.open(CACHE_NAME)
+      .then((cache) => cache.addAll(APP_SHELL))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil(
+    caches.keys()
+      .then((keys) => Promise.all(keys.filter((key) => key !== CACHE_NAME).map((key) => caches.delete(key))))
+      .then(() => self.clients.claim())
+  );
+});
+
+self.addEventListener("fetch", (event) => {
+  const request = event.request;
+  const url = new URL(request.url);
+  if (request.method !== "GET" || url.origin !== self.location.origin) {
+    return;
+  }
+
+  // タグ・場所の選択肢: 電波があれば最新を取得し、圏外ではキャッシュを使用
+  if (url.pathname === OPTIONS_URL) {
+    event.respondWith(
+      fetch(request)
+        .then((response) => {
+          const copy = response.clone();
+          caches.open(CACHE_NAME).then((cache) => cache.put(request, copy));
+          return response;
+        })
+        .catch(() => caches.match(request))
+    );
+    return;
+  }
+
+  // 画面のファイル: キャッシュを優先（圏外でもすぐに開ける）
+  if (url.pathname.startsWith("/pwa/")) {
+    event.respondWith(caches.match(request).then((cached) => cached || fetch(request)));
+  }
+});
+
+// 電波が戻ったときにブラウザが呼び出す（Background Sync APIに対応したブラウザのみ。画面を閉じていても送信する）
+self.addEventListener("sync", (event) => {
+  if (event.tag === SYNC_TAG) {
+    event.waitUntil(loadSyncOptions().then(() => syncQueue()).then(() => ensureQueueEmpty()));
+  }
+});
+
+// 再送を待っている写真が残っている場合は失敗として返し、ブラウザに後で再度呼び出させる
+async function ensureQueueEmpty() {
+  const items = await listQueue();
+  if (items.some((item) => item.status === "pending")) {
+    throw new Error("送信待ちの写真が残っています");
+  }
+}
@@ -3,16 +3,40 @@
 pytestによる自動テスト
 """
 import os
+import gzip
 import json
+import time
+import sys
 import shutil
+import subprocess
+import threading
 import pytest
 from pathlib import Path
 from unittest.mock import patch, MagicMock
 
 # テスト対象のモジュールをインポート
-from logics.metadata import create_metadata, validate_metadata, format_metadata_for_slack
+from config import Settings, get_settings, load_settings, reload_settings, apply_settings, PREVIEW_SIZES
+from logics.metadata import create_metadata, validate_metadata, format_metadata_for_slack, matches_filter
+from logics.records import Metadata, ImageRecord
+from logics.shared_store import MemoryStore, SqliteStore
 from logics.file_manager import ensure_folders_exist, save_image, delete_image, create_zip_archive
+from logics import storage, renderer
 from logics.utils import generate_uuid, get_timestamp, safe_filename
+from logics.image_formats import negotiate_format, encode_image, is_format_supported
+from logics.image_server import parse_range_header, build_image_response, get_etag
+from logics.renderer import (
+    get_render_key, compute_content_hash, store_original, render_annotated, render_web_variant, delete_rendered
+)
+from logics.overlay import add_text_to_image, get_banner_template, select_size_bucket, get_banner_layout
+from logics.metrics import Counter, Histogram, get_disk_usage, render_metrics
+from logics.tracing import span, image_span, trace_id_for, get_slowest_traces, clear_traces, to_otlp
+from logics.profiler import (
+    start_profiling, stop_profiling, get_folded_profile, set_stage_timing, is_stage_timing_enabled
+)
+from logics.startup import mark, get_startup_timings
+from logics.log_sink import (
+    BackgroundFileSink, DailyFileSink, SamplingFilter, format_json, maintain_log_folder
+)
 
 # テスト用ディレクトリとファイル
 TEST_DIR = Path("test_data")
@@ -40,6 +64,24 @@ def setup_test_environment():
 
 # メタデータテスト
 class TestMetadata:
+    def test_create_metadata_timestamp(self):
+        """オフラインで撮影した写真の撮影日時の引き継ぎのテスト"""
+        metadata = create_metadata("テスト太郎", "B1F", timestamp="2025-05-20 10:15:00")
+        assert metadata["timestamp"] == "2025-05-20 10:15:00"
+
+        # 形式が不正な場合は受信時刻
+        metadata = create_metadata("テスト太郎", "B1F", timestamp="昨日")
+        assert metadata["timestamp"] != "昨日"
+        assert validate_metadata(metadata)[0]
+
+    def test_matches_filter(self):
+        """一括削除の条件の判定のテスト"""
+        metadata = create_metadata(user_name="テスト太郎", location="A棟1F", tags=["施工前"])
+        assert matches_filter(metadata)
+        assert matches_filter(metadata, user_name="テスト太郎", tag="施工前")
+        assert not matches_filter(metadata, location="B棟2F")
+        assert not matches_filter(metadata, tag="完了")
+
     def test_create_metadata(self):
         """メタデータ作成のテスト"""
         # メタデータを作成
@@ -113,6 +155,76 @@ class TestMetadata:
         assert "テストコメント" in formatted
         assert "2025-05-20 12:34:56" in formatted
 
+# 画像レコードテスト
+class TestRecords:
+    def test_shared_tags(self):
+        """タグの順序の保持と同じ組み合わせのタプルの共有のテスト"""
+        tags = ["確認依頼", "施工前", "独自タグ"]
+        first = Metadata(tags=tags)
+        second = Metadata(tags=list(tags))
+
+        # 指定した順のまま（config.TAGSの順に並べ替えない）
+        assert first.tags == tags
+        assert first.tag_tuple is second.tag_tuple
+        # 取得したリストを変更しても保持しているタグは変わらない
+        first.tags.append("追加")
+        assert second.tags == tags
+        assert Metadata().tags == []
+
+    def test_create_metadata_returns_dict(self):
+        """create_metadataが従来どおりJSONに変換できる辞書を返すことのテスト"""
+        tags = ["確認依頼", "施工前"]
+        metadata = create_metadata("", "", tags, None, timestamp="2025-05-20 12:34:56")
+
+        assert type(metadata) is dict
+        assert metadata["tags"] is tags
+        assert json.loads(json.dumps(metadata, ensure_ascii=False)) == {
+            "user_name": "名前未設定",
+            "location": "場所未設定",
+            "tags": ["確認依頼", "施工前"],
+            "comment": "",
+            "timestamp": "2025-05-20 12:34:56"
+        }
+        # 画像リストのレコードに入れても順序は変わらない
+        assert ImageRecord("a.jpg", "a", metadata, "a.jpg").to_dict()["metadata"] == metadata
+
+    def test_metadata_dict_compatible(self):
+        """メタデータを辞書と同じ形式で扱えることのテスト"""
+        data = {
+            "user_name": "テスト太郎",
+            "location": "A棟1F",
+            "tags": ["施工前", "確認依頼"],
+            "comment": "",
+            "timestamp": "2025-05-20 12:34:56"
+        }
+        metadata = Metadata.from_dict(data)
+
+        assert dict(metadata) == data
+        assert metadata == data
+        assert validate_metadata(metadata) == (True, "")
+        assert format_metadata_for_slack(metadata) == format_metadata_for_slack(data)
+        # 作成済み画像のキャッシュキーは辞書の場合と同じ
+        assert get_render_key("a" * 64, metadata) == get_render_key("a" * 64, data)
+        # 同じ名前・場所の文字列は共有される
+        assert Metadata.from_dict(json.loads(json.dumps(data))).location is metadata.location
+
+    def test_image_record_json(self):
+        """画像レコードと従来のJSON形式の相互変換のテスト"""
+        data = {
+            "original_path": "data/uploaded/originals/abc.jpg",
+            "original_hash": "abc",
+            "metadata": create_metadata("テスト太郎", "A棟1F", ["施工後"], "メモ"),
+            "preview_url": "/images/1/preview?v=abc",
+            "filename": "photo.jpg",
+            "quality": {"sharpness": 120.5, "brightness": 110.0, "dark": 0.0, "bright": 0.01}
+        }
+        record = ImageRecord.from_dict(json.loads(json.dumps(data)))
+
+        assert record.metadata.tags == ["施工後"]
+        assert record.to_dict() == data
+        with pytest.raises(AttributeError):
+            record.extra = 1
+
 # ファイル管理テスト
 class TestFileManager:
     def test_ensure_folders_exist(self, setup_test_environment):
@@ -170,6 +282,32 @@ class TestFileManager:
         # ZIPファイルのサイズをチェック
         assert os.path.getsize(zip_path) > 0
 
+    @pytest.mark.asyncio
+    async def test_storage(self, setup_test_environment):
+        """ファイル入出力ワーカー経由の読み書きのテスト"""
+        file_path = TEST_UPLOAD_DIR / "storage_test.jpg"
+        assert await storage.save_image(b"0123456789", file_path) is True
+        assert await storage.file_size(file_path) == 10
+        assert await storage.read_file(file_path) == b"0123456789"
+
+        # 範囲を指定して分割読み込み
+        chunks = [chunk async for chunk in storage.iter_file(file_path, 2, 8, chunk_size=3)]
+        assert chunks == [b"234", b"567", b"8"]
+
+        # 上限を超えるアップロードは読み込みを中止
+        upload = MagicMock(filename="big.jpg")
+        parts = [b"x" * 4, b"x" * 4, b"x" * 4, b""]
+
+        async def read(size):
+            return parts.pop(0)
+
+        upload.read = read
+        assert await storage.read_upload(upload, max_bytes=10, chunk_size=4) is None
+        assert parts == [b""]
+
+        assert await storage.delete_image(file_path) is True
+        assert await storage.file_size(file_path) is None
+
 # ユーティリティテスト
 class TestUtils:
     def test_generate_uuid(self):
@@ -215,20 +353,920 @@ class TestUtils:
         assert "file" in safe_name
         assert ".jpg" in safe_name
 
-# Slack通知テスト（モック使用）
+# 画像フォーマットテスト
+class TestImageFormats:
+    def test_negotiate_format(self):
+        """Acceptヘッダーによるフォーマット選択のテスト"""
+        available = ["avif", "webp", "jpeg"]
+
+        # AVIF/WebPに対応したブラウザ
+        assert negotiate_format("image/avif,image/webp,*/*", available) == "avif"
+        assert negotiate_format("image/webp,*/*;q=0.8", available) == "webp"
+
+        # q=0で拒否されたフォーマットは選ばない
+        assert negotiate_format("image/avif;q=0,image/webp", available) == "webp"
+
+        # 明示的な宣言がなければJPEGにフォールバック
+        assert negotiate_format("*/*", available) == "jpeg"
+        assert negotiate_format("", available) == "jpeg"
+
+    def test_encode_image(self):
+        """各フォーマットでのエンコードのテスト"""
+        from PIL import Image
+
+        img = Image.new("RGBA", (64, 48), (200, 100, 50, 255))
+
+        jpeg_data = encode_image(img, "jpeg")
+        assert jpeg_data[:2] == b"\xff\xd8"
+
+        if is_format_supported("webp"):
+            webp_data = encode_image(img, "webp")
+            assert webp_data[:4] == b"RIFF"
+            assert webp_data[8:12] == b"WEBP"
+
+# 画像オーバーレイテスト
+class TestOverlay:
+    def test_add_text_to_image(self):
+        """メタデータバナー合成とテンプレートキャッシュのテスト"""
+        from PIL import Image
+
+        metadata = {
+            "user_name": "テスト太郎",
+            "location": "A棟1F",
+            "tags": ["施工前"],
+            "comment": "",
+            "timestamp": "2025-05-20 12:34:56"
+        }
+
+        get_banner_template.cache_clear()
+        for _ in range(3):
+            img = Image.new("RGBA", (640, 480), (200, 200, 200, 255))
+            result = add_text_to_image(img, metadata)
+
+            assert result.mode == "RGB"
+            assert result.size == (640, 480)
+            # バナー部分は暗く、それ以外は元のまま
+            assert result.getpixel((630, 5))[0] < 200
+            assert result.getpixel((630, 470)) == (200, 200, 200)
+
+        # 同じメタデータのバナーは1度だけ描画される
+        info = get_banner_template.cache_info()
+        assert info.misses == 1
+        assert info.hits == 2
+
+        # RGBの元画像は変更しない
+        img = Image.new("RGB", (640, 480), (200, 200, 200))
+        result = add_text_to_image(img, metadata)
+        assert result is not img
+        assert img.getpixel((630, 5)) == (200, 200, 200)
+        assert result.getpixel((630, 5))[0] < 200
+
+    def test_banner_layout_scales_with_resolution(self):
+        """解像度に応じたバナーのレイアウトのテスト"""
+        # 短辺でバケットを選択（縦横の向きによらず同じ）
+        assert select_size_bucket(4032, 3024) == select_size_bucket(3024, 4032)
+        assert select_size_bucket(100, 100) == 480
+
+        small = get_banner_layout(select_size_bucket(640, 480))
+        base = get_banner_layout(select_size_bucket(1920, 1080))
+        large = get_banner_layout(select_size_bucket(4032, 3024))
+
+        assert base.font_size == 24
+        assert small.font_size < base.font_size < large.font_size
+        assert small.line_height < base.line_height < large.line_height
+
+# 画像レンダリングテスト
+class TestRenderer:
+    def test_lazy_render_and_cache(self, setup_test_environment):
+        """元画像の保持と合成済み画像のキャッシュのテスト"""
+        import io
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (800, 600), (120, 160, 200)).save(buffer, "JPEG")
+        content = buffer.getvalue()
+
+        metadata = create_metadata(user_name="テスト太郎", location="A棟1F", tags=["施工前"])
+
+        with patch("logics.renderer.ORIGINAL_FOLDER", TEST_UPLOAD_DIR / "originals"), \
+             patch("logics.renderer.RENDER_CACHE_FOLDER", TEST_UPLOAD_DIR / "rendered"), \
+             patch("logics.renderer.PREVIEW_FOLDER", TEST_UPLOAD_DIR / "web"):
+
+            original_hash = compute_content_hash(content)
+            original_path = store_original(content, original_hash, ".JPG")
+
+            # 元画像はバナーなしでそのまま保存される
+            assert original_path.read_bytes() == content
+            assert original_path.suffix == ".jpg"
+
+            # 合成済み画像は初回要求時に作成され、2回目はキャッシュを返す
+            annotated = render_annotated(original_path, original_hash, metadata)
+            mtime = annotated.stat().st_mtime_ns
+            assert render_annotated(original_path, original_hash, metadata) == annotated
+            assert annotated.stat().st_mtime_ns == mtime
+
+            with Image.open(annotated) as img:
+                assert img.size == (800, 600)
+
+            # メタデータが変わると別の画像が作成される
+            changed = dict(metadata, location="B棟2F")
+            assert render_annotated(original_path, original_hash, changed) != annotated
+
+            preview = render_web_variant(original_path, original_hash, metadata, "thumb", "jpeg")
+            with Image.open(preview) as img:
+                assert max(img.size) == 320
+
+            assert delete_rendered(original_hash) == 3
+            assert not annotated.exists()
+
+            # 作成に失敗した場合も出力パスごとのロックは残らない
+            with pytest.raises(OSError):
+                render_annotated(TEST_UPLOAD_DIR / "originals" / "missing.jpg", "0" * 64, metadata)
+            assert renderer._render_locks == {}
+
+# 取り込み前の画像の確認テスト
+class TestPreflight:
+    def test_probe_image(self, setup_test_environment):
+        """ヘッダーのみでの形式・解像度・色の形式の確認のテスト"""
+        import io
+        import zlib
+        import struct
+        from PIL import Image
+        from logics.preflight import probe_image, sniff_format
+        from logics.utils import is_valid_image_file
+
+        def encode(img, fmt):
+            buffer = io.BytesIO()
+            img.save(buffer, fmt)
+            return buffer.getvalue()
+
+        settings = get_settings()
+        jpeg = encode(Image.new("RGB", (320, 240)), "JPEG")
+        assert probe_image(jpeg, settings) == ({"format": "JPEG", "width": 320, "height": 240, "mode": "RGB"}, "")
+        assert sniff_format(encode(Image.new("RGB", (8, 8)), "WEBP")[:32]) == "WEBP"
+
+        # 画像でないファイル・拡張子だけ画像のファイル
+        assert probe_image(b"<html>not an image</html>", settings)[0] is None
+        assert probe_image(b"\xff\xd8\xff" + b"\x00" * 64, settings) == (None, "画像として読み込めません")
+
+        # 展開すると巨大になるPNG（ヘッダーの幅・高さのみ書き換え、デコードせずに拒否）
+        png = bytearray(encode(Image.new("L", (16, 16)), "PNG"))
+        ihdr = struct.pack(">II", 100_000, 100_000) + bytes(png[24:29])
+        png[16:29] = ihdr
+        png[29:33] = struct.pack(">I", zlib.crc32(b"IHDR" + ihdr))
+        info, error = probe_image(bytes(png), settings)
+        assert info is None and "上限" in error
+        assert probe_image(bytes(png), settings.replace(max_image_side=200_000))[0] is None
+
+        # 画素数の上限は設定の値と比較し、Pillow全体の上限は変更しない
+        max_pixels = Image.MAX_IMAGE_PIXELS
+        assert probe_image(jpeg, settings.replace(max_image_pixels=1000))[1].startswith("画像の解像度が上限（1000画素）")
+        assert Image.MAX_IMAGE_PIXELS == max_pixels
+
+        # 設定で受け付けない形式・色の形式
+        bmp = encode(Image.new("RGB", (16, 16)), "BMP")
+        assert probe_image(bmp, settings)[0]["format"] == "BMP"
+        assert probe_image(bmp, settings.replace(allowed_image_formats="jpeg,png"))[1] == "対応していない画像形式です (BMP)"
+        with patch("logics.preflight.ALLOWED_IMAGE_MODES", {"RGB"}):
+            assert probe_image(encode(Image.new("LA", (16, 16)), "PNG"), settings)[1] == "対応していない色の形式です (LA)"
+
+        path = TEST_DIR / "preflight.jpg"
+        path.write_bytes(jpeg)
+        assert probe_image(path, settings)[0]["width"] == 320
+        assert is_valid_image_file(path)
+        assert not is_valid_image_file(TEST_UPLOAD_DIR / "test_image.jpg")
+
+    def test_check_and_ingest(self, setup_test_environment):
+        """アップロードされた画像の確認と取り込みを1回のワーカー呼び出しで行うテスト"""
+        import io
+        from PIL import Image
+        from logics.ingest import check_and_ingest
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 48)).save(buffer, "JPEG")
+        with patch("logics.renderer.ORIGINAL_FOLDER", TEST_UPLOAD_DIR / "checked"):
+            record, error = check_and_ingest(buffer.getvalue(), "a.jpg", create_metadata("山田", "A棟"))
+            assert error == "" and record.filename == "a.jpg"
+            assert check_and_ingest(b"<html>not an image</html>", "x.jpg", create_metadata("山田", "A棟")) == \
+                (None, "画像ファイルではありません")
+
+    def test_original_extension(self, setup_test_environment):
+        """元画像の拡張子がファイル名ではなく判別した形式で決まることのテスト"""
+        import io
+        from PIL import Image
+        from logics.ingest import ingest_upload
+
+        payloads = {}
+        for fmt in ("JPEG", "PNG"):
+            buffer = io.BytesIO()
+            Image.new("RGB", (32, 32), (10, 20, 30)).save(buffer, fmt)
+            payloads[fmt] = buffer.getvalue()
+
+        with patch("logics.renderer.ORIGINAL_FOLDER", TEST_UPLOAD_DIR / "extension_originals"):
+            jpeg = ingest_upload(payloads["JPEG"], "x.php", create_metadata("山田", "A棟"))
+            png = ingest_upload(payloads["PNG"], "photo.jpg", create_metadata("山田", "A棟"))
+        assert Path(jpeg.original_path).suffix == ".jpg"
+        assert Path(png.original_path).suffix == ".png"
+
+    def test_heif_upload(self, setup_test_environment):
+        """HEIC（iPhoneの写真）の取り込みとJPEGへの変換のテスト"""
+        pytest.importorskip("pillow_heif")
+        import io
+        from PIL import Image
+        from logics.image_formats import enable_heif
+        from logics.ingest import ingest_upload
+        from logics.preflight import probe_image
+
+        assert enable_heif()
+        exif = Image.Exif()
+        exif[0x0112] = 6  # 90度回転して表示する写真
+        buffer = io.BytesIO()
+        Image.new("RGB", (320, 240), (200, 120, 40)).save(buffer, "HEIF", exif=exif.tobytes())
+        heic = buffer.getvalue()
+
+        settings = get_settings()
+        assert probe_image(heic, settings)[0] == {"format": "HEIF", "width": 240, "height": 320, "mode": "RGB"}
+        assert probe_image(heic, settings.replace(allowed_image_formats="JPEG"))[1] == "対応していない画像形式です (HEIF)"
+
+        with patch("logics.renderer.ORIGINAL_FOLDER", TEST_UPLOAD_DIR / "heif_originals"):
+            record = ingest_upload(heic, "IMG_0001.HEIC", create_metadata("山田", "A棟"))
+        original_path = Path(record.original_path)
+        assert original_path.suffix == ".jpg"
+        assert record.original_hash == compute_content_hash(original_path.read_bytes())
+        assert record.quality is not None
+        with Image.open(original_path) as img:
+            # 向きを補正した画像として保存され、EXIFの向きは補正済み（1）になる
+            assert (img.format, img.size) == ("JPEG", (240, 320))
+            assert img.getexif().get(0x0112) == 1
+
+# 画像の品質判定テスト
+class TestQuality:
+    def test_analyze_quality(self):
+        """ピンぼけ・露出の判定のテスト"""
+        import io
+        from PIL import Image, ImageDraw, ImageFilter
+        from logics.quality import analyze_quality, get_quality_flags, exclude_flagged
+
+        sharp = Image.new("RGB", (1600, 1200), (128, 128, 128))
+        draw = ImageDraw.Draw(sharp)
+        for x in range(0, 1600, 40):
+            draw.rectangle([x, 0, x + 19, 1200], fill=(230, 230, 230))
+            draw.line([0, x, 1600, x + 300], fill=(20, 20, 20), width=3)
+
+        def reopen(img):
+            buffer = io.BytesIO()
+            img.save(buffer, "JPEG", quality=90)
+            return Image.open(io.BytesIO(buffer.getvalue()))
+
+        settings = get_settings()
+        scores = analyze_quality(reopen(sharp))
+        assert get_quality_flags(scores, settings) == []
+
+        blurred = analyze_quality(reopen(sharp.filter(ImageFilter.GaussianBlur(12))))
+        assert blurred["sharpness"] < scores["sharpness"] / 10
+        assert get_quality_flags(blurred, settings) == ["blurry"]
+
+        black = analyze_quality(reopen(Image.new("RGB", (1600, 1200), (3, 3, 3))))
+        assert black["dark"] > 0.9
+        assert get_quality_flags(black, settings) == ["dark"]
+        assert get_quality_flags(analyze_quality(Image.new("RGB", (64, 64), (255, 255, 255))), settings) == ["overexposed"]
+        assert get_quality_flags(None, settings) == []
+
+        items = [("a", ImageRecord("a.jpg", "a", {}, "a.jpg", quality=scores)),
+                 ("b", ImageRecord("b.jpg", "b", {}, "b.jpg", quality=black))]
+        assert exclude_flagged(items, settings) == (items, 0)
+        kept, excluded = exclude_flagged(items, settings.replace(quality_exclude_flagged=True))
+        assert [img_uuid for img_uuid, _ in kept] == ["a"] and excluded == 1
+
+# 画像配信テスト
+class TestImageServer:
+    def test_parse_range_header(self):
+        """Rangeヘッダー解析のテスト"""
+        assert parse_range_header(None, 1000) is None
+        assert parse_range_header("bytes=0-99", 1000) == (0, 99)
+        assert parse_range_header("bytes=900-", 1000) == (900, 999)
+        assert parse_range_header("bytes=-100", 1000) == (900, 999)
+        assert parse_range_header("bytes=500-5000", 1000) == (500, 999)
+
+        # 複数範囲・不正な指定は無視
+        assert parse_range_header("bytes=0-1,5-6", 1000) is None
+        assert parse_range_header("items=0-1", 1000) is None
+
+        # 満たせない範囲はエラー
+        with pytest.raises(ValueError):
+            parse_range_header("bytes=1000-", 1000)
+
+    @staticmethod
+    async def _send(response, method="GET", extensions=None):
+        """レスポンスをASGIで送信し、(本文, 送信したメッセージ)を取得"""
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": method, "extensions": extensions or {}}
+        await response(scope, None, send)
+        body = b"".join(message.get("body", b"") for message in messages)
+        return body, messages
+
+    @pytest.mark.asyncio
+    async def test_build_image_response(self, setup_test_environment):
+        """ETag・304・206応答のテスト"""
+        file_path = TEST_UPLOAD_DIR / "serve_test.jpg"
+        with open(file_path, "wb") as f:
+            f.write(b"0123456789")
+
+        etag = get_etag(file_path)
+
+        response = build_image_response(file_path, "image/jpeg", {})
+        assert response.status_code == 200
+        assert (await self._send(response))[0] == b"0123456789"
+        assert response.headers["content-length"] == "10"
+        assert response.headers["etag"] == etag
+        assert "immutable" in response.headers["cache-control"]
+
+        response = build_image_response(file_path, "image/jpeg", {"if-none-match": etag})
+        assert response.status_code == 304
+
+        response = build_image_response(file_path, "image/jpeg", {"range": "bytes=2-5"})
+        assert response.status_code == 206
+        assert (await self._send(response))[0] == b"2345"
+        assert response.headers["content-range"] == "bytes 2-5/10"
+
+        # HEADは本文なし、pathsend対応サーバーにはファイル全体の送信を任せる
+        response = build_image_response(file_path, "image/jpeg", {})
+        assert (await self._send(response, "HEAD"))[0] == b""
+        _, messages = await self._send(response, extensions={"http.response.pathsend": {}})
+        assert messages[-1] == {"type": "http.response.pathsend", "path": str(file_path)}
+
+        response = build_image_response(file_path, "image/jpeg", {"range": "bytes=20-"})
+        assert response.status_code == 416
+
+    def test_etag_cache_bounded(self, setup_test_environment):
+        """ETagのキャッシュが上限件数を超えないことのテスト"""
+        from collections import OrderedDict
+        from logics import image_server
+
+        paths = []
+        for i in range(5):
+            path = TEST_UPLOAD_DIR / f"etag_{i}.jpg"
+            path.write_bytes(f"image {i}".encode("ascii"))
+            paths.append(path)
+
+        with patch("logics.image_server.ETAG_CACHE_SIZE", 3), \
+             patch("logics.image_server._etag_cache", OrderedDict()):
+            etags = [get_etag(path) for path in paths]
+            assert list(image_server._etag_cache) == [str(path) for path in paths[2:]]
+            # 破棄されたファイルも同じETagを再計算
+            assert get_etag(paths[0]) == etags[0]
+            assert len(image_server._etag_cache) == 3
+
+# メトリクステスト
+class TestMetrics:
+    def test_histogram_and_counter(self):
+        """ヒストグラム・カウンターの集計と出力のテスト"""
+        histogram = Histogram("test_duration_seconds", "テスト", labels=("stage",), buckets=[0.1, 1.0])
+        histogram.observe(0.05, "decode")
+        histogram.observe(0.5, "decode")
+        histogram.observe(5.0, "decode")
+        with histogram.time("encode"):
+            pass
+
+        counter = Counter("test_requests_total", "テスト", labels=("status",))
+        counter.inc("200")
+        counter.inc("200")
+
+        assert histogram.count("decode") == 3
+        assert histogram.count("encode") == 1
+        assert counter.get("200") == 2
+
+        text = render_metrics()
+        assert "# TYPE test_duration_seconds histogram" in text
+        assert 'test_duration_seconds_bucket{stage="decode",le="0.1"} 1' in text
+        assert 'test_duration_seconds_bucket{stage="decode",le="1"} 2' in text
+        assert 'test_duration_seconds_bucket{stage="decode",le="+Inf"} 3' in text
+        assert 'test_duration_seconds_count{stage="decode"} 3' in text
+        assert 'test_requests_total{status="200"} 2' in text
+
+    def test_get_disk_usage(self, setup_test_environment):
+        """保存フォルダの使用量計算のテスト"""
+        folder = TEST_DIR / "usage"
+        (folder / "sub").mkdir(parents=True, exist_ok=True)
+        (folder / "a.bin").write_bytes(b"x" * 10)
+        (folder / "sub" / "b.bin").write_bytes(b"x" * 5)
+
+        assert get_disk_usage(folder) == (15, 2)
+
+# トレーステスト
+class TestTracing:
+    def test_spans_per_image(self):
+        """画像ごとのトレースとスパンの親子関係のテスト"""
+        clear_traces()
+        fast_id = trace_id_for("00000000-0000-4000-8000-000000000001")
+        slow_id = trace_id_for("00000000-0000-4000-8000-000000000002")
+        assert len(fast_id) == 32
+
+        # トレースIDも実行中のスパンもなければ記録しない
+        with span("ignored") as current:
+            assert current is None
+
+        with span("handle_upload", trace_id=fast_id):
+            with span("save"):
+                pass
+        with span("handle_upload", trace_id=slow_id) as root:
+            with span("save") as child:
+                assert child.parent_id == root.span_id
+                with pytest.raises(ValueError):
+                    with span("decode"):
+                        time.sleep(0.01)
+                        raise ValueError("壊れた画像")
+
+        # 後から行う処理はアップロード時のルートスパンにつながる
+        with span("send_slack_notification", trace_id=slow_id) as later:
+            assert later.parent_id == root.span_id
+
+        traces = get_slowest_traces()
+        assert [trace["trace_id"] for trace in traces] == [slow_id, fast_id]
+        assert traces[0]["error"] is True
+        assert [item["name"] for item in traces[0]["spans"]] == [
+            "handle_upload", "save", "decode", "send_slack_notification"
+        ]
+        assert [item["depth"] for item in traces[0]["spans"]] == [0, 1, 2, 1]
+
+    def test_to_otlp(self):
+        """OTLP/JSON形式への変換のテスト"""
+        clear_traces()
+        trace_id = trace_id_for("00000000-0000-4000-8000-000000000003")
+        with span("handle_upload", trace_id=trace_id, filename="a.jpg", size=10) as current:
+            pass
+
+        data = to_otlp([current])
+        otlp_span = data["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        assert otlp_span["traceId"] == trace_id
+        assert otlp_span["name"] == "handle_upload"
+        assert "parentSpanId" not in otlp_span
+        assert {"key": "size", "value": {"intValue": "10"}} in otlp_span["attributes"]
+        assert int(otlp_span["endTimeUnixNano"]) >= int(otlp_span["startTimeUnixNano"])
+
+# ログ出力テスト
+class TestLogSink:
+    def test_json_log_with_sampling(self, setup_test_environment):
+        """JSON形式・バックグラウンド書き込み・間引きのテスト"""
+        from loguru import logger
+
+        log_path = TEST_LOG_DIR / "structured.log"
+        handler_id = logger.add(
+            BackgroundFileSink(log_path),
+            format=format_json,
+            filter=SamplingFilter({"zip_entry": 5}),
+            level="INFO",
+            colorize=False
+        )
+        try:
+            with logger.contextualize(session="client-1"):
+                with image_span("handle_upload", "00000000-0000-4000-8000-000000000004"):
+                    logger.bind(duration_ms=12.5).info("画像アップロード")
+            for i in range(10):
+                logger.bind(sample="zip_entry").info(f"ZIP追加: {i}")
+            logger.bind(sample="zip_entry").warning("ZIP追加対象のファイルが存在しません")
+        finally:
+            # 削除時に書き込み待ちのログがすべて書き出される
+            logger.remove(handler_id)
+
+        records = [json.loads(line) for line in log_path.read_text(encoding="utf-8").splitlines()]
+        assert records[0]["message"] == "画像アップロード"
+        assert records[0]["session"] == "client-1"
+        assert records[0]["image_uuid"] == "00000000-0000-4000-8000-000000000004"
+        assert records[0]["trace_id"] == "00000000000040008000000000000004"
+        assert records[0]["duration_ms"] == 12.5
+        assert "sample" not in records[1]
+
+        # 10件中2件と、警告は常に出力
+        assert [record["message"] for record in records[1:]] == [
+            "ZIP追加: 0", "ZIP追加: 5", "ZIP追加対象のファイルが存在しません"
+        ]
+
+    def test_slow_writer_does_not_block(self, setup_test_environment):
+        """ファイルの書き込みが遅くてもログの出力を待たないことのテスト"""
+        from loguru import logger
+
+        class SlowSink(BackgroundFileSink):
+            def _write_lines(self, lines):
+                time.sleep(0.2)
+                super()._write_lines(lines)
+
+        log_path = TEST_LOG_DIR / "slow.log"
+        handler_id = logger.add(SlowSink(log_path), format="{message}", level="INFO", colorize=False)
+        try:
+            started = time.perf_counter()
+            for i in range(5):
+                logger.info(f"ログ {i}")
+            assert time.perf_counter() - started < 0.2
+        finally:
+            # 削除時に書き込み待ちのログがすべて書き出される
+            logger.remove(handler_id)
+
+        assert log_path.read_text(encoding="utf-8").splitlines() == [f"ログ {i}" for i in range(5)]
+
+    def test_daily_sink_switches_folder(self, setup_test_environment):
+        """日付変更時のフォルダ切り替えと前日のログの圧縮のテスト"""
+        log_folder = TEST_LOG_DIR / "daily"
+        shutil.rmtree(log_folder, ignore_errors=True)
+
+        days = ["20250101"]
+        sink = DailyFileSink(log_folder)
+        sink.today = lambda: days[0]
+
+        sink.write("1日目\n")
+        sink.queue.join()
+        days[0] = "20250102"
+        sink.write("2日目\n")
+        sink.stop()
+
+        assert (log_folder / "20250102" / "app.log").read_text(encoding="utf-8") == "2日目\n"
+        assert not (log_folder / "20250101" / "app.log").exists()
+        with gzip.open(log_folder / "20250101" / "app.log.gz", "rt", encoding="utf-8") as f:
+            assert f.read() == "1日目\n"
+
+    def test_maintain_log_folder(self, setup_test_environment):
+        """保持期間・合計サイズの上限による古いログの削除のテスト"""
+        log_folder = TEST_LOG_DIR / "retention"
+        shutil.rmtree(log_folder, ignore_errors=True)
+        for day in ["20250101", "20250125", "20250128", "20250130"]:
+            (log_folder / day).mkdir(parents=True)
+            (log_folder / day / "app.log").write_bytes(b"x" * 1000)
+
+        # 保持期間（7日）を過ぎた日を削除し、前日以前は圧縮
+        removed = maintain_log_folder(log_folder, "20250130", retention_days=7, max_total_size=10 ** 6)
+        assert removed == ["20250101"]
+        assert (log_folder / "20250125" / "app.log.gz").exists()
+        assert (log_folder / "20250130" / "app.log").exists()
+
+        # 合計サイズの上限を超えた分は古い日から削除（当日は残す）
+        removed = maintain_log_folder(log_folder, "20250130", retention_days=7, max_total_size=1000)
+        assert removed == ["20250125", "20250128"]
+        assert (log_folder / "20250130" / "app.log").exists()
+
+    def test_maintain_log_folder_multiprocess(self, setup_test_environment):
+        """複数プロセスでは自分のログのみ圧縮し、削除しないプロセスは古い日を残すことのテスト"""
+        from logics.cluster import build_worker_env
+
+        log_folder = TEST_LOG_DIR / "multiprocess"
+        shutil.rmtree(log_folder, ignore_errors=True)
+        for day in ["20250101", "20250129"]:
+            (log_folder / day).mkdir(parents=True)
+            for name in ["app.w1.log", "app.w2.log"]:
+                (log_folder / day / name).write_bytes(b"x" * 1000)
+
+        removed = maintain_log_folder(log_folder, "20250130", retention_days=7, max_total_size=10 ** 6,
+                                      filename="app.w2.log", prune=False)
+        assert removed == []
+        assert (log_folder / "20250101").exists()
+        # 他のプロセス（w1）が書き込み中の可能性があるファイルは圧縮しない
+        assert (log_folder / "20250129" / "app.w2.log.gz").exists()
+        assert (log_folder / "20250129" / "app.w1.log").exists()
+
+        # 古い日の削除は1つ目のプロセスのみ
+        assert build_worker_env(1, 8081, "shared.db", {})["LOG_PRUNE"] == "true"
+        assert build_worker_env(2, 8082, "shared.db", {})["LOG_PRUNE"] == "false"
+
+# プロファイラーテスト
+def _busy_loop(stop_event):
+    while not stop_event.is_set():
+        sum(range(1000))
+
+class TestProfiler:
+    def test_sampling_profile(self):
+        """スタック採取とfolded形式出力のテスト"""
+        stop_event = threading.Event()
+        worker = threading.Thread(target=_busy_loop, args=(stop_event,), name="busy-worker")
+        worker.start()
+        try:
+            assert start_profiling(duration=5, interval=0.001) is True
+            # 採取中は重ねて開始できない
+            assert start_profiling(duration=5) is False
+
+            time.sleep(0.2)
+            status = stop_profiling()
+        finally:
+            stop_event.set()
+            worker.join()
+
+        assert status["running"] is False
+        assert status["samples"] > 0
+
+        folded = get_folded_profile()
+        busy_lines = [line for line in folded.splitlines() if line.startswith("busy-worker;")]
+        assert busy_lines
+        assert all(int(line.rsplit(" ", 1)[1]) > 0 for line in busy_lines)
+        assert any("test_app:_busy_loop" in line for line in busy_lines)
+
+    def test_stage_timing_toggle(self):
+        """段階ごとの所要時間のログ出力の切り替えのテスト"""
+        set_stage_timing(True)
+        assert is_stage_timing_enabled() is True
+        set_stage_timing(False)
+        assert is_stage_timing_enabled() is False
+
+# 起動処理テスト
+class TestStartup:
+    def test_mark(self):
+        """起動の段階の記録のテスト"""
+        first = mark("test_phase")
+        second = mark("test_phase_2")
+        timings = get_startup_timings()
+        assert 0 <= first <= second
+        assert timings["test_phase"] == first
+        assert timings["test_phase_2"] == second
+
+    def test_heavy_modules_not_imported(self):
+        """画像処理・Slack送信のモジュールを読み込んでもPillow・NumPy・aiohttpを読み込まないことのテスト"""
+        code = (
+            "import sys, logics.renderer, logics.ingest, logics.notifier, logics.image_formats, logics.quality; "
+            "print(' '.join(name for name in ('PIL.Image', 'numpy', 'aiohttp') if name in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code], cwd=Path(__file__).parent.parent, capture_output=True, text=True
+        )
+        assert result.returncode == 0, result.stderr
+        assert result.stdout.strip() == ""
+
+# 共有ストアテスト
+class TestSharedStore:
+    def test_sqlite_store_shared(self, setup_test_environment):
+        """別の接続（別のプロセス）から画像リスト・ユーザー情報が見えることのテスト"""
+        path = TEST_DIR / "shared.db"
+        first = SqliteStore(path, "w1")
+        second = SqliteStore(path, "w2")
+        assert first.connect().execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+        record = ImageRecord("/tmp/a.jpg", "a" * 64, {"user_name": "山田", "tags": ["作業前"]}, "a.jpg")
+        first.images["uuid-1"] = record
+        first.images["uuid-2"] = ImageRecord("/tmp/b.jpg", "b" * 64, {}, "b.jpg")
+        assert "uuid-1" in second.images
+        assert second.images.keys() == ["uuid-1", "uuid-2"]
+        assert second.images["uuid-1"].metadata == record.metadata
+        assert second.images_version() == 2
+
+        assert second.images.pop("uuid-1").filename == "a.jpg"
+        assert len(first.images) == 1
+        assert first.images.get("uuid-1") is None
+        assert first.images_version() == 3
+
+        first.update_state("current_user", name="山田", location="2F")
+        second.update_state("current_user", tags=["完了"])
+        assert first.get_state("current_user") == {"name": "山田", "location": "2F", "tags": ["完了"]}
+
+    @pytest.mark.asyncio
+    async def test_bulk_delete(self, setup_test_environment):
+        """画像リストからの一括削除と元画像・作成済み画像のまとめての削除のテスト"""
+        with patch("logics.renderer.RENDER_CACHE_FOLDER", TEST_UPLOAD_DIR / "bulk_rendered"), \
+             patch("logics.renderer.PREVIEW_FOLDER", TEST_UPLOAD_DIR / "bulk_web"):
+            (TEST_UPLOAD_DIR / "bulk_rendered").mkdir()
+            (TEST_UPLOAD_DIR / "bulk_web").mkdir()
+
+            for store in (SqliteStore(TEST_DIR / "bulk.db"), MemoryStore()):
+                originals = {}
+                for i in range(5):
+                    original_hash = compute_content_hash(str(i).encode())
+                    path = TEST_UPLOAD_DIR / f"bulk_{i}.jpg"
+                    path.write_bytes(b"x")
+                    (TEST_UPLOAD_DIR / "bulk_rendered" / f"{original_hash[:32]}_v.jpg").write_bytes(b"x")
+                    store.images[f"uuid-{i}"] = ImageRecord(path, original_hash, {"user_name": f"作業者{i % 2}"}, "a.jpg")
+                    originals[original_hash] = path
+
+                removed = store.delete_images(["uuid-1", "uuid-3", "uuid-9"])
+                assert [img_uuid for img_uuid, _ in removed] == ["uuid-1", "uuid-3"]
+                assert list(store.images.keys()) == ["uuid-0", "uuid-2", "uuid-4"]
+
+                targets = {record.original_hash: record.original_path for _, record in removed}
+                assert await storage.delete_originals(targets, batch_size=1) == 2
+                assert sorted(path.name for path in (TEST_UPLOAD_DIR / "bulk_rendered").iterdir()) == sorted(
+                    compute_content_hash(str(i).encode())[:32] + "_v.jpg" for i in (0, 2, 4)
+                )
+                await storage.delete_originals(originals)
+
+    def test_client_upload(self, setup_test_environment):
+        """再送された写真を受け付け済みとして扱うための記録のテスト"""
+        path = TEST_DIR / "client_uploads.db"
+        for first, second in ((SqliteStore(path, "w1"), SqliteStore(path, "w2")), (MemoryStore(),) * 2):
+            assert second.get_client_upload("device-1:0") is None
+            first.set_client_upload("device-1:0", "uuid-1")
+            assert second.get_client_upload("device-1:0") == "uuid-1"
+
+    def test_notification_exclusive(self, setup_test_environment):
+        """Slack送信はいずれかのプロセスで送信中の場合に受け付けないことのテスト"""
+        path = TEST_DIR / "notifications.db"
+        for first, second in ((SqliteStore(path, "w1"), SqliteStore(path, "w2")), (MemoryStore(),) * 2):
+            job_id = first.start_notification(3)
+            assert job_id is not None
+            assert second.start_notification(3) is None
+            first.finish_notification(job_id, 3, 0)
+            assert second.start_notification(3) is not None
+
+# 一括取り込みテスト
+class TestImporter:
+    def test_import_folder(self, setup_test_environment):
+        """フォルダ内の画像の並列取り込みと取り込み済み画像のスキップのテスト"""
+        import io
+        from PIL import Image
+        from logics.importer import import_folder
+
+        source = TEST_DIR / "sdcard"
+        (source / "DCIM" / "100CANON").mkdir(parents=True)
+        for i, color in enumerate([(200, 0, 0), (0, 200, 0), (200, 0, 0)]):
+            buffer = io.BytesIO()
+            Image.new("RGB", (320, 240), color).save(buffer, "JPEG")
+            path = source / "DCIM" / "100CANON" / f"IMG_{i:04d}.JPG"
+            path.write_bytes(buffer.getvalue())
+            os.utime(path, (1700000000, 1700000000))
+        (source / "DCIM" / "readme.txt").write_text("not an image")
+        (source / "DCIM" / "broken.jpg").write_bytes(b"not an image")
+
+        store = SqliteStore(TEST_DIR / "import.db")
+        fields = {"user_name": "山田", "location": "A棟", "tags": ["施工前"], "comment": ""}
+        with patch("logics.renderer.ORIGINAL_FOLDER", TEST_UPLOAD_DIR / "import_originals"), \
+             patch("logics.renderer.RENDER_CACHE_FOLDER", TEST_UPLOAD_DIR / "import_rendered"):
+            stats = import_folder(source, fields, store, workers=2)
+            assert (stats["total"], stats["imported"], stats["skipped"], stats["failed"]) == (4, 2, 1, 1)
+            assert len(list((TEST_UPLOAD_DIR / "import_rendered").iterdir())) == 2
+
+            records = store.images.values()
+            assert len(records) == 2
+            assert records[0].metadata["user_name"] == "山田"
+            assert records[0].metadata["timestamp"] == time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(1700000000))
+            assert records[0].preview_url.startswith("/images/")
+
+            # 2回目は取り込み済みのためすべてスキップ
+            stats = import_folder(source, fields, store, workers=2, render=False)
+            assert (stats["imported"], stats["skipped"]) == (0, 3)
+            assert len(store.images) == 2
+
+    def test_import_heif_again(self, setup_test_environment):
+        """取り込み済みのHEICを変換前のデータのハッシュでスキップするテスト"""
+        pytest.importorskip("pillow_heif")
+        import io
+        from PIL import Image
+        from logics.image_formats import enable_heif
+        from logics.importer import import_folder
+
+        assert enable_heif()
+        source = TEST_DIR / "iphone"
+        source.mkdir()
+        buffer = io.BytesIO()
+        Image.new("RGB", (320, 240), (40, 120, 200)).save(buffer, "HEIF")
+        heic = buffer.getvalue()
+        (source / "IMG_0001.HEIC").write_bytes(heic)
+
+        store = SqliteStore(TEST_DIR / "import_heif.db")
+        fields = {"user_name": "山田", "location": "A棟", "tags": [], "comment": ""}
+        with patch("logics.renderer.ORIGINAL_FOLDER", TEST_UPLOAD_DIR / "import_heif_originals"):
+            stats = import_folder(source, fields, store, workers=1, render=False)
+            assert stats["imported"] == 1
+            record = store.images.values()[0]
+            assert record.source_hash == compute_content_hash(heic) != record.original_hash
+
+            # 2回目は変換せずにスキップ
+            with patch("logics.ingest._convert_to_jpeg", side_effect=AssertionError):
+                stats = import_folder(source, fields, store, workers=1, render=False)
+            assert (stats["imported"], stats["skipped"], stats["failed"]) == (0, 1, 0)
+            assert len(store.images) == 1
+
+# 作成済み画像の再作成テスト
+class TestBackfill:
+    def test_run_backfill(self, setup_test_environment):
+        """作成済み画像の再作成・チェックポイントからの再開・古い画像の削除のテスト"""
+        import io
+        from PIL import Image
+        from logics.backfill import run_backfill, job_signature, save_checkpoint
+        from logics.image_formats import get_enabled_formats
+        from logics.renderer import get_render_key
+
+        folders = {name: TEST_UPLOAD_DIR / f"backfill_{name}" for name in ("originals", "rendered", "web")}
+        with patch("logics.renderer.ORIGINAL_FOLDER", folders["originals"]), \
+             patch("logics.renderer.RENDER_CACHE_FOLDER", folders["rendered"]), \
+             patch("logics.renderer.PREVIEW_FOLDER", folders["web"]):
+            store = SqliteStore(TEST_DIR / "backfill.db")
+            for i in range(3):
+                buffer = io.BytesIO()
+                Image.new("RGB", (640, 480), (i * 80, 100, 100)).save(buffer, "JPEG")
+                original_hash = compute_content_hash(buffer.getvalue())
+                path = store_original(buffer.getvalue(), original_hash, ".jpg")
+                store.images[f"uuid-{i}"] = ImageRecord(path, original_hash, {"user_name": "山田"}, "a.jpg",
+                                                        preview_url="/images/old")
+            records = store.images.values()
+
+            # レイアウト変更前の画像（削除対象）
+            folders["rendered"].mkdir()
+            stale = folders["rendered"] / f"{records[0].original_hash[:32]}_000000000000.jpg"
+            stale.write_bytes(b"x")
+
+            # 前回uuid-0まで処理して中断した状態から再開
+            checkpoint = TEST_DIR / "backfill.json"
+            save_checkpoint(checkpoint, job_signature(get_enabled_formats(), False), {"uuid-0"})
+            stats = run_backfill(store, checkpoint=checkpoint)
+            assert (stats["skipped"], stats["done"], stats["failed"]) == (1, 2, 0)
+            assert stats["updated"] == 3
+            assert stats["removed"] == 1 and not stale.exists()
+
+            record = store.images["uuid-1"]
+            assert record.preview_url == f"/images/uuid-1/preview?v={get_render_key(record.original_hash, record.metadata)}"
+            per_image = 1 + len(PREVIEW_SIZES) * len(get_enabled_formats())
+            assert len(list(folders["rendered"].iterdir())) + len(list(folders["web"].iterdir())) == per_image * 2
+
+            # 完了後は最初から処理する
+            stats = run_backfill(store, checkpoint=checkpoint, overwrite=True, cpu_share=0.5)
+            assert (stats["skipped"], stats["done"]) == (0, 3)
+
+            # 圧縮率を変更するとプレビューURLが変わり、変更前の画像は削除される
+            old_url = store.images["uuid-1"].preview_url
+            original = apply_settings(get_settings().replace(compression_quality=50))
+            try:
+                stats = run_backfill(store, checkpoint=checkpoint)
+            finally:
+                apply_settings(original)
+            assert stats["updated"] == 3 and stats["removed"] == per_image * 3
+            assert store.images["uuid-1"].preview_url != old_url
+
+    def test_backfill_requires_shared_store(self, capsys):
+        """共有ストアのファイルがない場合は実行しないテスト"""
+        from logics.backfill import main as backfill_main
+
+        path = TEST_DIR / "missing_shared.db"
+        assert backfill_main(["--shared-store", str(path)]) == 1
+        assert "共有ストアがありません" in capsys.readouterr().err
+        assert not path.exists()
+
+# 設定テスト
+class TestSettings:
+    def test_load_settings(self):
+        """環境変数からの設定の読み込みのテスト"""
+        settings = load_settings(
+            {"IMAGE_WORKERS": "3", "COMPRESSION_QUALITY": "85", "TRACING_ENABLED": "false", "LOG_FORMAT": "TEXT"},
+            env_file=None
+        )
+        assert settings.image_workers == 3
+        assert settings.compression_quality == 85
+        assert settings.tracing_enabled is False
+        assert settings.log_format == "text"
+        assert settings.preview_quality("webp") == Settings.webp_quality
+        assert settings.preview_quality("jpeg") == 85
+
+    def test_invalid_settings(self):
+        """不正な設定値の検出のテスト"""
+        with pytest.raises(ValueError) as excinfo:
+            load_settings({"IMAGE_WORKERS": "0", "COMPRESSION_QUALITY": "150"}, env_file=None)
+        # 不正な項目はまとめて報告する
+        assert "IMAGE_WORKERS" in str(excinfo.value)
+        assert "COMPRESSION_QUALITY" in str(excinfo.value)
+
+        with pytest.raises(ValueError):
+            load_settings({"UPLOAD_CONCURRENCY": "many"}, env_file=None)
+        with pytest.raises(ValueError):
+            load_settings({"SLACK_ENABLED": "true", "SLACK_TOKEN": ""}, env_file=None)
+        with pytest.raises(ValueError):
+            load_settings({"ALLOWED_IMAGE_FORMATS": "JPEG,TIFF"}, env_file=None)
+
+    def test_reload_settings(self):
+        """再起動せずに反映できる項目のみ再読み込みされることのテスト"""
+        original = apply_settings(load_settings({}, env_file=None))
+        try:
+            result = reload_settings({"COMPRESSION_QUALITY": "50", "LOG_FORMAT": "text"}, env_file=None)
+            assert result["changed"] == {"compression_quality": [70, 50]}
+            assert result["restart_required"] == ["log_format"]
+            assert get_settings().compression_quality == 50
+            assert get_settings().log_format == "json"
+
+            # 不正な値の場合は現在の設定のまま
+            with pytest.raises(ValueError):
+                reload_settings({"COMPRESSION_QUALITY": "0"}, env_file=None)
+            assert get_settings().compression_quality == 50
+        finally:
+            apply_settings(original)
+
+# Slack通知テスト（ローカルのSlack APIスタブ使用）
 @pytest.mark.asyncio
 class TestNotifier:
-    @pytest.mark.asyncio
+    def _slack_settings(self, stub):
+        return get_settings().replace(
+            slack_enabled=True, slack_token="xoxb-test", slack_channel="C0TEST",
+            slack_api_base=stub.base_url, slack_send_interval=0
+        )
+
+    def _write_images(self, count):
+        paths = []
+        for i in range(count):
+            path = TEST_UPLOAD_DIR / f"slack_test_{i}.jpg"
+            path.write_bytes(b"test image data for slack %d" % i)
+            paths.append(path)
+        return paths
+
     async def test_send_slack_notification(self, setup_test_environment):
-        """Slack通知送信のテスト（モック使用）"""
+        """Slack通知送信のテスト（1枚）"""
         from logics.notifier import send_slack_notification
-        
-        # テスト用の画像ファイル
-        test_image_path = TEST_UPLOAD_DIR / "slack_test.jpg"
-        with open(test_image_path, "wb") as f:
-            f.write(b"test image data for slack")
-        
-        # テスト用のメタデータ
+        from benchmarks.slack_stub import SlackStub
+
+        test_image_path = self._write_images(1)[0]
         metadata = {
             "user_name": "テスト太郎",
             "location": "A棟1F",
@@ -236,27 +1274,62 @@ class TestNotifier:
             "timestamp": "2025-05-20 12:34:56",
             "comment": "Slackテスト"
         }
-        
-        # aiohttp.ClientSessionのpostメソッドをモック
-        class MockResponse:
-            async def json(self):
-                return {"ok": True}
-            
-            async def __aenter__(self):
-                return self
-            
-            async def __aexit__(self, *args):
-                pass
-        
-        mock_session = MagicMock()
-        mock_session.post.return_value = MockResponse()
-        
-        # 設定値をモック
-        with patch("logics.notifier.SLACK_ENABLED", True), \
-             patch("logics.notifier.SLACK_TOKEN", "mock_token"), \
-             patch("logics.notifier.SLACK_CHANNEL", "mock_channel"), \
-             patch("aiohttp.ClientSession", return_value=mock_session):
-            
-            result = await send_slack_notification(test_image_path, metadata)
-            
-            assert result is True
\ No newline at end of file
+
+        stub = SlackStub()
+        await stub.start()
+        try:
+            with patch("logics.notifier.get_settings", return_value=self._slack_settings(stub)):
+                result = await send_slack_notification(test_image_path, metadata)
+        finally:
+            await stub.stop()
+
+        assert result is True
+        assert stub.calls == ["files.getUploadURLExternal", "upload", "files.completeUploadExternal"]
+        assert len(stub.messages) == 1
+        assert stub.messages[0]["channel_id"] == "C0TEST"
+        assert "テスト太郎" in stub.messages[0]["initial_comment"]
+        assert "Slackテスト" in stub.messages[0]["files"][0]["title"]
+
+    async def test_send_slack_report(self, setup_test_environment):
+        """複数の画像をまとめて送信するテスト"""
+        from logics.notifier import send_slack_report
+        from benchmarks.slack_stub import SlackStub
+
+        paths = self._write_images(12)
+        metadata_list = [create_metadata("テスト太郎", "A棟1F", ["施工中"]) for _ in paths]
+        progress = []
+
+        stub = SlackStub()
+        await stub.start()
+        try:
+            with patch("logics.notifier.get_settings", return_value=self._slack_settings(stub)):
+                result = await send_slack_report(
+                    paths, metadata_list, progress_callback=lambda done, total: progress.append((done, total))
+                )
+        finally:
+            await stub.stop()
+
+        assert result == (12, 0)
+        # 10枚ごとに1つのメッセージにまとめる
+        assert [len(message["files"]) for message in stub.messages] == [10, 2]
+        assert stub.calls.count("files.completeUploadExternal") == 2
+        assert "(1/2)" in stub.messages[0]["initial_comment"]
+        assert all(upload["received"] == upload["length"] for upload in stub.uploads.values())
+        assert progress[-1] == (12, 12)
+
+    async def test_send_slack_report_failure(self, setup_test_environment):
+        """共有に失敗した場合は失敗数として返すテスト"""
+        from logics.notifier import send_slack_report
+        from benchmarks.slack_stub import SlackStub
+
+        paths = self._write_images(3)
+        stub = SlackStub(fail_methods=("files.completeUploadExternal",))
+        await stub.start()
+        try:
+            with patch("logics.notifier.get_settings", return_value=self._slack_settings(stub)):
+                result = await send_slack_report(paths + [TEST_UPLOAD_DIR / "missing.jpg"])
+        finally:
+            await stub.stop()
+
+        assert result == (0, 4)
+        assert stub.messages == []
@@ -52,7 +52,8 @@ def create_mobile_ui(handle_upload, update_user_info, tags, location_presets):
             selected_tags = tag_select.value or []
             comment = comment_input.value or ""
 
-            update_user_info(
+            # 保存の完了はNiceGUIがイベント処理として待つ
+            return update_user_info(
                 name=name,
                 location=location,
                 tags=selected_tags,
@@ -89,7 +90,17 @@ def create_mobile_ui(handle_upload, update_user_info, tags, location_presets):
 
                 ui.label("※カメラアイコンをタップすると撮影できます").classes("text-xs text-center mt-2")
 
-def create_desktop_ui(handle_upload, update_user_info, send_to_slack, save_as_zip, tags, location_presets):
+        # 電波の届きにくい現場向け（撮影した写真を端末に保存し、電波が戻ったら自動で送信）
+        with ui.card().classes("w-full bg-yellow-50 p-4 mt-4"):
+            ui.label("地下・鉄骨の中など電波が届きにくい場所では").classes("text-center text-sm")
+            ui.button(
+                "オフライン対応版を開く",
+                icon="cloud_off",
+                on_click=lambda: ui.navigate.to("/pwa/index.html")
+            ).classes("w-full")
+            ui.label("※圏外でも撮影でき、電波が戻ったときに自動で送信します").classes("text-xs text-center mt-2")
+
+def create_desktop_ui(handle_upload, update_user_info, send_to_slack, save_as_zip, delete_images, tags, location_presets):
     """PC向けの管理者UI構築
 
     Args:
@@ -97,6 +108,7 @@ def create_desktop_ui(handle_upload, update_user_info, send_to_slack, save_as_zi
         update_user_info: ユーザー情報更新関数
         send_to_slack: Slack送信関数
         save_as_zip: ZIP保存関数
+        delete_images: 一括削除関数
         tags: 選択可能なタグリスト
         location_presets: 場所のプリセットリスト
     """
@@ -139,7 +151,8 @@ def create_desktop_ui(handle_upload, update_user_info, send_to_slack, save_as_zi
                     selected_tags = tag_select.value or []
                     comment = comment_input.value or ""
 
-                    update_user_info(
+                    # 保存の完了はNiceGUIがイベント処理として待つ
+                    return update_user_info(
                         name=name,
                         location=location,
                         tags=selected_tags,
@@ -191,5 +204,5 @@ def create_desktop_ui(handle_upload, update_user_info, send_to_slack, save_as_zi
                         "すべて削除",
                         color="red",
                         icon="delete",
-                        on_click=lambda: ui.notify("この機能は未実装です", color="warning")
+                        on_click=delete_images
                     ).classes("m-2")
\ No newline at end of file